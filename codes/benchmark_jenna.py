@@ -0,0 +1,149 @@
+"""
+Benchmark of the thresholding and quantification stages on synthetic organoids (see "synthetic_organoids_jenna.py").
+For every image size a condition folder with synthetic organoids is written, then the following stages are timed:
+    - reading the 4 channels of an organoid,
+    - every threshold mode in memory,
+    - the whole ``thresholding()`` of the folder (read, threshold, write) for the selected modes,
+    - counting the pixels of a thresholded organoid (``values_of_interest()``) and
+    - the whole ``calculate_values_of_interest()`` of the folder.
+Each stage is repeated and the fastest and median times are saved to "benchmark_results.csv" in the benchmark folder.
+If there is a previous "benchmark_results.csv" (or the one of ``baseline_csv``), the speedup compared to it is printed,
+    so speedups and regressions can be tracked locally.
+
+Copyright (c) 2022, Maximilian Otto, Berlin.
+"""
+# ----------------------------------------------------------------------------------------------- #
+# Folder, in which the synthetic images and the results are stored. Everything in it may be overwritten.
+benchmark_folder = "S:/mdc_work/jenna/benchmark"
+
+## Synthetic images
+image_sizes = [(512, 512), (1024, 1024), (2048, 2048)]  # (height, width) in pixels
+bit_depth = 8
+sparsity = 0.1
+cell_lines = ["Control", "Apoe"]
+organoids_per_cell_line = 3
+
+## Stages
+threshold_modes = ["super_low_intensities_filtered",
+                   "low_intensities_filtered",
+                   "triangle_on_dapi_intensity_greater_1_on_rest",
+                   "otsu_on_dapi_intensity_greater_1_on_rest",
+                   "otsu_on_dapi_only",
+                   "otsu",
+                   "triangle",
+                   "adaptive",
+                   "costes"]
+folder_threshold_modes = ["otsu", "triangle"]  # Modes, whose whole ``thresholding()`` of the folder is timed as well
+repeats = 5                                    # Repeats of every stage, the fastest one is the most reliable
+
+## Compare with the results of an earlier run, e.g. one from before a change. ``None`` uses the previous results in the benchmark folder.
+baseline_csv = None
+# ----------------------------------------------------------------------------------------------- #
+
+import os
+import glob
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import thresholding_jenna
+import quant_colocalization_jenna
+import synthetic_organoids_jenna
+
+## Time a function ``repeats`` times
+# output: fastest and median time in seconds
+def time_stage(function, repeats=5):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), float(np.median(times))
+
+## Time every stage on the synthetic images of one size
+# output: list of dicts, one per stage
+def benchmark_image_size(image_size, threshold_modes, folder_threshold_modes, repeats=5, bit_depth=8, sparsity=0.1):
+    height, width = image_size
+    condition_folder_name = f"synthetic_{height}x{width}_{bit_depth}bit"
+    pic_folder_path = os.path.abspath(os.path.join(benchmark_folder, condition_folder_name))
+    files = synthetic_organoids_jenna.write_synthetic_condition(pic_folder_path, cell_lines, organoids_per_cell_line, image_size, bit_depth, sparsity, seed=0)
+    n_organoids = len(files)
+
+    results = []
+    ## Save the times of a stage
+    # ``per_organoid``: the function processes a single organoid, otherwise the whole folder
+    def record(stage, function, per_organoid=True):
+        try:
+            fastest, median = time_stage(function, repeats)
+        except Exception as e:
+            print(f"{stage} failed: {e!r}")
+            fastest, median = np.nan, np.nan
+        if not per_organoid:
+            fastest, median = fastest / n_organoids, median / n_organoids
+        results.append({
+            "Stage": stage,
+            "Image size": f"{height}x{width}",
+            "Bit depth": bit_depth,
+            "Megapixels per channel": height * width / 1e6,
+            "Fastest time per organoid (s)": fastest,
+            "Median time per organoid (s)": median,
+            "Megapixels per second": 4 * height * width / 1e6 / fastest,
+            })
+
+    file = files[0]
+    record("read 4 channels", lambda: thresholding_jenna.read_4_color_channels(file))
+
+    ch1, ch2, ch3, ch4 = thresholding_jenna.read_4_color_channels(file)
+    for mode in threshold_modes:
+        record(f"threshold {mode}", lambda: thresholding_jenna.apply_threshold(ch1, ch2, ch3, ch4, mode))
+
+    # The quantification runs on the images of the first folder mode, the mask files and the results store are left out
+    quant_colocalization_jenna.save_mask_as_files = False
+    quant_colocalization_jenna.save_results_store = False
+    for mode in folder_threshold_modes:
+        output_folder_path = pic_folder_path + "_thresholded_" + mode
+        ## Threshold the whole folder from scratch every time
+        def threshold_folder():
+            shutil.rmtree(output_folder_path, ignore_errors=True)
+            thresholding_jenna.thresholding(pic_folder_path, condition_folder_name, mode, gaussian_blur=False)
+        record(f"thresholding() {mode}", threshold_folder, per_organoid=False)
+
+    if folder_threshold_modes:
+        mode = folder_threshold_modes[0]
+        thresholded_file = glob.glob(pic_folder_path + "_thresholded_" + mode + "/*" + quant_colocalization_jenna.base_channel_name + "*thresholded*")[0]
+        th1, th2, th3, th4, mask = quant_colocalization_jenna.read_4_color_channels(thresholded_file)
+        record("read thresholded organoid and mask", lambda: quant_colocalization_jenna.read_4_color_channels(thresholded_file))
+        record("values_of_interest()", lambda: quant_colocalization_jenna.values_of_interest(th1, th2, th3, th4, mask))
+        record(f"calculate_values_of_interest() {mode}", lambda: quant_colocalization_jenna.calculate_values_of_interest(pic_folder_path, condition_folder_name, mode), per_organoid=False)
+    return results
+
+## Print the speedup of every stage compared to an earlier run (>1 is faster, <1 is a regression)
+def compare_to_baseline(benchmark_df, baseline_df):
+    keys = ["Stage", "Image size", "Bit depth"]
+    merged = benchmark_df.merge(baseline_df, on=keys, suffixes=("", " baseline"))
+    if merged.empty:
+        print("No common stages with the baseline.")
+        return merged
+    merged["Speedup"] = merged["Fastest time per organoid (s) baseline"] / merged["Fastest time per organoid (s)"]
+    print(merged[keys + ["Fastest time per organoid (s) baseline", "Fastest time per organoid (s)", "Speedup"]].to_string(index=False))
+    return merged
+
+def benchmark(image_sizes, threshold_modes, folder_threshold_modes, repeats=5, bit_depth=8, sparsity=0.1, baseline_csv=None):
+    results = []
+    for image_size in image_sizes:
+        results.extend(benchmark_image_size(image_size, threshold_modes, folder_threshold_modes, repeats, bit_depth, sparsity))
+    benchmark_df = pd.DataFrame(results)
+
+    results_csv = os.path.join(benchmark_folder, "benchmark_results.csv")
+    if baseline_csv is None and os.path.isfile(results_csv):
+        baseline_csv = results_csv
+    if baseline_csv is not None:
+        compare_to_baseline(benchmark_df, pd.read_csv(baseline_csv))
+    else:
+        print(benchmark_df.to_string(index=False))
+
+    benchmark_df.to_csv(results_csv, index=False)
+    return benchmark_df
+
+if __name__ == "__main__":
+    benchmark(image_sizes, threshold_modes, folder_threshold_modes, repeats, bit_depth, sparsity, baseline_csv)
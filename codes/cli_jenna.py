@@ -0,0 +1,244 @@
+"""
+Command line entry points of the scripts, e.g. for batch jobs on the cluster:
+    python cli_jenna.py threshold --wd /data/jenna --folders normal hypoxy --mode otsu --workers 8
+    python cli_jenna.py quantify --wd /data/jenna --treatments normal hypoxy --mode otsu --no-plots
+    python cli_jenna.py plot --wd /data/jenna --treatments normal hypoxy --mode otsu --comparison
+    python cli_jenna.py export-masks /data/jenna/normal_thresholded_otsu
+
+Every setting of the configuration blocks at the top of "thresholding_jenna.py" and "quant_colocalization_jenna.py"
+    can be given in a json file too (``--config settings.json``), e.g. ``{"wd": "/data/jenna", "threshold_mode": "otsu", "plot_workers": 4}``.
+The arguments on the command line override the config file, the config file overrides the defaults of the scripts.
+The quantification uses functions of the thresholding script, so it configures both: the settings of the raw images (channel names,
+    file format, z-stacks) are the same in both scripts, the ones of the quantification win.
+Worker processes (``--workers``, ``--randomization-workers``) get the configured settings too, also when they are spawned
+    and import the scripts again (see ``thresholding_jenna.worker_settings()``).
+Only the script, that is needed, is imported, and the plotting libraries only when something is plotted.
+
+Copyright (c) 2022, Maximilian Otto, Berlin.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+
+## Load the settings of a json config file
+# output: dict of setting name: value
+def load_config(config_file):
+    if config_file is None:
+        return {}
+    with open(config_file) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"The config file \"{config_file}\" has to contain a json object of settings")
+    return config
+
+## Overwrite the configuration of a script with the settings of the config file and the command line
+# Settings of the config file, that the script doesn't have, are ignored (they belong to the other script).
+# The arguments of the command line, that were given (not ``None``), override the config file.
+def configure(module, config, arguments):
+    for name, value in config.items():
+        if hasattr(module, name):
+            setattr(module, name, value)
+    for name, value in arguments.items():
+        if value is not None:
+            setattr(module, name, value)
+    return module
+
+## Settings of the quantification script, that are computed from other settings when it's imported, computed again
+def update_derived_settings(q):
+    q.pic_folder_path = os.path.join(q.wd, q.pic_condition_folder_path)
+    q.base_channel_name = q.ch_prefix + q.ch1_suffix
+    return q
+
+## Give the thresholding script the same settings of the raw images as the quantification script
+# The file format of the raw images is ``file_format`` in the thresholding script and ``input_file_format`` in the quantification script,
+#   a config file with only one of them sets both.
+def share_image_settings(q, t, config):
+    if "file_format" in config and "input_file_format" not in config:
+        q.input_file_format = config["file_format"]
+    t.file_format = q.input_file_format
+    for name in ["ch_prefix", "ch1_suffix", "ch2_suffix", "ch3_suffix", "ch4_suffix", "z_stack_mode"]:
+        setattr(t, name, getattr(q, name))
+
+## Check that every setting of the config file belongs to one of the scripts, to catch typos
+def check_config(config, modules):
+    unknown = [name for name in config if not any(hasattr(module, name) for module in modules)]
+    if unknown:
+        raise ValueError(f"Unknown settings in the config file: {', '.join(unknown)}")
+
+## The config file may be shared with the quantification, so the thresholding ignores the settings of the quantification.
+# (The quantification knows the settings of both scripts and checks them.)
+def threshold(args, config):
+    import thresholding_jenna
+    configure(thresholding_jenna, config, {
+        "wd": args.wd,
+        "folders_list": args.folders,
+        "threshold_mode": args.mode,
+        "gauss_blur_filter": args.gaussian_blur,
+        "n_workers": args.workers,
+        "manifest_hash_inputs": args.hash_inputs,
+        "z_stack_mode": args.z_stack_mode,
+        "prefetch_organoids": args.prefetch,
+        "instrumentation": args.instrumentation,
+        })
+    t = thresholding_jenna
+    if t.instrumentation:
+        t.instrumentation_jenna.enable()
+    failed_files = []
+    for sub_folder_name in t.folders_list:
+        failed_files += t.thresholding(os.path.join(t.wd, sub_folder_name), sub_folder_name, mode = t.threshold_mode, gaussian_blur = t.gauss_blur_filter,
+                                       n_workers = t.n_workers, hash_inputs = t.manifest_hash_inputs,
+                                       n_prefetch = t.prefetch_organoids, n_queued_writes = t.queued_writes, z_mode = t.z_stack_mode)
+    return 1 if failed_files else 0
+
+## Settings of the quantification, that both the "quantify" and the "plot" command have
+def configure_quantification(args, config):
+    import quant_colocalization_jenna
+    import thresholding_jenna
+    check_config(config, [quant_colocalization_jenna, thresholding_jenna])
+    configure(thresholding_jenna, config, {})
+    q = configure(quant_colocalization_jenna, config, {
+        "wd": args.wd,
+        "treatment_list": args.treatments,
+        "threshold_mode": args.mode,
+        "plot_workers": args.plot_workers,
+        "statistics_correction": args.correction,
+        })
+    # ``None`` means "not given" above, "--correction none" turns the correction off
+    if q.statistics_correction == "none":
+        q.statistics_correction = None
+    share_image_settings(q, thresholding_jenna, config)
+    return update_derived_settings(q)
+
+def quantify(args, config):
+    q = configure_quantification(args, config)
+    configure(q, {}, {
+        "gauss_blur_filter": args.gaussian_blur,
+        "save_mask_as_files": args.save_mask,
+        "mask_file_format": args.mask_format,
+        "fused_pipeline": args.fused,
+        "save_thresholded_images": args.save_thresholded,
+        "threshold_sweep_modes": args.sweep_modes,
+        "histogram_only": args.histogram_only,
+        "tiled_processing": args.tiled,
+        "memory_budget_mb": args.memory_budget_mb,
+        "save_overlap_table": args.overlap_table,
+        "object_colocalization": args.objects,
+        "intensity_coefficients": args.coefficients,
+        "region_mode": args.regions,
+        "n_shells": args.shells,
+        "z_stack_mode": args.z_stack_mode,
+        "object_connectivity_3d": args.connectivity_3d,
+        "randomization_test": args.randomization_test,
+        "randomization_permutations": args.permutations,
+        "randomization_seed": args.seed,
+        "randomization_workers": args.randomization_workers,
+        "make_plots": args.plots,
+        "save_summary": args.summary,
+        "bootstrap_resamples": args.resamples,
+        "prefetch_organoids": args.prefetch,
+        "instrumentation": args.instrumentation,
+        })
+    share_image_settings(q, q.thresholding_jenna, config)
+    if q.instrumentation:
+        q.instrumentation_jenna.enable()
+    complete_df = q.quantification(q.treatment_list, q.threshold_mode, gaussian_filter=q.gauss_blur_filter, save_mask=q.save_mask_as_files)
+    q.save_all_conditions(complete_df, q.threshold_mode)
+    if args.comparison:
+        comparison_plots(q, complete_df)
+    return 0
+
+def plot(args, config):
+    q = configure_quantification(args, config)
+    complete_df = q.plot_saved_quantifications(q.treatment_list, q.threshold_mode, n_workers=q.plot_workers)
+    if args.comparison:
+        comparison_plots(q, complete_df)
+    return 0
+
+## Convert the bit-packed masks of output folders to TIFF images, e.g. to open them in Fiji
+def export_masks(args, config):
+    import quant_colocalization_jenna
+    n_masks = 0
+    for folder in args.folders:
+        for mask_file in sorted(glob.glob(os.path.join(folder, "*mask_ch1_ch2_ch4*.npz"))):
+            quant_colocalization_jenna.export_mask_tiff(mask_file)
+            n_masks += 1
+    print(f"Exported {n_masks} masks")
+    return 0
+
+## Cell lines of all conditions side by side, saved in the "comparison_results" folder
+def comparison_plots(q, complete_df):
+    q.box_plt_all_comparisons(complete_df, q.threshold_mode, "Cell line", hue="Condition", pic_folder_path=os.path.join(q.wd, q.treatment_list[0]))
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description="Thresholding and colocalization quantification of organoid images.")
+    parser.add_argument("--config", help="json file with settings of the scripts")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    threshold_parser = commands.add_parser("threshold", help="Threshold the raw images of the folders (\"thresholding_jenna.py\")")
+    threshold_parser.add_argument("--wd", help="Folder with all image folders")
+    threshold_parser.add_argument("--folders", nargs="+", help="Folders/conditions to threshold")
+    threshold_parser.add_argument("--mode", help="Threshold mode, e.g. otsu, triangle, adaptive")
+    threshold_parser.add_argument("--gaussian-blur", action=argparse.BooleanOptionalAction, help="Apply a gaussian blur filter too")
+    threshold_parser.add_argument("--workers", type=int, help="Number of worker processes")
+    threshold_parser.add_argument("--hash-inputs", action=argparse.BooleanOptionalAction, help="Compare the raw images by content instead of size and modification time")
+    threshold_parser.add_argument("--z-stack-mode", choices=["volume", "planes"], help="Threshold z-stacks with one threshold per channel or plane by plane")
+    threshold_parser.add_argument("--prefetch", type=int, help="Number of organoids read ahead in the background")
+    threshold_parser.add_argument("--instrumentation", action=argparse.BooleanOptionalAction, help="Write a run report with the time of every stage")
+    threshold_parser.set_defaults(function=threshold)
+
+    ## Arguments of the "quantify" and the "plot" command
+    def add_quantification_arguments(command_parser):
+        command_parser.add_argument("--wd", help="Folder with all image folders")
+        command_parser.add_argument("--treatments", nargs="+", help="Folders/conditions to quantify")
+        command_parser.add_argument("--mode", help="Threshold mode of the thresholded images")
+        command_parser.add_argument("--plot-workers", type=int, help="Number of processes rendering the plots")
+        command_parser.add_argument("--correction", choices=["none", "bonferroni", "holm", "fdr_bh"], type=str.lower,
+                                    help="Multiple comparison correction of the tests")
+        command_parser.add_argument("--comparison", action="store_true", help="Plot the cell lines of all conditions side by side too")
+
+    quantify_parser = commands.add_parser("quantify", help="Quantify the thresholded images (\"quant_colocalization_jenna.py\")")
+    add_quantification_arguments(quantify_parser)
+    quantify_parser.add_argument("--gaussian-blur", action=argparse.BooleanOptionalAction, help="The images were blurred with a gaussian filter")
+    quantify_parser.add_argument("--save-mask", action=argparse.BooleanOptionalAction, help="Save the triple colocalization masks")
+    quantify_parser.add_argument("--mask-format", choices=["packed", "tiff"], help="Save the masks bit-packed (.npz) or as TIFF images")
+    quantify_parser.add_argument("--fused", action=argparse.BooleanOptionalAction, help="Threshold the raw images in memory and quantify them right away")
+    quantify_parser.add_argument("--save-thresholded", action=argparse.BooleanOptionalAction, help="Save the thresholded images of the fused pipeline")
+    quantify_parser.add_argument("--sweep-modes", nargs="+", help="Threshold sweep: quantify all of these modes, reading the raw images once")
+    quantify_parser.add_argument("--histogram-only", action=argparse.BooleanOptionalAction, help="Only amounts and mean intensities from the cached histograms")
+    quantify_parser.add_argument("--tiled", action=argparse.BooleanOptionalAction, help="Process very large images band by band")
+    quantify_parser.add_argument("--memory-budget-mb", type=int, help="Memory for the image data of one organoid in tiled processing")
+    quantify_parser.add_argument("--coefficients", action=argparse.BooleanOptionalAction, help="Pearson's r and Manders' M1/M2 of every channel pair")
+    quantify_parser.add_argument("--objects", action=argparse.BooleanOptionalAction, help="Count the objects of every channel and the colocalized ones")
+    quantify_parser.add_argument("--regions", choices=["shells", "roi"], help="Values of interest per shell of the organoid or per region of ROI label images")
+    quantify_parser.add_argument("--shells", type=int, help="Number of shells of the region mode \"shells\"")
+    quantify_parser.add_argument("--z-stack-mode", choices=["volume", "planes"], help="Quantify z-stacks as a whole or one row per plane")
+    quantify_parser.add_argument("--connectivity-3d", type=int, choices=[6, 18, 26], help="Neighbours of a voxel for the objects of z-stacks")
+    quantify_parser.add_argument("--randomization-test", action=argparse.BooleanOptionalAction, help="Costes' randomization test of every channel pair of the raw images")
+    quantify_parser.add_argument("--permutations", type=int, help="Shuffles per organoid and pair of the randomization test")
+    quantify_parser.add_argument("--seed", type=int, help="Seed of the randomization test's shuffles")
+    quantify_parser.add_argument("--randomization-workers", type=int, help="Number of processes running the randomization tests")
+    quantify_parser.add_argument("--overlap-table", action=argparse.BooleanOptionalAction, help="Save the overlap table of all channel combinations")
+    quantify_parser.add_argument("--summary", action=argparse.BooleanOptionalAction, help="Bootstrap confidence intervals of all conditions as \"summary_all.csv\"")
+    quantify_parser.add_argument("--resamples", type=int, help="Number of bootstrap resamples of the summary")
+    quantify_parser.add_argument("--plots", action=argparse.BooleanOptionalAction, help="Plot the boxplots of every condition (--no-plots to skip them)")
+    quantify_parser.add_argument("--prefetch", type=int, help="Number of organoids read ahead in the background")
+    quantify_parser.add_argument("--instrumentation", action=argparse.BooleanOptionalAction, help="Write a run report with the time of every stage")
+    quantify_parser.set_defaults(function=quantify)
+
+    export_parser = commands.add_parser("export-masks", help="Save the bit-packed masks of output folders as TIFF images next to them")
+    export_parser.add_argument("folders", nargs="+", help="Output folders \"<condition>_thresholded_<mode>\" with masks")
+    export_parser.set_defaults(function=export_masks)
+
+    plot_parser = commands.add_parser("plot", help="Plot the saved quantifications again, without quantifying")
+    add_quantification_arguments(plot_parser)
+    plot_parser.set_defaults(function=plot)
+    return parser
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    return args.function(args, load_config(args.config))
+
+if __name__ == "__main__":
+    sys.exit(main())
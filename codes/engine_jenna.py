@@ -0,0 +1,234 @@
+"""
+Engine for thresholding and quantifying organoids, that holds its whole configuration itself instead of the module globals
+    of "thresholding_jenna.py" and "quant_colocalization_jenna.py", and works with absolute paths only (no ``os.chdir()``).
+Several engines, e.g. one per condition or threshold mode, can run at the same time in threads or worker processes:
+
+    engines = [ColocalizationEngine("/data/jenna", threshold_mode=mode) for mode in ["otsu", "triangle"]]
+    with ThreadPoolExecutor() as executor:
+        quantification_dfs = list(executor.map(lambda engine: engine.run(["normal", "hypoxy"], from_raw=True), engines))
+
+Engines writing into the same output folder (same ``wd``, condition and threshold mode) at the same time would overwrite each other's files.
+The computation itself is done by the functions of the scripts, with the engine's settings as parameters, the results are the same.
+
+Copyright (c) 2022, Maximilian Otto, Berlin.
+"""
+import os
+import glob
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import thresholding_jenna
+import quant_colocalization_jenna
+import instrumentation_jenna
+
+class ColocalizationEngine:
+    ## input: folder with all condition folders and the settings of the scripts (see their configuration blocks)
+    # ``channel_names`` are the real names of the 4 channels (ch1, ch2, ch3 = DAPI, ch4) for the column names,
+    #   ``ch_suffixes`` the channel numbers in the file names.
+    def __init__(self, wd, threshold_mode="triangle", gaussian_filter=False, channel_names=("Ctip2", "TuJ1", "DAPI", "Scp"),
+                 ch_prefix="C", ch_suffixes=("1", "2", "3", "4"), file_format=".tif",
+                 save_thresholded=True, save_mask=False, mask_format="packed", save_overlap_table=False, save_results_store=False,
+                 object_colocalization=False, object_min_overlap=0.0, intensity_coefficients=True, prefetch_organoids=2, queued_writes=4, statistics_correction=None,
+                 save_summary=True, bootstrap_resamples=10000, bootstrap_confidence=0.95, bootstrap_seed=0, z_stack_mode="volume", object_connectivity_3d=26):
+        self.wd = os.path.abspath(wd)
+        self.threshold_mode = threshold_mode
+        self.gaussian_filter = gaussian_filter
+        self.channel_names = list(channel_names)
+        self.ch_prefix = ch_prefix
+        self.ch_suffixes = list(ch_suffixes)
+        self.file_format = file_format
+        self.save_thresholded = save_thresholded
+        self.save_mask = save_mask
+        self.mask_format = mask_format
+        self.save_overlap_table = save_overlap_table
+        self.save_results_store = save_results_store
+        self.object_colocalization = object_colocalization
+        self.object_min_overlap = object_min_overlap
+        self.intensity_coefficients = intensity_coefficients
+        self.prefetch_organoids = prefetch_organoids
+        self.queued_writes = queued_writes
+        self.statistics_correction = statistics_correction
+        self.save_summary = save_summary
+        self.bootstrap_resamples = bootstrap_resamples
+        self.bootstrap_confidence = bootstrap_confidence
+        self.bootstrap_seed = bootstrap_seed
+        self.z_stack_mode = z_stack_mode
+        self.object_connectivity_3d = object_connectivity_3d
+
+    ## Engine with the current configuration of "quant_colocalization_jenna.py", some settings can be overwritten, e.g. ``threshold_mode``
+    @classmethod
+    def from_scripts(cls, **settings):
+        q = quant_colocalization_jenna
+        config = dict(wd=q.wd, threshold_mode=q.threshold_mode, gaussian_filter=q.gauss_blur_filter,
+                      channel_names=(q.ch1_real_name, q.ch2_real_name, q.ch3_real_name, q.ch4_real_name),
+                      ch_prefix=q.ch_prefix, ch_suffixes=(q.ch1_suffix, q.ch2_suffix, q.ch3_suffix, q.ch4_suffix),
+                      file_format=q.input_file_format, save_thresholded=q.save_thresholded_images, save_mask=q.save_mask_as_files, mask_format=q.mask_file_format,
+                      save_overlap_table=q.save_overlap_table, save_results_store=q.save_results_store,
+                      object_colocalization=q.object_colocalization, object_min_overlap=q.object_min_overlap,
+                      intensity_coefficients=q.intensity_coefficients,
+                      prefetch_organoids=q.prefetch_organoids, queued_writes=q.queued_writes, statistics_correction=q.statistics_correction,
+                      save_summary=q.save_summary, bootstrap_resamples=q.bootstrap_resamples, bootstrap_confidence=q.bootstrap_confidence, bootstrap_seed=q.bootstrap_seed,
+                      z_stack_mode=q.z_stack_mode, object_connectivity_3d=q.object_connectivity_3d)
+        config.update(settings)
+        return cls(**config)
+
+    ## Absolute path of a condition's folder with the raw images
+    def condition_folder(self, condition):
+        return os.path.join(self.wd, condition)
+
+    ## Absolute path of a condition's output folder "<condition>_thresholded_<mode>"
+    def output_folder(self, condition):
+        return os.path.join(self.wd, f"{condition}_thresholded_{self.threshold_mode}")
+
+    ## ``output_folder()``, created if needed, for writing into it
+    def make_output_folder(self, condition):
+        output_folder_path = self.output_folder(condition)
+        os.makedirs(output_folder_path, exist_ok=True)
+        return output_folder_path
+
+    ## First channels of all raw organoids of a condition
+    def raw_files(self, condition):
+        return sorted(glob.glob(os.path.join(self.condition_folder(condition), self.ch_prefix + self.ch_suffixes[0] + "*" + self.file_format)))
+
+    ## First channels of all thresholded organoids of a condition
+    def thresholded_files(self, condition):
+        return sorted(glob.glob(os.path.join(self.output_folder(condition), self.ch_prefix + self.ch_suffixes[0] + "*_thresholded" + self.file_format)))
+
+    ## Name of the thresholded image of a raw one
+    def thresholded_file_name(self, file):
+        return thresholding_jenna.thresholded_file_name(file, self.threshold_mode, self.gaussian_filter, self.file_format)
+
+    ## Settings of the channels' file names for the functions of the scripts, e.g. ``thresholding_jenna.save_thresholded_channels()``
+    def file_settings(self):
+        return dict(prefix=self.ch_prefix, suffixes=self.ch_suffixes, image_format=self.file_format)
+
+    ## Settings of the quantification for ``quant_colocalization_jenna.quantify_thresholded_organoid()``
+    def quantify_settings(self):
+        return dict(channel_names=self.channel_names, objects=self.object_colocalization, min_overlap=self.object_min_overlap,
+                    coefficients=self.intensity_coefficients, mask_format=self.mask_format, overlap=self.save_overlap_table)
+
+    ## Settings of the quantification for ``quant_colocalization_jenna.quantify_stack()``, regions aren't available for z-stacks
+    def stack_settings(self):
+        return dict(self.quantify_settings(), connectivity=self.object_connectivity_3d, regions=False)
+
+    ## Read the 4 channels of a single image organoid, keeping their bit depth
+    def read_channels(self, file):
+        return thresholding_jenna.read_4_color_channels(file, self.ch_prefix, self.ch_suffixes)
+
+    ## Values of interest of a z-stack organoid, quantified plane by plane, only one plane of every channel is in memory.
+    #   A raw stack (``from_raw``) is thresholded on the way, like ``z_stack_mode``
+    #   (see ``quant_colocalization_jenna.quantify_raw_stack()`` and ``quantify_thresholded_stack()``).
+    # output: list of dicts of values of interest (one per organoid or plane) and the overlap table (``None``, if ``save_overlap_table`` is off)
+    def quantify_stack(self, file, from_raw, output_folder_path):
+        if from_raw:
+            return quant_colocalization_jenna.quantify_raw_stack(file, output_folder_path, self.threshold_mode, self.gaussian_filter, self.save_mask, self.save_thresholded,
+                                                                 self.z_stack_mode, **self.file_settings(), **self.stack_settings())
+        return quant_colocalization_jenna.quantify_thresholded_stack(file, self.threshold_mode, self.gaussian_filter, self.save_mask, self.z_stack_mode,
+                                                                     self.ch_prefix, self.ch_suffixes, **self.stack_settings())
+
+    ## Values of interest (and overlap table) of one organoid of ``quantify_files()``, from its 4 channels as read,
+    #   see ``quant_colocalization_jenna.quantify_thresholded_organoid()``. The writes are queued on the ``writer``, their futures added to ``writes``.
+    def quantify_organoid(self, file, channels, from_raw, output_folder_path, writer, writes):
+        if from_raw:
+            channels = thresholding_jenna.blur_and_threshold(*channels, self.threshold_mode, self.gaussian_filter)
+            file_name = None
+        else:
+            file_name = os.path.basename(file)
+        return quant_colocalization_jenna.quantify_thresholded_organoid(file, *channels, output_folder_path, self.threshold_mode, self.gaussian_filter, self.save_mask,
+                                                                        from_raw and self.save_thresholded, writer, writes, file_name,
+                                                                        **self.quantify_settings(), **self.file_settings())
+
+    ## Threshold the raw images of a condition and save them in its output folder (like ``thresholding_jenna.thresholding()``)
+    # output: names of all saved images
+    def threshold_condition(self, condition):
+        output_folder_path = self.make_output_folder(condition)
+        # Z-stacks are thresholded plane by plane instead of being read as a whole
+        files, stack_files = thresholding_jenna.split_z_stacks(self.raw_files(condition))
+        names = []
+        for file in stack_files:
+            with instrumentation_jenna.organoid(os.path.basename(file)):
+                names += thresholding_jenna.threshold_stack(file, output_folder_path, self.threshold_mode, self.gaussian_filter, self.z_stack_mode, **self.file_settings())
+        writes = []
+        with thresholding_jenna.QueuedWriter(self.queued_writes) as writer:
+            for file, organoid in thresholding_jenna.prefetched(files, self.read_channels, self.prefetch_organoids):
+                with instrumentation_jenna.organoid(os.path.basename(file)):
+                    th1, th2, th3, th4 = thresholding_jenna.blur_and_threshold(*organoid.result(), self.threshold_mode, self.gaussian_filter)
+                    writes.append(writer.submit(thresholding_jenna.save_thresholded_channels, file, th1, th2, th3, th4, output_folder_path,
+                                                self.threshold_mode, self.gaussian_filter, self.ch_prefix, self.ch_suffixes, self.file_format))
+        return names + [name for future in writes for name in future.result()]
+
+    ## Quantify some organoids of a condition.
+    # Z-stacks are quantified plane by plane first (see ``quantify_stack()``), then the single images.
+    # input: first channels of the organoids, raw images if ``from_raw`` (see ``quantify_condition()``), thresholded ones otherwise
+    # ``before_organoid(file)`` is called before each organoid, e.g. to renew the lease of a work unit (see "work_queue_jenna.py").
+    # With a ``failed_files`` list, the errors of single organoids are collected in it as (file, exception) and the other organoids
+    #   are quantified anyway (like ``thresholding_jenna.thresholding()``), without it the first error is raised.
+    # output: list of dicts of values of interest, dict of "File name": overlap table
+    def quantify_files(self, condition, files, from_raw=False, before_organoid=None, failed_files=None):
+        output_folder_path = self.make_output_folder(condition)
+        rows = []
+        overlap_tables = {}
+        files, stack_files = thresholding_jenna.split_z_stacks(files)
+        for file in stack_files:
+            if before_organoid is not None:
+                before_organoid(file)
+            try:
+                with instrumentation_jenna.organoid(os.path.basename(file)):
+                    stack_rows, table = self.quantify_stack(file, from_raw, output_folder_path)
+            except Exception as e:
+                if failed_files is None:
+                    raise
+                failed_files.append((file, e))
+                continue
+            for row in stack_rows:
+                quant_colocalization_jenna.record_organoid(rows, row, output_folder_path, condition, save_store=self.save_results_store)
+            if table is not None:
+                overlap_tables[stack_rows[0]["File name"]] = table
+
+        writes = []
+        with thresholding_jenna.QueuedWriter(self.queued_writes) as writer:
+            for file, organoid in thresholding_jenna.prefetched(files, self.read_channels, self.prefetch_organoids):
+                if before_organoid is not None:
+                    before_organoid(file)
+                try:
+                    with instrumentation_jenna.organoid(os.path.basename(file)):
+                        row, table = self.quantify_organoid(file, organoid.result(), from_raw, output_folder_path, writer, writes)
+                except Exception as e:
+                    if failed_files is None:
+                        raise
+                    failed_files.append((file, e))
+                    continue
+                quant_colocalization_jenna.record_organoid(rows, row, output_folder_path, condition, save_store=self.save_results_store)
+                if table is not None:
+                    overlap_tables[row["File name"]] = table
+        # Raise the errors of the writes
+        for future in writes:
+            future.result()
+        return rows, overlap_tables
+
+    ## Save the quantification of a condition as "quantification.csv" and its tests as "statistics.csv" in its output folder
+    # input: quantification dataframe of the condition and optionally its overlap tables (see ``quantify_files()``) for "overlap.csv"
+    def save_condition_results(self, condition, quantification_df, overlap_tables=None):
+        output_folder_path = self.make_output_folder(condition)
+        if overlap_tables:
+            quant_colocalization_jenna.overlap_dataframe(overlap_tables, output_folder_path, condition)
+        quantification_df.to_csv(os.path.join(output_folder_path, "quantification.csv"), index=False)
+        if len(quantification_df):
+            statistics_df = quant_colocalization_jenna.welch_tests(quantification_df, x="Cell line", correction=self.statistics_correction)
+            statistics_df.to_csv(os.path.join(output_folder_path, "statistics.csv"), index=False)
+        return quantification_df
+
+    ## Quantify all organoids of a condition, saved as "quantification.csv" (and "overlap.csv", "statistics.csv") in its output folder.
+    # ``from_raw``: threshold the raw images in memory (thresholded images are saved, if ``save_thresholded``),
+    #   otherwise the thresholded images of the output folder are read.
+    # output: quantification dataframe
+    def quantify_condition(self, condition, from_raw=False):
+        files = self.raw_files(condition) if from_raw else self.thresholded_files(condition)
+        rows, overlap_tables = self.quantify_files(condition, files, from_raw)
+        return self.save_condition_results(condition, pd.DataFrame(rows), overlap_tables)
+
+    ## Quantify several conditions, ``n_threads`` of them at the same time
+    # output: quantification dataframe of all conditions
+    def run(self, conditions, from_raw=False, n_threads=1):
+        with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+            quantification_dfs = list(executor.map(lambda condition: self.quantify_condition(condition, from_raw), conditions))
+        return pd.concat(quantification_dfs, ignore_index=True)
@@ -0,0 +1,172 @@
+"""
+Optional instrumentation of the thresholding and quantification scripts.
+Every stage (reading, thresholding, writing, mask, values of interest, plots, ...) is timed per organoid,
+    together with the bytes of the files it read and wrote and its peak memory (memory allocated by numpy and Python,
+    traced with ``tracemalloc``).
+The run report is a json file with the totals per stage, the stages of every organoid and the peak memory of the process.
+
+Nothing is recorded, unless ``enable()`` was called, the stages cost next to nothing then.
+Only the stages of the current process are recorded. With worker processes the work of the workers is part of the
+    stage, that waits for them, but not broken down further.
+Stages of background threads (prefetching reader, queued writer) are recorded too, each thread has its own nesting of stages.
+    The traced peak memory is the one of the whole process, so it includes what the other threads allocated meanwhile.
+    ``tracemalloc`` has only one peak per process: before a stage resets it, the peak so far is added to every open stage
+    of every thread, so a stage never misses a peak, that happened while it was open.
+
+Copyright (c) 2022, Maximilian Otto, Berlin.
+"""
+import os
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory of the process is left out of the report then
+    resource = None
+
+enabled = False
+records = []
+run_start = None
+# Open stages and the current organoid of each thread
+thread_state = threading.local()
+# Open stages of all threads, that trace their peak memory, and the lock for them and the peak of ``tracemalloc``
+tracing_stages = []
+tracing_lock = threading.Lock()
+
+def open_stages():
+    if not hasattr(thread_state, "open_stages"):
+        thread_state.open_stages = []
+    return thread_state.open_stages
+
+def current_organoid():
+    return getattr(thread_state, "organoid", None)
+
+## Start recording. ``trace_memory`` traces the peak memory of every stage, which makes allocations a bit slower.
+def enable(trace_memory=True):
+    global enabled
+    enabled = True
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    reset()
+
+def disable():
+    global enabled
+    enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+## Forget everything recorded so far, e.g. before the next condition
+def reset():
+    global records, run_start
+    records = []
+    thread_state.open_stages = []
+    run_start = time.time()
+
+## Add the peak memory since the last reset to every open stage of every thread (``tracing_lock`` held)
+# output: current and peak traced memory
+def update_open_peaks():
+    current, peak = tracemalloc.get_traced_memory()
+    for entry in tracing_stages:
+        entry["_peak"] = max(entry["_peak"], peak)
+    return current, peak
+
+## All stages within belong to this organoid
+@contextmanager
+def organoid(name):
+    previous, thread_state.organoid = current_organoid(), name
+    try:
+        yield
+    finally:
+        thread_state.organoid = previous
+
+## Time a stage. Stages can be nested, the time, bytes and peak memory of a stage include the ones of its inner stages.
+@contextmanager
+def stage(name):
+    if not enabled:
+        yield
+        return
+    stages = open_stages()
+    entry = {"Stage": name, "Organoid": current_organoid(), "Bytes read": 0, "Bytes written": 0}
+    trace_memory = tracemalloc.is_tracing()
+    if trace_memory:
+        with tracing_lock:
+            # The peaks so far of the open stages (outer ones and the ones of other threads) would be lost by resetting the peak
+            current, _ = update_open_peaks()
+            tracemalloc.reset_peak()
+            entry["_start_memory"] = current
+            entry["_peak"] = current
+            tracing_stages.append(entry)
+    stages.append(entry)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry["Wall time (s)"] = time.perf_counter() - start
+        stages.pop()
+        if trace_memory:
+            with tracing_lock:
+                if tracemalloc.is_tracing():
+                    update_open_peaks()
+                tracing_stages[:] = [open_entry for open_entry in tracing_stages if open_entry is not entry]
+            if tracemalloc.is_tracing():
+                entry["Peak memory (bytes)"] = entry["_peak"] - entry["_start_memory"]
+            del entry["_peak"], entry["_start_memory"]
+        if stages:
+            stages[-1]["Bytes read"] += entry["Bytes read"]
+            stages[-1]["Bytes written"] += entry["Bytes written"]
+        records.append(entry)
+
+## Count the size of files read or written within the current stage
+def file_read(*file_names):
+    if enabled and open_stages():
+        open_stages()[-1]["Bytes read"] += sum(os.path.getsize(file_name) for file_name in file_names if os.path.isfile(file_name))
+
+def file_written(*file_names):
+    if enabled and open_stages():
+        open_stages()[-1]["Bytes written"] += sum(os.path.getsize(file_name) for file_name in file_names if os.path.isfile(file_name))
+
+## Peak memory of the whole process in bytes (``None`` on Windows)
+def process_peak_memory():
+    if resource is None:
+        return None
+    # Linux reports kilobytes, macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+## Totals per stage over all organoids
+def stage_summary():
+    summary = {}
+    for entry in records:
+        total = summary.setdefault(entry["Stage"], {"Calls": 0, "Wall time (s)": 0.0, "Bytes read": 0, "Bytes written": 0, "Peak memory (bytes)": None})
+        total["Calls"] += 1
+        total["Wall time (s)"] += entry["Wall time (s)"]
+        total["Bytes read"] += entry["Bytes read"]
+        total["Bytes written"] += entry["Bytes written"]
+        if "Peak memory (bytes)" in entry:
+            total["Peak memory (bytes)"] = max(total["Peak memory (bytes)"] or 0, entry["Peak memory (bytes)"])
+    return summary
+
+## Write the run report as json file, e.g. next to "quantification.csv".
+# The file is written under a temporary name and renamed, like the manifest of the thresholding.
+def write_report(output_folder_path, file_name="run_report.json", **run_info):
+    organoids = {}
+    for entry in records:
+        if entry["Organoid"] is not None:
+            organoids.setdefault(entry["Organoid"], []).append({key: value for key, value in entry.items() if key != "Organoid"})
+    report = {
+        "Run": dict(run_info, **{
+            "Started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run_start)) if run_start else None,
+            "Wall time (s)": time.time() - run_start if run_start else None,
+            "Process peak memory (bytes)": process_peak_memory(),
+            }),
+        "Stages": stage_summary(),
+        "Organoids": organoids,
+        }
+    report_path = os.path.join(output_folder_path, file_name)
+    with open(report_path + ".tmp", "w") as f:
+        json.dump(report, f, indent=1, default=str)
+    os.replace(report_path + ".tmp", report_path)
+    return report_path
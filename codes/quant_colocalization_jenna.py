@@ -45,8 +45,107 @@ threshold_mode = "triangle"
 #  - "otsu",
 #  - "triangle",
 #  - "adaptive"
+#  - "costes"
 gauss_blur_filter = False  # Set to True or False, wheter you applied a gaussian filter or not 
-save_mask_as_files = True    # Want the area of CHCHD2 and TOM20 (colocalization) saved as an image? 
+save_mask_as_files = True    # Want the area of CHCHD2 and TOM20 (colocalization) saved as an image?
+## How the masks are saved:
+#  - "packed": binary mask with 1 bit per pixel in a compressed ".npz" file, read it with ``load_mask()``,
+#              convert it with ``export_mask_tiff()`` (or "python cli_jenna.py export-masks") when an image is needed
+#  - "tiff":   image of the intensities of the 3 markers ANDed together, as large as a channel
+mask_file_format = "packed"
+
+## Streaming pipeline: read the raw images once, threshold them in memory and quantify them right away.
+# The "thresholding_jenna.py" script doesn't need to be executed before, the raw images are taken from the condition folders.
+fused_pipeline = False
+save_thresholded_images = False  # Only for the streaming pipeline. Want the thresholded images saved as files too?
+
+## Only thresholds, amounts and mean intensities, taken from the cached histograms of the raw images ("<folder>_histograms").
+# Once the histograms are cached, re-tuning the threshold mode doesn't need to read the images again. No coverages in this mode.
+histogram_only = False
+
+## Threshold sweep: apply all of these modes and gaussian blur settings to the raw images, every organoid is read only once.
+# Each mode gets its "<folder>_thresholded_<mode>" folder with the thresholded images and "quantification.csv", like the two-step way.
+# Leave the list empty to quantify only the selected ``threshold_mode``.
+threshold_sweep_modes = []  # e.g. ["triangle", "otsu", "otsu_on_dapi_only", "adaptive"]
+threshold_sweep_gaussian_filters = [False]  # e.g. [False, True]
+
+## Tiled processing for very large images: the raw images are read band by band (memory-mapped, if possible) and
+#   the thresholds and values of interest are accumulated over the bands. Needs the ``tifffile`` package.
+tiled_processing = False
+memory_budget_mb = 512  # Memory for the image data of one organoid in MB
+
+## Write the values of interest of every organoid right away into a columnar results store ("quantification.parquet" folder),
+#   a crash in the middle of a folder keeps every organoid done so far. Needs the ``pyarrow`` package,
+#   without it there's a warning and only "quantification.csv" is saved.
+save_results_store = True
+
+## Boxplots of every value of interest per condition
+make_plots = True  # Set to False to skip plotting entirely (e.g. for batch jobs on the cluster)
+plot_workers = 1   # Number of processes rendering the plots in parallel, without showing them (non-interactive backend)
+
+## Welch's t-tests of all values of interest between all cell lines of a condition (and between all conditions for the comparison plots),
+#   computed at once, saved as "statistics.csv" and reused by the plots.
+# Multiple comparison correction within each value of interest: None, "bonferroni", "holm" or "fdr_bh" (Benjamini-Hochberg)
+# None keeps the uncorrected p-values of the plots' stars, like before the tests were precomputed.
+statistics_correction = None
+
+## Bootstrap confidence intervals of the mean of every value of interest per cell line and condition, and of the differences of
+#   the means between the conditions of every cell line, saved as "summary_all.csv" next to "quantification_all.csv"
+save_summary = True
+bootstrap_resamples = 10000
+bootstrap_confidence = 0.95  # Confidence level of the intervals
+bootstrap_seed = 0           # Seed of the resampling, the same seed gives the same intervals. None draws a new one every run.
+
+## Read the next organoids in background threads, while the current one is quantified (0 reads every organoid when it's needed),
+#   and write the images of up to ``queued_writes`` organoids in the background (0 writes them right away).
+prefetch_organoids = 2
+queued_writes = 4
+
+## Record the time, bytes read/written and peak memory of every stage (reading, mask, values of interest, plots, ...) per organoid.
+# The run report of a condition is saved as "run_report.json" next to its "quantification.csv".
+instrumentation = False
+
+## Overlap table of every combination of the channels (all intersections and coverages), saved as "overlap.csv"
+save_overlap_table = False
+
+## Intensity-based colocalization of every pair of channels: Pearson's r and Manders' M1/M2 of the thresholded images
+#   (M1 of "ch1 and ch2" is the share of the ch1 intensity, that lies where ch2 is present, M2 the other way round)
+intensity_coefficients = True
+
+## Costes' randomization test of every pair of channels of the raw images: the blocks of one channel are shuffled many times and
+#   Pearson's r of every shuffle is compared to the one of the real images. The p-value per organoid and pair is saved as "randomization.csv".
+randomization_test = False
+randomization_permutations = 200  # Shuffles per organoid and pair
+randomization_block_size = 8      # Edge length of the shuffled blocks in pixels, about the size of the point spread function
+randomization_seed = 0            # Seed of the random shuffles, the same seed gives the same p-values. None draws a new one every run.
+randomization_workers = 1         # Number of organoids tested in parallel (one worker process per organoid)
+
+## Object-level colocalization: the connected pixels of a thresholded channel are one object (e.g. a cell or a neurite).
+# Adds the number of objects of every channel and the percentage of objects of a marker (ch1, ch2, ch4), that overlap objects of another marker.
+# Not available in tiled processing (objects would be cut at the bands) and in the histogram-only mode.
+object_colocalization = False
+object_min_overlap = 0.0  # An object counts as colocalized, if more than this fraction of its pixels overlaps the other marker's objects
+
+## Z-stacks (multi-page TIFF files, one page per plane) are quantified plane by plane, only one plane of every channel is in memory.
+# Needs the ``tifffile`` package. Single images and z-stacks can be in the same folder.
+#  - "volume": one row per organoid with the values of interest of the whole stack, the objects are connected in 3D.
+#              The streaming pipeline and tiled processing threshold the whole stack with one threshold per channel.
+#  - "planes": one row per plane (its number starting at 0 is in the "Plane" column), every plane is thresholded and quantified on its own
+# The overlap table is the one of the whole stack. Regions aren't available for z-stacks.
+z_stack_mode = "volume"
+object_connectivity_3d = 26  # Neighbours of a voxel: 6 (faces), 18 (faces and edges) or 26 (faces, edges and corners)
+
+## Region quantification: all values of interest per region of the organoid, saved as "regions.csv" next to "quantification.csv"
+#  - None:     whole images only
+#  - "shells": the organoid (mask of the DAPI channel, closed and filled) is split into ``n_shells`` shells of equal depth,
+#              by the distance to its surface. Region 1 is the outermost shell.
+#  - "roi":    label images of your own regions, named like the raw "C1"-image with ``roi_name`` instead of "C1"
+#              (e.g. "ROI-Control_1.tif" next to "C1-Control_1.tif"). Every intensity > 0 is a region, 0 is no region.
+# Not available in tiled processing and in the histogram-only mode.
+region_mode = None
+n_shells = 4
+organoid_mask_closing = 15  # Diameter in pixels of the closing, that joins the nuclei of the DAPI channel to the organoid
+roi_name = "ROI"
 
 ## Names of the markers as in the file names.
 # e.g. "C3" mis the notation for DAPI. 'C' stands apperantly for "channel" and '3' is its number, set by the microscope.
@@ -86,176 +185,1536 @@ ch4_real_name = "Scp"
 # ----------------------------------------------------------------------------------------------- #
 
 import pandas as pd
+import numpy as np
 import glob
 import os
 import glob
+import warnings
 import cv2
-import seaborn as sns
-import matplotlib.pyplot as plt
-from statannot import add_stat_annotation
+# seaborn and matplotlib are only imported, when something is plotted, scipy only for the statistics,
+#   so quantification-only runs (e.g. batch jobs on the cluster) start quickly
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+import thresholding_jenna
+import instrumentation_jenna
 
 pic_folder_path = os.path.join(wd, pic_condition_folder_path)
-os.chdir(pic_folder_path)
 
 base_channel_name = ch_prefix + ch1_suffix
 
 
-def read_4_color_channels(file_name):
-    ch1 = cv2.imread(file_name, -1)
-    ch2 = cv2.imread(file_name.replace(base_channel_name, ch_prefix + ch2_suffix), -1)
-    ch3 = cv2.imread(file_name.replace(base_channel_name, ch_prefix + ch3_suffix), -1)
-    ch4 = cv2.imread(file_name.replace(base_channel_name, ch_prefix + ch4_suffix), -1)
-    # Calculate the triple_coloc_mask, where all 3 markers are present
+## The first channels of all organoids matching a glob pattern.
+# No match at all is an error (e.g. a wrong folder, ``ch_prefix`` or file format), instead of an empty quantification.
+def organoid_files(pattern):
+    files = glob.glob(pattern)
+    if not files:
+        raise FileNotFoundError(f"No images found matching \"{pattern}\"")
+    return files
+
+## Calculate the triple_coloc_mask, where all 3 markers are present
+def triple_colocalization_mask(ch1, ch2, ch4):
     mask_ch1_ch2_ch4 = cv2.bitwise_and(ch1, ch2)
     mask_ch1_ch2_ch4 = cv2.bitwise_and(mask_ch1_ch2_ch4, ch4)
-    # Save the mask as a file
-    if save_mask_as_files & (not os.path.isfile(file_name.replace("thresholded", "mask"))):
-        cv2.imwrite(os.path.basename(file_name.replace("thresholded", "mask_ch1_ch2_ch4")), mask_ch1_ch2_ch4)
+    return mask_ch1_ch2_ch4
+
+
+## Name of the mask file of a thresholded image, e.g. "C1-Control_1_otsu_thresholded.tif" -> "C1-Control_1_otsu_mask_ch1_ch2_ch4.npz"
+# Only the file name is changed, not the folders.
+def mask_file_name(file_name, mask_format=None):
+    mask_format = mask_file_format if mask_format is None else mask_format
+    folder, name = os.path.split(file_name)
+    name = name.replace("thresholded", "mask_ch1_ch2_ch4")
+    if mask_format == "packed":
+        name = os.path.splitext(name)[0] + ".npz"
+    return os.path.join(folder, name)
+
+
+## Pack a mask (pixels > 0) into 1 bit per pixel, row by row, so bands of rows can be packed separately
+def pack_mask(mask):
+    return np.packbits(mask > 0, axis=-1)
+
+
+## Save a bit-packed mask (see ``pack_mask()``) with the shape of the image as compressed ".npz" file.
+# The compression shrinks the long runs of empty pixels further.
+def save_packed_mask(mask_file_name, packed_mask, shape):
+    with open(mask_file_name, "wb") as f:
+        np.savez_compressed(f, bits=packed_mask, shape=np.array(shape))
+
+
+## Save the "triple-colocalization"-mask of an organoid, bit-packed or as an image, depending on the file extension (see ``mask_file_name()``)
+def save_mask_image(mask_file_name, mask_ch1_ch2_ch4):
+    with instrumentation_jenna.stage("write mask"):
+        if mask_file_name.endswith(".npz"):
+            save_packed_mask(mask_file_name, pack_mask(mask_ch1_ch2_ch4), mask_ch1_ch2_ch4.shape)
+        else:
+            cv2.imwrite(mask_file_name, mask_ch1_ch2_ch4)
+        instrumentation_jenna.file_written(mask_file_name)
+
+
+## Load a saved mask as binary mask (bool array), from a bit-packed ".npz" file or an image
+def load_mask(mask_file_name):
+    if not mask_file_name.endswith(".npz"):
+        return cv2.imread(mask_file_name, -1) > 0
+    with np.load(mask_file_name) as packed:
+        # (height, width), or (planes, height, width) for the mask of a z-stack
+        width = packed["shape"][-1]
+        return np.unpackbits(packed["bits"], axis=-1, count=width).view(bool)
+
+
+## Save a mask as standard TIFF image (0 and 255) for other programs, next to it by default. The mask of a z-stack becomes a multi-page TIFF file.
+# output: name of the TIFF file
+def export_mask_tiff(mask_file_name, tiff_file_name=None):
+    if tiff_file_name is None:
+        tiff_file_name = os.path.splitext(mask_file_name)[0] + ".tif"
+    mask = load_mask(mask_file_name).view(np.uint8) * np.uint8(255)
+    if mask.ndim == 3:
+        cv2.imwritemulti(tiff_file_name, list(mask))
+    else:
+        cv2.imwrite(tiff_file_name, mask)
+    return tiff_file_name
+
+
+def read_4_color_channels(file_name):
+    with instrumentation_jenna.stage("read thresholded images"):
+        ch1 = cv2.imread(file_name, -1)
+        ch2 = cv2.imread(file_name.replace(base_channel_name, ch_prefix + ch2_suffix), -1)
+        ch3 = cv2.imread(file_name.replace(base_channel_name, ch_prefix + ch3_suffix), -1)
+        ch4 = cv2.imread(file_name.replace(base_channel_name, ch_prefix + ch4_suffix), -1)
+        instrumentation_jenna.file_read(*[file_name.replace(base_channel_name, ch_prefix + suffix) for suffix in (ch1_suffix, ch2_suffix, ch3_suffix, ch4_suffix)])
+    for suffix, ch in zip((ch1_suffix, ch2_suffix, ch3_suffix, ch4_suffix), (ch1, ch2, ch3, ch4)):
+        if ch is None:
+            raise FileNotFoundError(f"Could not read {file_name.replace(base_channel_name, ch_prefix + suffix)}")
+    with instrumentation_jenna.stage("triple colocalization mask"):
+        mask_ch1_ch2_ch4 = triple_colocalization_mask(ch1, ch2, ch4)
+    # Save the mask as a file, if it isn't there yet
+    if save_mask_as_files and not os.path.isfile(mask_file_name(file_name)):
+        save_mask_image(mask_file_name(file_name), mask_ch1_ch2_ch4)
     # Transform the amsk to a binary mask
     mask_ch1_ch2_ch4 = mask_ch1_ch2_ch4 > 0
     return ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4
 
 
-def calculate_values_of_interest(pic_folder_path, treatment_var="normal", threshold_mode="triangle_on_dapi_intensity_greater_1_on_rest", gaussian_filter=False, save_mask=False):
-    # Lists, in which all values of interest of all files within a folder will be stored to
-    file_names = []
-
-    ch1_counts_total_normalized = []
-    ch2_counts_total_normalized = []
-    ch3_counts_total_normalized = []
-    ch4_counts_total_normalized = []
-    
-    mean_intensities_ch1 = []
-    mean_intensities_ch2 = []
-    mean_intensities_ch3 = []
-    mean_intensities_ch4 = []
-
-    percentages_of_ch1_in_mask = []
-    percentages_of_ch2_in_mask = []
-    percentages_of_ch3_in_mask = []
-    percentages_of_ch4_in_mask = []
-
-    percentages_of_ch1_in_ch4 = []
-    percentages_of_ch4_in_ch1 = []
-    percentages_of_ch2_in_ch4 = []
-    percentages_of_ch4_in_ch2 = []
-    percentages_of_ch1_in_ch2 = []
-    percentages_of_ch2_in_ch1 = []
-
-    gaussian_filters = []
-    threshold_types = []
-
-    os.chdir(pic_folder_path + "_thresholded_" + threshold_mode)
-
-    for file in tqdm(glob.glob(pic_folder_path + "_thresholded_" + threshold_mode + "/*" + base_channel_name + "*thresholded*"), desc="Counting pixels"):
-        # Read the marker images of each organoid and the "triple-colocalization"-mask
-        ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4 = read_4_color_channels(file)
-
-        # How many pixles of a color channel have intensity > 0?
-        ch1_count_total = ch1[ch1 > 0].size 
-        ch2_count_total = ch2[ch2 > 0].size
-        ch3_count_total = ch3[ch3 > 0].size
-        ch4_count_total = ch4[ch4 > 0].size
-
-        # Normalize the amounts of each marker by the total amount of DAPI-pixels
-        # Normalizing ch3 with ch3 will always give us '1', so we don't do that. 
-        ch1_count_total_normalized = ch1_count_total / ch3_count_total
-        ch2_count_total_normalized = ch2_count_total / ch3_count_total
-        ch3_count_total_normalized = ch3_count_total
-        ch4_count_total_normalized = ch4_count_total / ch3_count_total
-
-        # Get mean intensity of each marker
-        ch1_mean_greater_than_zero = ch1[ch1 > 0].mean()
-        ch2_mean_greater_than_zero = ch2[ch2 > 0].mean()
-        ch3_mean_greater_than_zero = ch3[ch3 > 0].mean()
-        ch4_mean_greater_than_zero = ch4[ch4 > 0].mean()
-
-        # Get the amount of all values > 0 that are colocalized with (ch1 AND ch2 AND ch4)
-        ch1_count_in_mask = ch1[mask_ch1_ch2_ch4].size
-        ch2_count_in_mask = ch2[mask_ch1_ch2_ch4].size
-        ch3_count_in_mask = ch3[(ch3 > 0) & mask_ch1_ch2_ch4].size
-        ch4_count_in_mask = ch4[mask_ch1_ch2_ch4].size
-
-        # Calculate the percentage of ch1, ch2, ch3 and ch4 that are within in the mask
-        percentage_of_ch1_in_mask = ch1_count_in_mask / ch1_count_total * 100
-        percentage_of_ch2_in_mask = ch2_count_in_mask / ch2_count_total * 100
-        percentage_of_ch3_in_mask = ch3_count_in_mask / ch3_count_total * 100
-        percentage_of_ch4_in_mask = ch4_count_in_mask / ch4_count_total * 100
-
-        # Colocalizing one channel within another
-        percentage_of_ch1_in_ch4 = ch1[(ch1 > 0) & (ch4 > 0)].size / ch1_count_total * 100
-        percentage_of_ch4_in_ch1 = ch4[(ch4 > 0) & (ch1 > 0)].size / ch4_count_total * 100
-
-        percentage_of_ch2_in_ch4 = ch2[(ch2 > 0) & (ch4 > 0)].size / ch2_count_total * 100
-        percentage_of_ch4_in_ch2 = ch4[(ch4 > 0) & (ch2 > 0)].size / ch4_count_total * 100
-
-        percentage_of_ch1_in_ch2 = ch1[(ch1 > 0) & (ch2 > 0)].size / ch1_count_total * 100
-        percentage_of_ch2_in_ch1 = ch2[(ch2 > 0) & (ch1 > 0)].size / ch2_count_total * 100
-
-        # Append the values to the lists
-        file_names.append(os.path.basename(file))
-
-        ch1_counts_total_normalized.append(ch1_count_total_normalized)
-        ch2_counts_total_normalized.append(ch2_count_total_normalized)
-        ch3_counts_total_normalized.append(ch3_count_total_normalized)
-        ch4_counts_total_normalized.append(ch4_count_total_normalized)
-
-        mean_intensities_ch1.append(ch1_mean_greater_than_zero)
-        mean_intensities_ch2.append(ch2_mean_greater_than_zero)
-        mean_intensities_ch3.append(ch3_mean_greater_than_zero)
-        mean_intensities_ch4.append(ch4_mean_greater_than_zero)
-
-        percentages_of_ch1_in_mask.append(percentage_of_ch1_in_mask)
-        percentages_of_ch2_in_mask.append(percentage_of_ch2_in_mask)
-        percentages_of_ch3_in_mask.append(percentage_of_ch3_in_mask)
-        percentages_of_ch4_in_mask.append(percentage_of_ch4_in_mask)
-
-        percentages_of_ch1_in_ch4.append(percentage_of_ch1_in_ch4)
-        percentages_of_ch4_in_ch1.append(percentage_of_ch4_in_ch1)
-        percentages_of_ch2_in_ch4.append(percentage_of_ch2_in_ch4)
-        percentages_of_ch4_in_ch2.append(percentage_of_ch4_in_ch2)
-        percentages_of_ch1_in_ch2.append(percentage_of_ch1_in_ch2)
-        percentages_of_ch2_in_ch1.append(percentage_of_ch2_in_ch1)
-
-        gaussian_filters.append(gaussian_filter)
-        threshold_types.append(threshold_mode)
-
-    # Create a dataframe with all variables at once to save it to a csv file.
-    quantification_df = pd.DataFrame({
-                        "File name": file_names,
-                        ch1_real_name + " amount normalized by " + ch3_real_name: ch1_counts_total_normalized,
-                        ch2_real_name + " amount normalized by " + ch3_real_name: ch2_counts_total_normalized,
-                        ch3_real_name + " amount (total)": ch3_counts_total_normalized,
-                        ch4_real_name + " amount normalized by " + ch3_real_name: ch4_counts_total_normalized,
-                        ch1_real_name + " mean intensity (0 - 255)": mean_intensities_ch1,
-                        ch2_real_name + " mean intensity (0 - 255)": mean_intensities_ch2,
-                        ch3_real_name + " mean intensity (0 - 255)": mean_intensities_ch3,
-                        ch4_real_name + " mean intensity (0 - 255)": mean_intensities_ch4,
-                        ch1_real_name + " colocalized with " + ch1_real_name + ", " + ch2_real_name + ", " + ch4_real_name + " (Coverage in %)": percentages_of_ch1_in_mask,
-                        ch2_real_name + " colocalized with " + ch1_real_name + ", " + ch2_real_name + ", " + ch4_real_name + " (Coverage in %)": percentages_of_ch2_in_mask,
-                        ch3_real_name + " colocalized with " + ch1_real_name + ", " + ch2_real_name + ", " + ch4_real_name + " (Coverage in %)": percentages_of_ch3_in_mask,
-                        ch4_real_name + " colocalized with " + ch1_real_name + ", " + ch2_real_name + ", " + ch4_real_name + " (Coverage in %)": percentages_of_ch4_in_mask,
-                        ch1_real_name + " colocalized with " + ch4_real_name + " (Coverage in %)": percentages_of_ch1_in_ch4,
-                        ch4_real_name + " colocalized with " + ch1_real_name + " (Coverage in %)": percentages_of_ch4_in_ch1,
-                        ch2_real_name + " colocalized with " + ch4_real_name + " (Coverage in %)": percentages_of_ch2_in_ch4,
-                        ch4_real_name + " colocalized with " + ch2_real_name + " (Coverage in %)": percentages_of_ch4_in_ch2,
-                        ch1_real_name + " colocalized with " + ch2_real_name + " (Coverage in %)": percentages_of_ch1_in_ch2,
-                        ch2_real_name + " colocalized with " + ch1_real_name + " (Coverage in %)": percentages_of_ch2_in_ch1,
-                        "Gaussian filter": gaussian_filters,
-                        "Threshold type": threshold_types,
-                        "Condition": treatment_var
-                        })
+## Sum of all intensities of a channel, without converting the image.
+# Integer images are summed up exactly, pixels with intensity 0 don't contribute anyway.
+def intensity_sum(ch):
+    if ch.dtype.kind in "iub":
+        return int(ch.sum(dtype=np.int64))
+    return float(ch.sum(dtype=np.float64))
+
+
+## Running sums of the intensities of the 4 channels for Pearson's r and Manders' coefficients of every channel pair.
+# The images are added band by band in one pass. The products of a band are two small matrix products in float32
+#   (they are limited by memory bandwidth, float32 halves it), the sums of all bands are accumulated in float64.
+#   The co-moments of every band are centered on the band's means and merged with the ones so far (Chan et al.),
+#   so there is no cancellation, and r and M1/M2 are accurate to ~1e-7 for 8 and 16-bit images.
+# Sums of two parts of an image (e.g. the bands of tiled processing) are merged with ``+``.
+class IntensitySums:
+    band_pixels = 1 << 18  # Pixels per band, small bands keep the float32 sums of a band accurate
+
+    def __init__(self, n_channels=4):
+        self.n = 0
+        self.mean = np.zeros(n_channels)
+        # comoment[a, b]: sum of (a - mean a) * (b - mean b), the diagonal are the sums of squares
+        self.comoment = np.zeros((n_channels, n_channels))
+        self.sum = np.zeros(n_channels)
+        # sum_where_present[a, b]: sum of the intensities of a at the pixels, where b is present (> 0)
+        self.sum_where_present = np.zeros((n_channels, n_channels))
+
+    ## Sums of whole images, added band by band
+    @classmethod
+    def from_channels(cls, channels):
+        sums = cls(len(channels))
+        rows_per_band = max(1, cls.band_pixels // max(1, channels[0].shape[-1]))
+        for y0 in range(0, channels[0].shape[0], rows_per_band):
+            sums.add([ch[y0:y0 + rows_per_band] for ch in channels])
+        return sums
+
+    ## Add a band of every channel
+    def add(self, channels):
+        band_n = channels[0].size
+        if band_n == 0:
+            return self
+        intensities = np.empty((len(channels), band_n), dtype=np.float32)
+        for i, ch in enumerate(channels):
+            intensities[i] = ch.ravel()
+        present = np.greater(intensities, 0, out=np.empty_like(intensities))
+        band_sum_where_present = intensities @ present.T
+        band_sum = intensities.sum(axis=1, dtype=np.float64)
+        band_mean = band_sum / band_n
+        intensities -= band_mean[:, None].astype(np.float32)
+        self.merge(band_n, band_mean, intensities @ intensities.T, band_sum, band_sum_where_present)
+        return self
+
+    def merge(self, band_n, band_mean, band_comoment, band_sum, band_sum_where_present):
+        n = self.n + band_n
+        delta = band_mean - self.mean
+        self.comoment += band_comoment + np.outer(delta, delta) * (self.n * band_n / n)
+        self.mean += delta * (band_n / n)
+        self.n = n
+        self.sum += band_sum
+        self.sum_where_present += band_sum_where_present
+
+    def __add__(self, other):
+        merged = IntensitySums(len(self.mean))
+        for sums in (self, other):
+            if sums.n:
+                merged.merge(sums.n, sums.mean, sums.comoment, sums.sum, sums.sum_where_present)
+        return merged
+
+    ## Pearson's r of every pair of channels (NaN, if a channel is constant)
+    def pearson(self):
+        variance = np.diag(self.comoment)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.comoment / np.sqrt(np.outer(variance, variance))
+
+    ## Manders' coefficients: [a, b] is the share of the intensity of a, that lies where b is present
+    def manders(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.sum_where_present / self.sum[:, None]
+
+
+## Pearson's r and Manders' M1/M2 of every pair of channels from their running sums
+# output: dict with the column names of the quantification dataframe as keys
+def intensity_coefficients_from_sums(sums, channel_names):
+    pearson = sums.pearson()
+    manders = sums.manders()
+    values = {}
+    for a, b in combinations(range(len(channel_names)), 2):
+        name_a, name_b = channel_names[a], channel_names[b]
+        values[name_a + " and " + name_b + " Pearson's r"] = pearson[a, b]
+        values[name_a + " and " + name_b + " Manders' M1 (" + name_a + " in " + name_b + ")"] = manders[a, b]
+        values[name_a + " and " + name_b + " Manders' M2 (" + name_b + " in " + name_a + ")"] = manders[b, a]
+    return values
+
+
+## Costes' randomization test of every pair of channels of an organoid (Costes et al. 2004).
+# The images are cut into blocks of ``block_size`` x ``block_size`` pixels, the blocks of one channel are shuffled and Pearson's r
+#   of the shuffled channel and the other one is compared to r of the real images. Neighbouring pixels aren't independent,
+#   shuffling whole blocks keeps their correlation within the shuffled channel.
+# The shuffles are done in batches: the permutations of the block indices of ``batch_size`` shuffles are drawn at once, every
+#   shuffled channel is one row of a matrix and its products with the other channels are one matrix product. The intensities are centered,
+#   so r is just that product divided by the norms of the channels, which don't change by shuffling.
+#   r of the real images is the same product without shuffling, so both are rounded the same way (float32).
+#   Every channel is shuffled for its pairs with the channels after it, so 3 shuffled channels cover all 6 pairs.
+# p-value: ``(1 + number of shuffles with r >= real r) / (1 + n_permutations)``
+# input: list of greyscale images, their (real) names and a ``numpy.random.Generator``
+# output: dict with the column names of "randomization.csv" as keys
+def costes_randomization_test(channels, channel_names, rng, n_permutations=200, block_size=8, batch_size=32, chunk_pixels=1 << 17):
+    height = channels[0].shape[0] // block_size * block_size
+    width = channels[0].shape[1] // block_size * block_size
+    # Row k of every channel's matrix are the centered intensities of its k-th block
+    blocks = []
+    for ch in channels:
+        channel_blocks = ch[:height, :width].reshape(height // block_size, block_size, width // block_size, block_size).swapaxes(1, 2)
+        channel_blocks = channel_blocks.reshape(-1, block_size * block_size).astype(np.float32)
+        channel_blocks -= np.float32(channel_blocks.mean(dtype=np.float64))
+        blocks.append(channel_blocks)
+    n_blocks = len(blocks[0])
+    norms = np.array([np.sqrt(np.square(channel_blocks, dtype=np.float64).sum()) for channel_blocks in blocks])
+    block_pixels = block_size * block_size
+    chunk_blocks = max(1, chunk_pixels // block_pixels)
+
+    values = {}
+    for i in range(len(channels) - 1):
+        others = np.stack([blocks[j].ravel() for j in range(i + 1, len(channels))])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            real_r = (blocks[i].ravel() @ others.T) / (norms[i] * norms[i + 1:])
+            n_greater_equal = np.zeros(len(others), dtype=np.int64)
+            for start in range(0, n_permutations, batch_size):
+                permutations = rng.permuted(np.tile(np.arange(n_blocks), (min(batch_size, n_permutations - start), 1)), axis=1)
+                # The shuffled blocks are gathered and multiplied chunk by chunk, so they stay in the cache
+                products = np.zeros((len(permutations), len(others)))
+                for first_block in range(0, n_blocks, chunk_blocks):
+                    shuffled = np.take(blocks[i], permutations[:, first_block:first_block + chunk_blocks], axis=0).reshape(len(permutations), -1)
+                    products += shuffled @ others[:, first_block * block_pixels:(first_block + chunk_blocks) * block_pixels].T
+                shuffled_r = products / (norms[i] * norms[i + 1:])
+                n_greater_equal += (shuffled_r >= real_r).sum(axis=0)
+        for j, r, count in zip(range(i + 1, len(channels)), real_r, n_greater_equal):
+            values[channel_names[i] + " and " + channel_names[j] + " Pearson's r (raw)"] = r
+            values[channel_names[i] + " and " + channel_names[j] + " Costes' p-value"] = (1 + count) / (1 + n_permutations) if np.isfinite(r) else np.nan
+    return values
+
+
+## Costes' randomization test of a raw organoid, one task of ``randomization_tests()``
+# input: "file name" string of the raw "C1"-image and the ``numpy.random.SeedSequence`` of the organoid
+def randomization_test_organoid(file, seed_sequence, channel_names, gaussian_filter=False, n_permutations=200, block_size=8):
+    channels = thresholding_jenna.read_4_color_channels(file)
+    if gaussian_filter:
+        channels = thresholding_jenna.gaussian_blur_channels(*channels)
+    row = {"File name": os.path.basename(file)}
+    row.update(costes_randomization_test(channels, channel_names, np.random.default_rng(seed_sequence), n_permutations, block_size))
+    return row
+
+
+## Costes' randomization test of every raw organoid of a folder, saved as "randomization.csv" in the output folder of the threshold mode.
+# Every organoid gets its own random generator, spawned from ``seed`` in the order of the file names,
+#   so the p-values can be reproduced and don't depend on the number of workers.
+# With ``n_workers > 1`` the organoids are tested in a process pool.
+def randomization_tests(pic_folder_path, treatment_var="normal", threshold_mode="triangle_on_dapi_intensity_greater_1_on_rest", gaussian_filter=False, n_permutations=200, block_size=8, seed=0, n_workers=1):
+    output_folder_path = pic_folder_path + "_thresholded_" + threshold_mode
+    if not os.path.isdir(output_folder_path):
+        os.makedirs(output_folder_path)
+
+    files = sorted(organoid_files(pic_folder_path + "/" + base_channel_name + "*" + input_file_format))
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(files))
+    channel_names = [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name]
+    with instrumentation_jenna.stage("randomization test"):
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=thresholding_jenna.init_worker, initargs=(thresholding_jenna.worker_settings(),)) as executor:
+                futures = [executor.submit(randomization_test_organoid, file, seed_sequence, channel_names, gaussian_filter, n_permutations, block_size)
+                           for file, seed_sequence in zip(files, seed_sequences)]
+                results = [future.result() for future in tqdm(futures, desc="Randomization tests")]
+        else:
+            results = [randomization_test_organoid(file, seed_sequence, channel_names, gaussian_filter, n_permutations, block_size)
+                       for file, seed_sequence in tqdm(list(zip(files, seed_sequences)), desc="Randomization tests")]
+
+    rows = []
+    for row in results:
+        record_organoid(rows, row, output_folder_path, treatment_var, "randomization.csv", save_store=False)
+    return quantification_dataframe(rows, output_folder_path, "randomization.csv")
+
+
+## Statistics kernel: all pixel counts and intensity sums of a single organoid.
+# The mask of pixels with intensity > 0 is built only once per channel.
+# Everything else is a reduction (``np.count_nonzero()``, ``sum()``) on those masks, no fancy-indexed copies of the images.
+# The pairwise intersections reuse one boolean buffer.
+# The running sums for the intensity coefficients (see ``IntensitySums``) are added, if ``coefficients`` (``intensity_coefficients`` if not given).
+# input: the 4 thresholded color channels and the binary "triple-colocalization"-mask
+# output: dict of pixel counts and intensity sums, see ``values_from_statistics()``. The statistics of two bands of an image can be added key by key.
+def channel_statistics(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4, coefficients=None):
+    ch1_mask = ch1 > 0
+    ch2_mask = ch2 > 0
+    ch3_mask = ch3 > 0
+    ch4_mask = ch4 > 0
+    intersection = np.empty_like(ch1_mask)
+
+    stats = {
+        "ch1_count_total": np.count_nonzero(ch1_mask),
+        "ch2_count_total": np.count_nonzero(ch2_mask),
+        "ch3_count_total": np.count_nonzero(ch3_mask),
+        "ch4_count_total": np.count_nonzero(ch4_mask),
+        "ch1_intensity_sum": intensity_sum(ch1),
+        "ch2_intensity_sum": intensity_sum(ch2),
+        "ch3_intensity_sum": intensity_sum(ch3),
+        "ch4_intensity_sum": intensity_sum(ch4),
+        # The mask only contains pixels, where ch1, ch2 and ch4 are > 0
+        "mask_count": np.count_nonzero(mask_ch1_ch2_ch4),
+        "ch3_count_in_mask": np.count_nonzero(np.logical_and(ch3_mask, mask_ch1_ch2_ch4, out=intersection)),
+        "ch1_ch4_count": np.count_nonzero(np.logical_and(ch1_mask, ch4_mask, out=intersection)),
+        "ch2_ch4_count": np.count_nonzero(np.logical_and(ch2_mask, ch4_mask, out=intersection)),
+        "ch1_ch2_count": np.count_nonzero(np.logical_and(ch1_mask, ch2_mask, out=intersection)),
+        }
+    if intensity_coefficients if coefficients is None else coefficients:
+        stats["intensity_sums"] = IntensitySums.from_channels([ch1, ch2, ch3, ch4])
+    return stats
+
+
+## Mean intensity of the pixels > 0 of a channel
+def mean_greater_than_zero(intensity_sum, count):
+    if count == 0:
+        return np.nan
+    return intensity_sum / count
+
+
+## Bit depth of the images of a data type, e.g. 8 for ``np.uint8``
+def dtype_bit_depth(dtype):
+    return np.dtype(dtype).itemsize * 8
+
+
+## Name of the mean intensity columns, with the intensity range of the bit depth, e.g. "mean intensity (0 - 255)" for 8-bit images
+def mean_intensity_label(bit_depth=8):
+    return f"mean intensity (0 - {2 ** bit_depth - 1})"
+
+
+## Calculate all values of interest from the statistics of a single organoid.
+# input: the statistics and optionally the (real) names of the 4 channels for the column names, the ones of the configuration otherwise
+#   ``bit_depth`` of the images is recorded in the "Bit depth" column and names the range of the mean intensities.
+# output: dict with the column names of the quantification dataframe as keys
+def values_from_statistics(stats, channel_names=None, bit_depth=8):
+    if channel_names is None:
+        channel_names = [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name]
+    name1, name2, name3, name4 = channel_names
+
+    # How many pixles of a color channel have intensity > 0?
+    ch1_count_total = stats["ch1_count_total"]
+    ch2_count_total = stats["ch2_count_total"]
+    ch3_count_total = stats["ch3_count_total"]
+    ch4_count_total = stats["ch4_count_total"]
+
+    # Normalize the amounts of each marker by the total amount of DAPI-pixels
+    # Normalizing ch3 with ch3 will always give us '1', so we don't do that. 
+    ch1_count_total_normalized = ch1_count_total / ch3_count_total
+    ch2_count_total_normalized = ch2_count_total / ch3_count_total
+    ch3_count_total_normalized = ch3_count_total
+    ch4_count_total_normalized = ch4_count_total / ch3_count_total
+
+    # Get mean intensity of each marker
+    ch1_mean_greater_than_zero = mean_greater_than_zero(stats["ch1_intensity_sum"], ch1_count_total)
+    ch2_mean_greater_than_zero = mean_greater_than_zero(stats["ch2_intensity_sum"], ch2_count_total)
+    ch3_mean_greater_than_zero = mean_greater_than_zero(stats["ch3_intensity_sum"], ch3_count_total)
+    ch4_mean_greater_than_zero = mean_greater_than_zero(stats["ch4_intensity_sum"], ch4_count_total)
+
+    # Calculate the percentage of ch1, ch2, ch3 and ch4 that are colocalized with (ch1 AND ch2 AND ch4)
+    percentage_of_ch1_in_mask = stats["mask_count"] / ch1_count_total * 100
+    percentage_of_ch2_in_mask = stats["mask_count"] / ch2_count_total * 100
+    percentage_of_ch3_in_mask = stats["ch3_count_in_mask"] / ch3_count_total * 100
+    percentage_of_ch4_in_mask = stats["mask_count"] / ch4_count_total * 100
+
+    # Colocalizing one channel within another
+    percentage_of_ch1_in_ch4 = stats["ch1_ch4_count"] / ch1_count_total * 100
+    percentage_of_ch4_in_ch1 = stats["ch1_ch4_count"] / ch4_count_total * 100
+
+    percentage_of_ch2_in_ch4 = stats["ch2_ch4_count"] / ch2_count_total * 100
+    percentage_of_ch4_in_ch2 = stats["ch2_ch4_count"] / ch4_count_total * 100
+
+    percentage_of_ch1_in_ch2 = stats["ch1_ch2_count"] / ch1_count_total * 100
+    percentage_of_ch2_in_ch1 = stats["ch1_ch2_count"] / ch2_count_total * 100
+
+    values = {
+        name1 + " amount normalized by " + name3: ch1_count_total_normalized,
+        name2 + " amount normalized by " + name3: ch2_count_total_normalized,
+        name3 + " amount (total)": ch3_count_total_normalized,
+        name4 + " amount normalized by " + name3: ch4_count_total_normalized,
+        name1 + " " + mean_intensity_label(bit_depth): ch1_mean_greater_than_zero,
+        name2 + " " + mean_intensity_label(bit_depth): ch2_mean_greater_than_zero,
+        name3 + " " + mean_intensity_label(bit_depth): ch3_mean_greater_than_zero,
+        name4 + " " + mean_intensity_label(bit_depth): ch4_mean_greater_than_zero,
+        name1 + " colocalized with " + name1 + ", " + name2 + ", " + name4 + " (Coverage in %)": percentage_of_ch1_in_mask,
+        name2 + " colocalized with " + name1 + ", " + name2 + ", " + name4 + " (Coverage in %)": percentage_of_ch2_in_mask,
+        name3 + " colocalized with " + name1 + ", " + name2 + ", " + name4 + " (Coverage in %)": percentage_of_ch3_in_mask,
+        name4 + " colocalized with " + name1 + ", " + name2 + ", " + name4 + " (Coverage in %)": percentage_of_ch4_in_mask,
+        name1 + " colocalized with " + name4 + " (Coverage in %)": percentage_of_ch1_in_ch4,
+        name4 + " colocalized with " + name1 + " (Coverage in %)": percentage_of_ch4_in_ch1,
+        name2 + " colocalized with " + name4 + " (Coverage in %)": percentage_of_ch2_in_ch4,
+        name4 + " colocalized with " + name2 + " (Coverage in %)": percentage_of_ch4_in_ch2,
+        name1 + " colocalized with " + name2 + " (Coverage in %)": percentage_of_ch1_in_ch2,
+        name2 + " colocalized with " + name1 + " (Coverage in %)": percentage_of_ch2_in_ch1,
+        "Bit depth": bit_depth,
+        }
+    if "intensity_sums" in stats:
+        values.update(intensity_coefficients_from_sums(stats["intensity_sums"], channel_names))
+    return values
+
+
+## Calculate all values of interest of a single organoid.
+# input: the 4 thresholded color channels and the binary "triple-colocalization"-mask
+# output: dict with the column names of the quantification dataframe as keys
+def values_of_interest(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4):
+    with instrumentation_jenna.stage("values of interest"):
+        return values_from_statistics(channel_statistics(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4), bit_depth=dtype_bit_depth(ch1.dtype))
+
+
+## Encode, which channels are present (intensity > 0) at every pixel, as a bit code.
+# Bit ``i`` of a pixel's code is set, if ``channels[i]`` is present at this pixel.
+# input: list of up to 16 greyscale images of the same shape
+def presence_codes(channels):
+    if len(channels) <= 8:
+        code_dtype = np.uint8
+    elif len(channels) <= 16:
+        code_dtype = np.uint16
+    else:
+        raise ValueError(f"Presence codes support up to 16 channels, got {len(channels)}")
+    codes = np.zeros(channels[0].shape, dtype=code_dtype)
+    presence = np.empty(channels[0].shape, dtype=code_dtype)
+    for bit, ch in enumerate(channels):
+        np.greater(ch, 0, out=presence)
+        np.left_shift(presence, bit, out=presence)
+        np.bitwise_or(codes, presence, out=codes)
+    return codes
+
+
+## Histogram of the presence codes: number of pixels with exactly this combination of channels present.
+# This is the only pass over the image, everything else of the overlap table is derived from it.
+def presence_code_histogram(channels):
+    return np.bincount(presence_codes(channels).ravel(), minlength=2 ** len(channels))
+
+
+## Number of pixels, where (at least) all channels of a combination are present, for every combination.
+# Sums the code histogram over all supersets of each code, which needs n * 2^n additions, independent of the image size.
+def intersection_counts(code_histogram):
+    counts = code_histogram.astype(np.int64)
+    n_channels = int(np.log2(len(counts)))
+    for bit in range(n_channels):
+        step = 1 << bit
+        # index = (high * 2 + bit_value) * step + low
+        by_bit = counts.reshape(-1, 2, step)
+        by_bit[:, 0, :] += by_bit[:, 1, :]
+    return counts
+
+
+## Label the objects (8-connected pixels > 0) of a thresholded channel
+# output: number of objects, label image (0 is the background, the objects are 1 to number of objects) and the size of every object (index 0 is the background)
+def label_objects(ch, connectivity=8):
+    n_labels, labels, stats, _ = cv2.connectedComponentsWithStats(np.greater(ch, 0).view(np.uint8), connectivity=connectivity, ltype=cv2.CV_32S)
+    return n_labels - 1, labels, stats[:, cv2.CC_STAT_AREA]
+
+
+## Sparse histogram of the label pairs of two label images: the pixels shared by every pair of overlapping objects.
+# Only pixels with an object in both images are looked at. Every pair is encoded as a single int64 key and the keys are counted,
+#   so the cost depends on the overlapping pixels, not on the number of objects (no loop over objects, no n_a x n_b matrix).
+# output: label in ``labels_a``, label in ``labels_b`` and the number of shared pixels of every overlapping pair
+def label_pair_histogram(labels_a, labels_b, n_objects_b):
+    overlapping = np.flatnonzero(np.logical_and(labels_a, labels_b).ravel())
+    keys = labels_a.ravel()[overlapping].astype(np.int64) * (n_objects_b + 1) + labels_b.ravel()[overlapping]
+    pairs, shared_pixels = np.unique(keys, return_counts=True)
+    return pairs // (n_objects_b + 1), pairs % (n_objects_b + 1), shared_pixels
+
+
+## Fraction of the pixels of every object, that overlap any object of the other channel, from the label pair histogram
+# input: labels of the objects of the pairs, the shared pixels of the pairs and the sizes of all objects (see ``label_objects()``)
+def object_overlap_fractions(pair_labels, shared_pixels, object_sizes):
+    overlap = np.bincount(pair_labels, weights=shared_pixels, minlength=len(object_sizes))
+    return overlap[1:] / object_sizes[1:]
+
+
+## Object-level values of interest of a single organoid:
+#   - number of objects of every channel
+#   - percentage of the objects of a marker, that overlap objects of another marker (more than ``min_overlap`` of their pixels),
+#     for every pair of ch1, ch2 and ch4 in both directions
+# input: the 4 thresholded color channels, optionally the (real) names of the channels, the ones of the configuration otherwise
+# output: dict with the column names of the quantification dataframe as keys
+def object_values_of_interest(ch1, ch2, ch3, ch4, channel_names=None, min_overlap=None):
+    if channel_names is None:
+        channel_names = [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name]
+    min_overlap = object_min_overlap if min_overlap is None else min_overlap
+    with instrumentation_jenna.stage("object colocalization"):
+        objects = [label_objects(ch) for ch in (ch1, ch2, ch3, ch4)]
+        values = {name + " objects": n_objects for name, (n_objects, _, _) in zip(channel_names, objects)}
+        for i, j in [(0, 3), (1, 3), (0, 1)]:
+            (n_objects_i, labels_i, sizes_i), (n_objects_j, labels_j, sizes_j) = objects[i], objects[j]
+            pair_labels_i, pair_labels_j, shared_pixels = label_pair_histogram(labels_i, labels_j, n_objects_j)
+            for a, b, pair_labels, sizes in [(i, j, pair_labels_i, sizes_i), (j, i, pair_labels_j, sizes_j)]:
+                fractions = object_overlap_fractions(pair_labels, shared_pixels, sizes)
+                values[channel_names[a] + " objects colocalized with " + channel_names[b] + " (in %)"] = np.count_nonzero(fractions > min_overlap) / len(fractions) * 100 if len(fractions) else np.nan
+    return values
+
+
+## Roots of a union-find over the elements 0 to ``n - 1``, that are joined by the links ``links_a[k]`` - ``links_b[k]``.
+# Vectorized over all links: every root is hooked onto the smallest root it is linked to, then every element is pointed to its root
+#   (path compression), until both ends of every link have the same root.
+# output: root of every element, the smallest element of its set
+def union_find_roots(n, links_a, links_b):
+    roots = np.arange(n)
+    while True:
+        roots_a, roots_b = roots[links_a], roots[links_b]
+        linked = roots_a != roots_b
+        if not linked.any():
+            return roots
+        np.minimum.at(roots, np.maximum(roots_a, roots_b)[linked], np.minimum(roots_a, roots_b)[linked])
+        while True:
+            grand_roots = roots[roots]
+            if np.array_equal(grand_roots, roots):
+                break
+            roots = grand_roots
+
+
+## Pairs of labels of the objects of two consecutive planes, that touch each other.
+# Voxels touch in 3D with ``connectivity`` 6 (the voxel straight above), 18 (and the 4 above the edges) or 26 (all 9 voxels above).
+# output: unique pairs of the labels in the lower and in the upper plane
+def plane_links(labels_below, labels, connectivity=26):
+    if connectivity == 6:
+        offsets = [(0, 0)]
+    elif connectivity == 18:
+        offsets = [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)]
+    elif connectivity == 26:
+        offsets = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+    else:
+        raise ValueError(f"Unknown 3D connectivity {connectivity}, use 6, 18 or 26")
+    height, width = labels.shape
+    keys = []
+    for dy, dx in offsets:
+        below = labels_below[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)]
+        above = labels[max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)]
+        touching = np.logical_and(below, above)
+        keys.append(below[touching].astype(np.int64) << 32 | above[touching])
+    keys = np.unique(np.concatenate(keys))
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+## Objects of the 4 thresholded channels of a z-stack in 3D, added plane by plane. Only the labels of the previous plane are kept.
+# The objects of every plane are labeled in 2D (see ``label_objects()``) and numbered on through the stack. The objects touching
+#   in consecutive planes (see ``plane_links()``) are joined to 3D objects by a union-find at the end, their sizes and the pixels
+#   shared by the objects of two channels (see ``label_pair_histogram()``) are summed up over the planes of the joined objects.
+class StackObjects:
+    channel_pairs = [(0, 3), (1, 3), (0, 1)]
+
+    def __init__(self, connectivity=26, n_channels=4):
+        self.connectivity = connectivity
+        self.previous_labels = [None] * n_channels
+        # Number of objects of every channel in the planes so far (and before the previous plane), the objects of the next plane are numbered on from there
+        self.n_objects = [0] * n_channels
+        self.previous_n_objects = [0] * n_channels
+        self.sizes = [[np.zeros(1, dtype=np.int64)] for _ in range(n_channels)]
+        self.links = [[] for _ in range(n_channels)]
+        self.shared_pixels = {pair: [] for pair in self.channel_pairs}
+
+    def add_plane(self, channels):
+        objects = [label_objects(ch, 4 if self.connectivity == 6 else 8) for ch in channels]
+        for c, (n_objects, labels, sizes) in enumerate(objects):
+            if self.previous_labels[c] is not None:
+                below, above = plane_links(self.previous_labels[c], labels, self.connectivity)
+                self.links[c].append((below + self.previous_n_objects[c], above + self.n_objects[c]))
+            self.sizes[c].append(sizes[1:].astype(np.int64))
+            self.previous_labels[c] = labels
+        for i, j in self.channel_pairs:
+            pair_labels_i, pair_labels_j, shared_pixels = label_pair_histogram(objects[i][1], objects[j][1], objects[j][0])
+            self.shared_pixels[(i, j)].append((pair_labels_i + self.n_objects[i], pair_labels_j + self.n_objects[j], shared_pixels))
+        for c, (n_objects, _, _) in enumerate(objects):
+            self.previous_n_objects[c] = self.n_objects[c]
+            self.n_objects[c] += n_objects
+
+    ## Number of every object (1 to number of 3D objects, 0 is the background) and the sizes of the 3D objects
+    def objects_3d(self, c):
+        links = self.links[c]
+        roots = union_find_roots(self.n_objects[c] + 1, np.concatenate([below for below, _ in links]).astype(np.intp) if links else np.zeros(0, dtype=np.intp),
+                                 np.concatenate([above for _, above in links]).astype(np.intp) if links else np.zeros(0, dtype=np.intp))
+        _, object_numbers = np.unique(roots, return_inverse=True)
+        return object_numbers, np.bincount(object_numbers, weights=np.concatenate(self.sizes[c]))
+
+    ## Object-level values of interest of the whole stack, see ``object_values_of_interest()``
+    def values(self, channel_names=None, min_overlap=None):
+        if channel_names is None:
+            channel_names = [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name]
+        min_overlap = object_min_overlap if min_overlap is None else min_overlap
+        objects = [self.objects_3d(c) for c in range(len(self.sizes))]
+        values = {name + " objects": len(sizes) - 1 for name, (_, sizes) in zip(channel_names, objects)}
+        for i, j in self.channel_pairs:
+            pair_labels_i, pair_labels_j, shared_pixels = [np.concatenate(column) for column in zip(*self.shared_pixels[(i, j)])]
+            for a, b, pair_labels in [(i, j, pair_labels_i), (j, i, pair_labels_j)]:
+                object_numbers, sizes = objects[a]
+                fractions = object_overlap_fractions(object_numbers[pair_labels], shared_pixels, sizes)
+                values[channel_names[a] + " objects colocalized with " + channel_names[b] + " (in %)"] = np.count_nonzero(fractions > min_overlap) / len(fractions) * 100 if len(fractions) else np.nan
+        return values
+
+
+## Mask of the whole organoid from the thresholded DAPI channel: the nuclei are joined by a closing and the holes are filled
+def organoid_mask(ch3, closing=15):
+    mask = np.greater(ch3, 0).view(np.uint8)
+    if closing > 1:
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (closing, closing)))
+    # Everything within an outer contour belongs to the organoid
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    filled = np.zeros_like(mask)
+    cv2.drawContours(filled, contours, -1, 1, thickness=cv2.FILLED)
+    return filled
+
+
+## Split an organoid mask into ``n_shells`` shells of equal depth by the distance of every pixel to the surface
+# output: label image, 0 outside of the organoid, 1 is the outermost shell and ``n_shells`` the innermost
+def shell_labels(mask, n_shells=4):
+    distance = cv2.distanceTransform(mask, cv2.DIST_L2, 5)
+    max_distance = distance.max()
+    if max_distance == 0:
+        return np.zeros(mask.shape, dtype=np.int32)
+    return np.ceil(distance * (n_shells / max_distance)).astype(np.int32)
+
+
+## Name of the ROI label image of an organoid, see ``region_mode``
+# input: name of the raw or thresholded "C1"-image and the folder of the raw images
+def roi_file_name(file_name, pic_folder_path):
+    raw_name = os.path.basename(file_name).split("_gauss_filter_")[0]
+    if not raw_name.endswith(input_file_format):
+        raw_name += input_file_format
+    return os.path.join(pic_folder_path, raw_name.replace(base_channel_name, roi_name, 1))
+
+
+## Region label image of an organoid for the configured ``region_mode``
+def region_labels(file_name, pic_folder_path, ch3):
+    if region_mode == "shells":
+        with instrumentation_jenna.stage("organoid shells"):
+            return shell_labels(organoid_mask(ch3, organoid_mask_closing), n_shells)
+    if region_mode == "roi":
+        labels = cv2.imread(roi_file_name(file_name, pic_folder_path), -1)
+        if labels is None:
+            raise FileNotFoundError(f"Could not read the ROI label image {roi_file_name(file_name, pic_folder_path)}")
+        if labels.shape != ch3.shape:
+            raise ValueError(f"The ROI label image of {os.path.basename(file_name)} has a different size than the organoid")
+        return labels
+    raise ValueError(f"Unknown region mode \"{region_mode}\", use None, \"shells\" or \"roi\"")
+
+
+## Statistics kernel of ``channel_statistics()`` for every region of a label image at once.
+# Two histogram passes instead of a masked pass per region:
+#   - one over the region label combined with the presence code of the pixel (see ``presence_codes()``, the
+#     "triple-colocalization"-mask is the 5th channel), all pixel counts of every region are derived from it (see ``intersection_counts()``)
+#   - one label-weighted histogram per channel for the intensity sums
+# output: list of the statistics of the regions 1 to the highest label (index 0 is the background)
+def region_statistics(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4, labels):
+    labels = labels.ravel()
+    n_labels = int(labels.max()) + 1
+    keys = labels.astype(np.int64) << 5
+    keys |= presence_codes([ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4]).ravel()
+    code_histograms = np.bincount(keys, minlength=n_labels << 5).reshape(n_labels, 32)
+    intensity_sums = [np.bincount(labels, weights=ch.ravel(), minlength=n_labels) for ch in (ch1, ch2, ch3, ch4)]
+
+    statistics = []
+    for label in range(n_labels):
+        # Index: bit 0 = ch1, bit 1 = ch2, bit 2 = ch3, bit 3 = ch4, bit 4 = mask present
+        counts = intersection_counts(code_histograms[label])
+        statistics.append({
+            "ch1_count_total": counts[0b0001],
+            "ch2_count_total": counts[0b0010],
+            "ch3_count_total": counts[0b0100],
+            "ch4_count_total": counts[0b1000],
+            "ch1_intensity_sum": intensity_sums[0][label],
+            "ch2_intensity_sum": intensity_sums[1][label],
+            "ch3_intensity_sum": intensity_sums[2][label],
+            "ch4_intensity_sum": intensity_sums[3][label],
+            "mask_count": counts[0b10000],
+            "ch3_count_in_mask": counts[0b10100],
+            "ch1_ch4_count": counts[0b1001],
+            "ch2_ch4_count": counts[0b1010],
+            "ch1_ch2_count": counts[0b0011],
+            "region_pixels": int(code_histograms[label].sum()),
+            })
+    return statistics[1:]
+
+
+## All values of interest of every region of an organoid, one row per region (regions without pixels are left out)
+# Regions, where a channel has no pixels, get NaN (or inf) for the values normalized by that channel.
+def region_table(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4, labels, channel_names=None):
+    rows = []
+    with instrumentation_jenna.stage("region statistics"), np.errstate(divide="ignore", invalid="ignore"):
+        for region, stats in enumerate(region_statistics(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4, labels), start=1):
+            if stats["region_pixels"] == 0:
+                continue
+            row = {"Region": region, "Region (pixels)": stats["region_pixels"]}
+            row.update(values_from_statistics(stats, channel_names, dtype_bit_depth(ch1.dtype)))
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+## Combine the region tables of all organoids of a folder and save them as "regions.csv"
+def region_dataframe(region_tables, output_folder_path, treatment_var="normal"):
+    region_df = pd.concat(region_tables, names=["File name", None]).reset_index(level=0).reset_index(drop=True)
+    region_df["Condition"] = treatment_var
+    # Cell line and organoid number from the file name, like ``record_organoid()``
+    name_parts = region_df["File name"].str.split("_")
+    region_df["Organoid number"] = name_parts.str[1]
+    region_df["Cell line"] = name_parts.str[0]
+    region_df.to_csv(output_folder_path + "/regions.csv", index=False)
+    return region_df
+
+
+## Tidy overlap table of every channel combination, derived from the histogram of presence codes.
+# One row per combination and channel within that combination:
+#   - "Intersection (pixels)": pixels, where all channels of the combination are present
+#   - "Exclusive (pixels)": pixels, where exactly these channels and no others are present
+#   - "Coverage in %": share of the channel's pixels, that lie within the intersection ("channel within the rest of the combination")
+def overlap_table_from_histogram(code_histogram, channel_names):
+    intersections = intersection_counts(code_histogram)
+    channel_counts = [intersections[1 << i] for i in range(len(channel_names))]
+    rows = []
+    for code in range(1, len(intersections)):
+        members = [i for i in range(len(channel_names)) if code >> i & 1]
+        for i in members:
+            rows.append({
+                "Combination": " & ".join(channel_names[j] for j in members),
+                "Number of channels": len(members),
+                "Channel": channel_names[i],
+                "Intersection (pixels)": intersections[code],
+                "Exclusive (pixels)": code_histogram[code],
+                "Coverage in %": intersections[code] / channel_counts[i] * 100 if channel_counts[i] else np.nan,
+                })
+    return pd.DataFrame(rows)
+
+
+## Overlap table of any number of channels of a single organoid
+# input: list of greyscale images and the list of their (real) names
+def overlap_table(channels, channel_names):
+    with instrumentation_jenna.stage("overlap table"):
+        return overlap_table_from_histogram(presence_code_histogram(channels), channel_names)
+
+
+## Combine the overlap tables of all organoids of a folder and save them to a csv file.
+# input: dict of "File name": overlap table
+def overlap_dataframe(overlap_tables, output_folder_path, treatment_var="normal"):
+    overlap_df = pd.concat(overlap_tables, names=["File name", None]).reset_index(level=0).reset_index(drop=True)
+    overlap_df["Condition"] = treatment_var
+    overlap_df.to_csv(output_folder_path + "/overlap.csv", index=False)
+    return overlap_df
+
+
+## Columnar results store of an output folder: a Parquet dataset with one file per organoid,
+#   e.g. "quantification.parquet/<file name>.parquet" next to "quantification.csv".
+def results_store_path(output_folder_path, csv_file_name="quantification.csv"):
+    return os.path.join(output_folder_path, csv_file_name.replace(".csv", ".parquet"))
+
+
+## Whether the results store can be used, i.e. ``pyarrow`` is installed. Checked once, with a warning if it isn't.
+has_pyarrow = None
+def results_store_available():
+    global has_pyarrow
+    if has_pyarrow is None:
+        import importlib.util
+        has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+        if not has_pyarrow:
+            warnings.warn('The results store needs the "pyarrow" package, the values of interest are only saved to "quantification.csv".')
+    return has_pyarrow
+
+
+## Append the values of interest of one organoid to the results store.
+# The file is written under a hidden temporary name first and then renamed, so a crash never leaves a broken file behind.
+# Rerunning an organoid replaces its file. Every plane of a z-stack quantified per plane gets its own file.
+def append_to_results_store(row, store_path):
+    if not os.path.isdir(store_path):
+        os.makedirs(store_path, exist_ok=True)
+    part_name = os.path.splitext(row["File name"])[0] + (f"_plane_{row['Plane']}" if "Plane" in row else "") + ".parquet"
+    with instrumentation_jenna.stage("write results store"):
+        pd.DataFrame([row]).to_parquet(os.path.join(store_path, "." + part_name), index=False)
+        os.replace(os.path.join(store_path, "." + part_name), os.path.join(store_path, part_name))
+        instrumentation_jenna.file_written(os.path.join(store_path, part_name))
+
+
+## Add the condition, organoid number and cell line to the values of interest of an organoid and keep them.
+# With ``save_results_store`` (or ``save_store``, if given) the organoid is written to the results store right away (if ``pyarrow`` is installed).
+def record_organoid(rows, row, output_folder_path, treatment_var="normal", csv_file_name="quantification.csv", save_store=None):
+    row["Condition"] = treatment_var
 
     ## Get the cell line and organoid number from the file name
     # - Get the first characters until '_' and the ones after
-    quantification_df["Organoid number"] = quantification_df["File name"].str.split("_", expand=True)[1]
-    quantification_df["Cell line"] = quantification_df["File name"].str.split("_", expand=True)[0]
+    name_parts = row["File name"].split("_")
+    row["Organoid number"] = name_parts[1] if len(name_parts) > 1 else None
+    row["Cell line"] = name_parts[0]
+
+    rows.append(row)
+    if (save_results_store if save_store is None else save_store) and results_store_available():
+        append_to_results_store(row, results_store_path(output_folder_path, csv_file_name))
+    return
+
+
+## Create a dataframe with the values of interest of all organoids at once and save it to a csv file.
+# input: list of dicts, one per organoid, see ``record_organoid()``
+def quantification_dataframe(rows, output_folder_path, csv_file_name="quantification.csv"):
+    quantification_df = pd.DataFrame(rows)
 
     # Save the dataframe to a csv file
-    quantification_df.to_csv(pic_folder_path + "_thresholded_" + threshold_mode + "/quantification.csv", index=False)
+    with instrumentation_jenna.stage("write csv"):
+        quantification_df.to_csv(output_folder_path + "/" + csv_file_name, index=False)
+        instrumentation_jenna.file_written(output_folder_path + "/" + csv_file_name)
     return quantification_df
 
+
+## All results stores of a study (one per condition) as one lazy pyarrow dataset.
+# Nothing is read until it's needed, e.g. only the columns of one plot:
+#   ``load_study_results(treatment_list, threshold_mode).to_table(columns=["Cell line", "Condition", column]).to_pandas()``
+def load_study_results(treatment_list, threshold_mode, csv_file_name="quantification.csv"):
+    import pyarrow.dataset as ds
+    store_paths = [results_store_path(os.path.join(wd, treatment) + "_thresholded_" + threshold_mode, csv_file_name) for treatment in treatment_list]
+    return ds.dataset([ds.dataset(store_path, format="parquet") for store_path in store_paths if os.path.isdir(store_path)])
+
+
+## The saved values of interest of the conditions as one dataframe, e.g. to plot them again.
+# Read from the results stores (only the given columns), if every condition has one and ``pyarrow`` is installed,
+#   from the "quantification.csv" files otherwise.
+#   The rows of a store are sorted by file name (and plane), the conditions stay in the given order.
+def load_saved_quantifications(treatment_list, threshold_mode, columns=None, csv_file_name="quantification.csv"):
+    output_folder_paths = [os.path.join(wd, treatment) + "_thresholded_" + threshold_mode for treatment in treatment_list]
+    if not all(os.path.isdir(results_store_path(output_folder_path, csv_file_name)) for output_folder_path in output_folder_paths) or not results_store_available():
+        with instrumentation_jenna.stage("read csv"):
+            return pd.concat([pd.read_csv(os.path.join(output_folder_path, csv_file_name), usecols=columns) for output_folder_path in output_folder_paths], ignore_index=True)
+
+    quant_dfs = []
+    with instrumentation_jenna.stage("read results store"):
+        for treatment in treatment_list:
+            quantification_df = load_study_results([treatment], threshold_mode, csv_file_name).to_table(columns=columns).to_pandas()
+            order = [column for column in ["File name", "Plane"] if column in quantification_df.columns]
+            quant_dfs.append(quantification_df.sort_values(order, kind="stable") if order else quantification_df)
+    return pd.concat(quant_dfs, ignore_index=True)
+
+
+def calculate_values_of_interest(pic_folder_path, treatment_var="normal", threshold_mode="triangle_on_dapi_intensity_greater_1_on_rest", gaussian_filter=False, save_mask=False):
+    # One dict of values of interest per file within the folder
+    rows = []
+    overlap_tables = {}
+    region_tables = {}
+
+    files = organoid_files(pic_folder_path + "_thresholded_" + threshold_mode + "/*" + base_channel_name + "*thresholded*")
+    # Z-stacks are quantified plane by plane instead of being read as a whole
+    files, stack_files = thresholding_jenna.split_z_stacks(files)
+    for file in tqdm(stack_files, desc="Counting pixels of z-stacks"):
+        with instrumentation_jenna.organoid(os.path.basename(file)):
+            stack_rows, table = quantify_thresholded_stack(file, threshold_mode, gaussian_filter)
+            for row in stack_rows:
+                record_organoid(rows, row, pic_folder_path + "_thresholded_" + threshold_mode, treatment_var)
+        if table is not None:
+            overlap_tables[os.path.basename(file)] = table
+
+    for file, organoid in tqdm(thresholding_jenna.prefetched(files, read_4_color_channels, prefetch_organoids), total=len(files), desc="Counting pixels"):
+        with instrumentation_jenna.organoid(os.path.basename(file)):
+            # Read the marker images of each organoid and the "triple-colocalization"-mask (read ahead in the background)
+            ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4 = organoid.result()
+
+            row = {"File name": os.path.basename(file)}
+            row.update(values_of_interest(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4))
+            if object_colocalization:
+                row.update(object_values_of_interest(ch1, ch2, ch3, ch4))
+            row["Gaussian filter"] = gaussian_filter
+            row["Threshold type"] = threshold_mode
+            record_organoid(rows, row, pic_folder_path + "_thresholded_" + threshold_mode, treatment_var)
+            if save_overlap_table:
+                overlap_tables[row["File name"]] = overlap_table([ch1, ch2, ch3, ch4], [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name])
+            if region_mode:
+                region_tables[row["File name"]] = region_table(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4, region_labels(file, pic_folder_path, ch3))
+
+    if overlap_tables:
+        overlap_dataframe(overlap_tables, pic_folder_path + "_thresholded_" + threshold_mode, treatment_var)
+    if region_tables:
+        region_dataframe(region_tables, pic_folder_path + "_thresholded_" + threshold_mode, treatment_var)
+    return quantification_dataframe(rows, pic_folder_path + "_thresholded_" + threshold_mode)
+
+
+## Quantify a single organoid, that was thresholded in memory.
+# The thresholded images and the mask are only written, if requested. They get the same names as the ones of the two-step way.
+# With a ``writer`` (see ``thresholding_jenna.QueuedWriter``) they are written in the background, the futures of the writes are added to ``writes``.
+# ``file_name`` is the name of the thresholded "C1"-image, the one of the two-step way if not given (e.g. the name of an already thresholded organoid).
+# The other settings are the ones of the configuration, if they aren't given (e.g. by the engine, see "engine_jenna.py"):
+#   ``channel_names``, ``objects``, ``min_overlap``, ``coefficients``, ``mask_format`` and ``overlap`` like ``quantify_stack()``,
+#   ``prefix``, ``suffixes`` and ``image_format`` like ``thresholding_jenna.save_thresholded_channels()``.
+# output: dict of values of interest and the organoid's overlap table (``None``, if ``save_overlap_table`` is off)
+def quantify_thresholded_organoid(file, ch1, ch2, ch3, ch4, output_folder_path, threshold_mode, gaussian_filter, save_mask=False, save_thresholded=False, writer=None, writes=None,
+                                  file_name=None, channel_names=None, objects=None, min_overlap=None, coefficients=None, mask_format=None, overlap=None,
+                                  prefix=None, suffixes=None, image_format=None):
+    if channel_names is None:
+        channel_names = [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name]
+    objects = object_colocalization if objects is None else objects
+    overlap = save_overlap_table if overlap is None else overlap
+
+    ## Write now or queue the write
+    def write(function, *args):
+        if writer is None:
+            function(*args)
+        else:
+            writes.append(writer.submit(function, *args))
+
+    if save_thresholded:
+        write(thresholding_jenna.save_thresholded_channels, file, ch1, ch2, ch3, ch4, output_folder_path, threshold_mode, gaussian_filter, prefix, suffixes, image_format)
+
+    if file_name is None:
+        file_name = thresholding_jenna.thresholded_file_name(file, threshold_mode, gaussian_filter, image_format)
+    with instrumentation_jenna.stage("triple colocalization mask"):
+        mask_ch1_ch2_ch4 = triple_colocalization_mask(ch1, ch2, ch4)
+    if save_mask:
+        write(save_mask_image, os.path.join(output_folder_path, mask_file_name(file_name, mask_format)), mask_ch1_ch2_ch4)
+    mask_ch1_ch2_ch4 = mask_ch1_ch2_ch4 > 0
+
+    row = {"File name": file_name}
+    with instrumentation_jenna.stage("values of interest"):
+        row.update(values_from_statistics(channel_statistics(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4, coefficients), channel_names, dtype_bit_depth(ch1.dtype)))
+    if objects:
+        row.update(object_values_of_interest(ch1, ch2, ch3, ch4, channel_names, min_overlap))
+    row["Gaussian filter"] = gaussian_filter
+    row["Threshold type"] = threshold_mode
+    table = None
+    if overlap:
+        table = overlap_table([ch1, ch2, ch3, ch4], channel_names)
+    return row, table
+
+
+## Quantify the thresholded planes of a z-stack one after another, only one plane of every channel is in memory.
+#  - ``z_mode`` "volume": the statistics of the planes are added up (like the bands of tiled processing), one row for the organoid.
+#    The objects are connected in 3D (``object_connectivity_3d``, see ``StackObjects``).
+#  - "planes": one row per plane with its number in the "Plane" column, the objects are the ones of the plane
+# The mask is saved as a stack, if requested: bit-packed plane by plane (see ``pack_mask()``) or as a multi-page TIFF file.
+# The other settings are the ones of the configuration, if they aren't given (e.g. by the engine, see "engine_jenna.py").
+# input: name of the thresholded "C1"-image and an iterable of the number and the 4 thresholded planes of every plane
+# output: list of dicts of values of interest, one per row, and the overlap table of the whole stack (``None``, if ``save_overlap_table`` is off)
+def quantify_stack(file_name, planes, output_folder_path, threshold_mode, gaussian_filter, save_mask=False, z_mode=None,
+                   channel_names=None, objects=None, min_overlap=None, connectivity=None, coefficients=None, mask_format=None, overlap=None, regions=None):
+    z_mode = z_mode or z_stack_mode
+    if channel_names is None:
+        channel_names = [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name]
+    objects = object_colocalization if objects is None else objects
+    connectivity = object_connectivity_3d if connectivity is None else connectivity
+    mask_format = mask_file_format if mask_format is None else mask_format
+    overlap = save_overlap_table if overlap is None else overlap
+    if region_mode if regions is None else regions:
+        raise ValueError("Regions aren't available for z-stacks")
+    rows = []
+    stats = None
+    code_histogram = 0
+    stack_objects = StackObjects(connectivity) if objects and z_mode == "volume" else None
+    packed_mask = []
+    mask_writer = None
+    if save_mask and mask_format != "packed":
+        mask_writer = thresholding_jenna.StackWriters([os.path.join(output_folder_path, mask_file_name(file_name, mask_format))])
+    try:
+        for z, (ch1, ch2, ch3, ch4) in planes:
+            with instrumentation_jenna.stage("triple colocalization mask"):
+                mask_ch1_ch2_ch4 = triple_colocalization_mask(ch1, ch2, ch4)
+            if mask_writer is not None:
+                mask_writer.write([mask_ch1_ch2_ch4])
+            elif save_mask:
+                packed_mask.append(pack_mask(mask_ch1_ch2_ch4))
+            mask_ch1_ch2_ch4 = mask_ch1_ch2_ch4 > 0
+
+            with instrumentation_jenna.stage("values of interest"):
+                plane_stats = channel_statistics(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4, coefficients)
+            if z_mode == "planes":
+                row = {"File name": file_name, "Plane": z}
+                row.update(values_from_statistics(plane_stats, channel_names, bit_depth=dtype_bit_depth(ch1.dtype)))
+                if objects:
+                    row.update(object_values_of_interest(ch1, ch2, ch3, ch4, channel_names, min_overlap))
+                rows.append(row)
+            else:
+                stats = plane_stats if stats is None else {key: stats[key] + plane_stats[key] for key in stats}
+                if stack_objects is not None:
+                    with instrumentation_jenna.stage("object colocalization"):
+                        stack_objects.add_plane([ch1, ch2, ch3, ch4])
+            if overlap:
+                code_histogram = code_histogram + presence_code_histogram([ch1, ch2, ch3, ch4])
+    finally:
+        if mask_writer is not None:
+            mask_writer.close()
+    if packed_mask:
+        with instrumentation_jenna.stage("write mask"):
+            save_packed_mask(os.path.join(output_folder_path, mask_file_name(file_name, mask_format)), np.stack(packed_mask), (len(packed_mask),) + ch1.shape)
+
+    if z_mode == "volume":
+        row = {"File name": file_name}
+        row.update(values_from_statistics(stats, channel_names, bit_depth=dtype_bit_depth(ch1.dtype)))
+        if stack_objects is not None:
+            row.update(stack_objects.values(channel_names, min_overlap))
+        rows.append(row)
+    for row in rows:
+        row["Gaussian filter"] = gaussian_filter
+        row["Threshold type"] = threshold_mode
+    table = None
+    if overlap:
+        table = overlap_table_from_histogram(code_histogram, channel_names)
+    return rows, table
+
+
+## Quantify a z-stack, that was thresholded by "thresholding_jenna.py", see ``quantify_stack()``.
+# The mask is saved, if ``save_mask`` (``save_mask_as_files`` if not given) and it isn't there yet (like ``read_4_color_channels()``).
+# ``prefix`` and ``suffixes`` are passed to ``thresholding_jenna.open_4_color_stacks()``, the other ``settings`` to ``quantify_stack()``.
+# input: "file name" string of the thresholded "C1"-stack
+def quantify_thresholded_stack(file, threshold_mode, gaussian_filter, save_mask=None, z_mode=None, prefix=None, suffixes=None, **settings):
+    readers = thresholding_jenna.open_4_color_stacks(file, prefix, suffixes)
+    try:
+        instrumentation_jenna.file_read(*[reader.file for reader in readers])
+        save_mask = (save_mask_as_files if save_mask is None else save_mask) and not os.path.isfile(mask_file_name(file, settings.get("mask_format")))
+        return quantify_stack(os.path.basename(file), thresholding_jenna.iterate_stack_planes(readers), os.path.dirname(file), threshold_mode, gaussian_filter, save_mask, z_mode, **settings)
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+## Threshold a raw z-stack plane by plane in memory and quantify it right away, see ``quantify_stack()``.
+# The thresholds are the ones of the whole stack or of every plane, like ``z_stack_mode`` (see ``thresholding_jenna.threshold_stack_planes()``).
+# The thresholded stacks are saved plane by plane too, if requested.
+# ``prefix``, ``suffixes`` and ``image_format`` are the ones of ``thresholding_jenna.threshold_stack()``, the other ``settings`` are passed to ``quantify_stack()``.
+# input: "file name" string of the raw "C1"-stack
+def quantify_raw_stack(file, output_folder_path, threshold_mode, gaussian_filter, save_mask=False, save_thresholded=False, z_mode=None,
+                       prefix=None, suffixes=None, image_format=None, **settings):
+    z_mode = z_mode or z_stack_mode
+    readers = thresholding_jenna.open_4_color_stacks(file, prefix, suffixes)
+    writers = None
+    try:
+        instrumentation_jenna.file_read(*[reader.file for reader in readers])
+        planes = thresholding_jenna.threshold_stack_planes(readers, threshold_mode, gaussian_filter, z_mode)
+        if save_thresholded:
+            writers = thresholding_jenna.StackWriters([os.path.join(output_folder_path, thresholding_jenna.thresholded_file_name(reader.file, threshold_mode, gaussian_filter, image_format))
+                                                       for reader in readers])
+            planes = writers.write_through(planes)
+        return quantify_stack(thresholding_jenna.thresholded_file_name(file, threshold_mode, gaussian_filter, image_format), planes, output_folder_path, threshold_mode, gaussian_filter,
+                              save_mask, z_mode, **settings)
+    finally:
+        if writers is not None:
+            writers.close()
+        for reader in readers:
+            reader.close()
+
+
+## Threshold sweep: apply several threshold modes and gaussian blur settings, while every raw organoid is read only once.
+# Each blur setting is applied once per organoid, each mode thresholds the (blurred) channels in memory.
+# Every mode gets the usual "<folder>_thresholded_<mode>" folder with its thresholded images (if ``save_thresholded``),
+#   masks (if ``save_mask``) and "quantification.csv". The blur settings of a mode end up in the same csv file ("Gaussian filter" column).
+# output: dict of threshold mode: quantification dataframe
+def threshold_sweep(pic_folder_path, treatment_var="normal", threshold_modes=("triangle", "otsu"), gaussian_filters=(False,), save_mask=False, save_thresholded=True):
+    output_folder_paths = {}
+    rows = {}
+    overlap_tables = {}
+    region_tables = {}
+    for mode in threshold_modes:
+        output_folder_paths[mode] = pic_folder_path + "_thresholded_" + mode
+        if not os.path.isdir(output_folder_paths[mode]):
+            os.makedirs(output_folder_paths[mode])
+        rows[mode] = []
+        overlap_tables[mode] = {}
+        region_tables[mode] = {}
+
+    # The next organoids are read and the images of the previous ones written in the background
+    files = organoid_files(pic_folder_path + "/" + base_channel_name + "*" + input_file_format)
+    # Z-stacks are streamed plane by plane, once per blur setting and mode
+    files, stack_files = thresholding_jenna.split_z_stacks(files)
+    for file in tqdm(stack_files, desc="Thresholding and counting pixels of z-stacks"):
+        with instrumentation_jenna.organoid(os.path.basename(file)):
+            for gaussian_filter in gaussian_filters:
+                for mode in threshold_modes:
+                    stack_rows, table = quantify_raw_stack(file, output_folder_paths[mode], mode, gaussian_filter, save_mask, save_thresholded)
+                    for row in stack_rows:
+                        record_organoid(rows[mode], row, output_folder_paths[mode], treatment_var)
+                    if table is not None:
+                        overlap_tables[mode][stack_rows[0]["File name"]] = table
+
+    writes = []
+    with thresholding_jenna.QueuedWriter(queued_writes) as writer:
+        for file, organoid in tqdm(thresholding_jenna.prefetched(files, thresholding_jenna.read_4_color_channels, prefetch_organoids), total=len(files), desc="Thresholding and counting pixels"):
+            with instrumentation_jenna.organoid(os.path.basename(file)):
+                raw_channels = organoid.result()
+                for gaussian_filter in gaussian_filters:
+                    channels = thresholding_jenna.gaussian_blur_channels(*raw_channels) if gaussian_filter else raw_channels
+                    for mode in threshold_modes:
+                        with instrumentation_jenna.stage("threshold " + mode):
+                            ch1, ch2, ch3, ch4 = thresholding_jenna.apply_threshold(*channels, mode)
+                        row, table = quantify_thresholded_organoid(file, ch1, ch2, ch3, ch4, output_folder_paths[mode], mode, gaussian_filter, save_mask, save_thresholded, writer, writes)
+                        record_organoid(rows[mode], row, output_folder_paths[mode], treatment_var)
+                        if table is not None:
+                            overlap_tables[mode][row["File name"]] = table
+                        if region_mode:
+                            region_tables[mode][row["File name"]] = region_table(ch1, ch2, ch3, ch4, triple_colocalization_mask(ch1, ch2, ch4) > 0, region_labels(file, pic_folder_path, ch3))
+    # Raise the errors of the writes
+    for future in writes:
+        future.result()
+
+    quantification_dfs = {}
+    for mode in threshold_modes:
+        if overlap_tables[mode]:
+            overlap_dataframe(overlap_tables[mode], output_folder_paths[mode], treatment_var)
+        if region_tables[mode]:
+            region_dataframe(region_tables[mode], output_folder_paths[mode], treatment_var)
+        quantification_dfs[mode] = quantification_dataframe(rows[mode], output_folder_paths[mode])
+    return quantification_dfs
+
+
+## Streaming version of ``calculate_values_of_interest()``:
+# The raw images of the condition folder are read only once, thresholded in memory (see "thresholding_jenna.py")
+#   and fed straight into the quantification, without the detour over the thresholded files on disk.
+# This is the threshold sweep with a single mode and blur setting.
+def calculate_values_of_interest_from_raw(pic_folder_path, treatment_var="normal", threshold_mode="triangle_on_dapi_intensity_greater_1_on_rest", gaussian_filter=False, save_mask=False, save_thresholded=False):
+    return threshold_sweep(pic_folder_path, treatment_var, [threshold_mode], [gaussian_filter], save_mask, save_thresholded)[threshold_mode]
+
+## Object colocalization and regions need the whole images of an organoid (the objects and regions would be cut at the bands of
+#   tiled processing, the histograms have no positions at all), the modes without them raise instead of leaving them out.
+def check_whole_image_options(mode_name):
+    if object_colocalization:
+        raise ValueError(f"Object colocalization isn't available in {mode_name}")
+    if region_mode:
+        raise ValueError(f"Regions aren't available in {mode_name}")
+
+
+## Quantify a single organoid band by band, without loading the full images into memory.
+# The global thresholds come from the histograms accumulated over all bands of a first pass
+#   ("adaptive" is a local threshold and doesn't need it), the values of interest are accumulated over the bands of the second pass.
+# Thresholded images and masks are written band by band into memory-mapped TIFF files, if requested.
+#   A bit-packed mask is packed band by band in memory (1/8 of a byte per pixel) and saved at the end.
+# output: dict of values of interest and the organoid's overlap table (``None``, if ``save_overlap_table`` is off)
+def quantify_organoid_tiled(file, output_folder_path, threshold_mode, gaussian_filter, save_mask=False, save_thresholded=False, memory_budget_mb=512):
+    check_whole_image_options("tiled processing")
+    readers = thresholding_jenna.open_4_color_channels_lazy(file)
+    outputs = []
+    try:
+        height, width = readers[0].shape
+        band_rows = thresholding_jenna.band_rows_for_budget(width, readers[0].dtype, memory_budget_mb)
+
+        thresholds = None
+        if threshold_mode != "adaptive":
+            with instrumentation_jenna.stage("histograms of the bands"):
+                histograms = thresholding_jenna.accumulate_band_histograms(readers, band_rows, gaussian_filter)
+                thresholds = thresholding_jenna.histogram_thresholds(*histograms, mode=threshold_mode)
+
+        file_name = thresholding_jenna.thresholded_file_name(file, threshold_mode, gaussian_filter)
+        if save_thresholded or save_mask:
+            import tifffile
+            output_names = []
+            if save_thresholded:
+                output_names = [thresholding_jenna.thresholded_file_name(reader.file, threshold_mode, gaussian_filter) for reader in readers]
+            if save_mask and mask_file_format != "packed":
+                output_names.append(mask_file_name(file_name))
+            outputs = [tifffile.memmap(os.path.join(output_folder_path, name), shape=(height, width), dtype=readers[0].dtype) for name in output_names]
+
+        packed_mask = None
+        if save_mask and mask_file_format == "packed":
+            packed_mask = np.empty((height, (width + 7) // 8), dtype=np.uint8)
+
+        stats = None
+        code_histogram = 0
+        with instrumentation_jenna.stage("threshold and count the bands"):
+            instrumentation_jenna.file_read(*[reader.file for reader in readers])
+            for y0, y1, bands, top in thresholding_jenna.iterate_channel_bands(readers, band_rows, thresholding_jenna.band_halo(threshold_mode, gaussian_filter)):
+                ch1, ch2, ch3, ch4 = thresholding_jenna.threshold_band(bands, threshold_mode, thresholds, gaussian_filter, top, y1 - y0)
+                mask_ch1_ch2_ch4 = triple_colocalization_mask(ch1, ch2, ch4)
+                for output, band in zip(outputs, ([ch1, ch2, ch3, ch4] if save_thresholded else []) + ([mask_ch1_ch2_ch4] if save_mask else [])):
+                    output[y0:y1] = band
+                if packed_mask is not None:
+                    packed_mask[y0:y1] = pack_mask(mask_ch1_ch2_ch4)
+
+                band_stats = channel_statistics(ch1, ch2, ch3, ch4, mask_ch1_ch2_ch4 > 0)
+                stats = band_stats if stats is None else {key: stats[key] + band_stats[key] for key in stats}
+                if save_overlap_table:
+                    code_histogram = code_histogram + presence_code_histogram([ch1, ch2, ch3, ch4])
+        if packed_mask is not None:
+            with instrumentation_jenna.stage("write mask"):
+                save_packed_mask(os.path.join(output_folder_path, mask_file_name(file_name)), packed_mask, (height, width))
+    finally:
+        for output in outputs:
+            output.flush()
+        for reader in readers:
+            reader.close()
+
+    row = {"File name": file_name}
+    row.update(values_from_statistics(stats, bit_depth=dtype_bit_depth(readers[0].dtype)))
+    row["Gaussian filter"] = gaussian_filter
+    row["Threshold type"] = threshold_mode
+    table = None
+    if save_overlap_table:
+        table = overlap_table_from_histogram(code_histogram, [ch1_real_name, ch2_real_name, ch3_real_name, ch4_real_name])
+    return row, table
+
+
+## Tiled version of ``calculate_values_of_interest_from_raw()`` for very large images, with bounded memory per organoid.
+def calculate_values_of_interest_tiled(pic_folder_path, treatment_var="normal", threshold_mode="triangle_on_dapi_intensity_greater_1_on_rest", gaussian_filter=False, save_mask=False, save_thresholded=False, memory_budget_mb=512):
+    check_whole_image_options("tiled processing")
+    rows = []
+    overlap_tables = {}
+
+    output_folder_path = pic_folder_path + "_thresholded_" + threshold_mode
+    if not os.path.isdir(output_folder_path):
+        os.makedirs(output_folder_path)
+
+    for file in tqdm(organoid_files(pic_folder_path + "/" + base_channel_name + "*" + input_file_format), desc="Thresholding and counting pixels tile by tile"):
+        with instrumentation_jenna.organoid(os.path.basename(file)):
+            # A z-stack is streamed plane by plane instead of band by band
+            if thresholding_jenna.is_z_stack(file):
+                organoid_rows, table = quantify_raw_stack(file, output_folder_path, threshold_mode, gaussian_filter, save_mask, save_thresholded)
+            else:
+                row, table = quantify_organoid_tiled(file, output_folder_path, threshold_mode, gaussian_filter, save_mask, save_thresholded, memory_budget_mb)
+                organoid_rows = [row]
+            for row in organoid_rows:
+                record_organoid(rows, row, output_folder_path, treatment_var)
+        if table is not None:
+            overlap_tables[row["File name"]] = table
+
+    if overlap_tables:
+        overlap_dataframe(overlap_tables, output_folder_path, treatment_var)
+    return quantification_dataframe(rows, output_folder_path)
+
+
+## Amounts and mean intensities only from the histograms of the raw color channels.
+# The histograms are cached per raw image (see ``thresholding_jenna.cached_channel_histograms()``) and
+#   the thresholds of every mode except "adaptive" only depend on them, so are the amounts and mean intensities.
+# The coverages need the pixel positions and are not part of this table.
+# The dataframe is saved as "quantification_from_histograms.csv".
+def calculate_values_from_histograms(pic_folder_path, treatment_var="normal", threshold_mode="triangle_on_dapi_intensity_greater_1_on_rest", gaussian_filter=False):
+    check_whole_image_options("the histogram-only mode")
+    rows = []
+
+    output_folder_path = pic_folder_path + "_thresholded_" + threshold_mode
+    if not os.path.isdir(output_folder_path):
+        os.makedirs(output_folder_path)
+
+    # The histograms of the next organoids are read (or computed) in the background
+    files = organoid_files(pic_folder_path + "/" + base_channel_name + "*" + input_file_format)
+    for file, cached_histograms in tqdm(thresholding_jenna.prefetched(files, lambda file: thresholding_jenna.cached_channel_histograms(file, gaussian_filter), prefetch_organoids), total=len(files), desc="Counting pixels from histograms"):
+        with instrumentation_jenna.organoid(os.path.basename(file)), instrumentation_jenna.stage("histograms"):
+            histograms = cached_histograms.result()
+            thresholds = thresholding_jenna.histogram_thresholds(*histograms, mode=threshold_mode)
+        (ch1_count, ch1_sum), (ch2_count, ch2_sum), (ch3_count, ch3_sum), (ch4_count, ch4_sum) = [
+            thresholding_jenna.thresholded_count_and_sum(hist, threshold) for hist, threshold in zip(histograms, thresholds)]
+        # One bin per intensity value: 256 bins for 8-bit, 65536 for 16-bit images
+        bit_depth = int(len(histograms[0])).bit_length() - 1
+
+        record_organoid(rows, {
+            "File name": thresholding_jenna.thresholded_file_name(file, threshold_mode, gaussian_filter),
+            ch1_real_name + " amount normalized by " + ch3_real_name: ch1_count / ch3_count,
+            ch2_real_name + " amount normalized by " + ch3_real_name: ch2_count / ch3_count,
+            ch3_real_name + " amount (total)": ch3_count,
+            ch4_real_name + " amount normalized by " + ch3_real_name: ch4_count / ch3_count,
+            ch1_real_name + " " + mean_intensity_label(bit_depth): mean_greater_than_zero(ch1_sum, ch1_count),
+            ch2_real_name + " " + mean_intensity_label(bit_depth): mean_greater_than_zero(ch2_sum, ch2_count),
+            ch3_real_name + " " + mean_intensity_label(bit_depth): mean_greater_than_zero(ch3_sum, ch3_count),
+            ch4_real_name + " " + mean_intensity_label(bit_depth): mean_greater_than_zero(ch4_sum, ch4_count),
+            ch1_real_name + " threshold": thresholds[0],
+            ch2_real_name + " threshold": thresholds[1],
+            ch3_real_name + " threshold": thresholds[2],
+            ch4_real_name + " threshold": thresholds[3],
+            "Bit depth": bit_depth,
+            "Gaussian filter": gaussian_filter,
+            "Threshold type": threshold_mode,
+            }, output_folder_path, treatment_var, csv_file_name="quantification_from_histograms.csv")
+
+    return quantification_dataframe(rows, output_folder_path, csv_file_name="quantification_from_histograms.csv")
+
+## Columns of the values of interest: all numeric columns, except the ones describing the organoid and its images
+#   (the organoid numbers are numeric, once a "quantification.csv" is read again)
+def value_columns(quantification_df):
+    return [column for column in quantification_df.select_dtypes(include=[float, int]).columns if column not in ("Organoid number", "Bit depth", "Plane")]
+
+## Multiple comparison correction of a matrix of p-values, each column is one family of tests.
+# NaN p-values (groups with less than 2 organoids) aren't counted as tests.
+def correct_pvalues(pvalues, method="bonferroni"):
+    if method is None:
+        return pvalues.copy()
+    n_tests = np.sum(~np.isnan(pvalues), axis=0)
+    order = np.argsort(pvalues, axis=0)  # NaNs are sorted to the end
+    sorted_pvalues = np.take_along_axis(pvalues, order, axis=0)
+    rank = np.arange(1, len(pvalues) + 1)[:, None]
+    if method == "bonferroni":
+        corrected = sorted_pvalues * n_tests
+    elif method == "holm":
+        corrected = np.fmax.accumulate(sorted_pvalues * (n_tests - rank + 1), axis=0)
+    elif method == "fdr_bh":
+        corrected = np.fmin.accumulate((sorted_pvalues * n_tests / rank)[::-1], axis=0)[::-1]
+    else:
+        raise ValueError(f"Unknown multiple comparison correction \"{method}\"")
+    corrected = np.minimum(corrected, 1)
+    corrected[np.isnan(sorted_pvalues)] = np.nan
+    result = np.empty_like(corrected)
+    np.put_along_axis(result, order, corrected, axis=0)
+    return result
+
+
+## Welch's t-tests of every value of interest between every pair of groups, as one vectorized batch.
+# Groups are the values of ``x`` (e.g. "Cell line") or, with ``hue``, the (x, hue) combinations.
+# Without ``box_pairs`` all pairs of groups are tested, with ``hue`` all pairs of hue values within each x value.
+# The group sizes, means and variances of all values come from a single groupby, the t statistics, degrees of freedom and
+#   p-values of all pairs and values are array operations on them.
+# The settings in ``by``, that the dataframe has (e.g. the threshold modes and blur settings of a threshold sweep), are tested separately:
+#   every organoid is in each of them, they aren't independent samples. Each setting is its own family of the correction.
+# output: one row per value of interest and pair (and setting), with the uncorrected and corrected p-values
+#   The pairs in "Group 1"/"Group 2" have the form of the ``box_pairs`` of ``box_plt_by_cell_line_comparison()``.
+def welch_tests(quantification_df, x="Cell line", hue=None, box_pairs=None, values=None, correction=None, by=("Threshold type", "Gaussian filter")):
+    if values is None:
+        values = value_columns(quantification_df)
+    keys = [column for column in by if column in quantification_df.columns]
+    if keys:
+        statistics_dfs = []
+        for settings, settings_df in quantification_df.groupby(keys, sort=False):
+            statistics_df = welch_tests(settings_df, x, hue, box_pairs, values, correction, by=())
+            for k, (key, setting) in enumerate(zip(keys, settings)):
+                statistics_df.insert(k, key, setting)
+            statistics_dfs.append(statistics_df)
+        return pd.concat([statistics_df for statistics_df in statistics_dfs if len(statistics_df)] or statistics_dfs[:1], ignore_index=True)
+    group_by = [x] if hue is None else [x, hue]
+    grouped = quantification_df.groupby(group_by)[list(values)]
+    counts, means, variances = grouped.count(), grouped.mean(), grouped.var()
+    if hue is None:
+        for summary in (counts, means, variances):
+            summary.index = summary.index.get_level_values(0)
+
+    if box_pairs is None:
+        if hue is None:
+            box_pairs = list(combinations(counts.index, 2))
+        else:
+            box_pairs = [pair for x_value in counts.index.unique(level=0)
+                         for pair in combinations([group for group in counts.index if group[0] == x_value], 2)]
+    box_pairs = [pair for pair in box_pairs if pair[0] in counts.index and pair[1] in counts.index]
+    if not box_pairs:
+        return pd.DataFrame(columns=["Value", "Group 1", "Group 2", "n 1", "n 2", "Mean 1", "Mean 2", "t", "Degrees of freedom", "p-value", "p-value corrected", "Correction"])
+
+    first, second = [pair[0] for pair in box_pairs], [pair[1] for pair in box_pairs]
+    n1, n2 = counts.loc[first].to_numpy(float), counts.loc[second].to_numpy(float)
+    mean1, mean2 = means.loc[first].to_numpy(), means.loc[second].to_numpy()
+    se1, se2 = variances.loc[first].to_numpy() / n1, variances.loc[second].to_numpy() / n2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (mean1 - mean2) / np.sqrt(se1 + se2)
+        dof = (se1 + se2) ** 2 / (se1 ** 2 / (n1 - 1) + se2 ** 2 / (n2 - 1))
+    from scipy import stats
+    pvalues = 2 * stats.t.sf(np.abs(t), dof)
+    corrected = correct_pvalues(pvalues, correction)
+
+    # One row per value and pair
+    n_pairs, n_values = pvalues.shape
+    return pd.DataFrame({
+        "Value": np.tile(np.asarray(values, dtype=object), n_pairs),
+        "Group 1": np.repeat(np.array(first + [None], dtype=object)[:-1], n_values),
+        "Group 2": np.repeat(np.array(second + [None], dtype=object)[:-1], n_values),
+        "n 1": n1.ravel(),
+        "n 2": n2.ravel(),
+        "Mean 1": mean1.ravel(),
+        "Mean 2": mean2.ravel(),
+        "t": t.ravel(),
+        "Degrees of freedom": dof.ravel(),
+        "p-value": pvalues.ravel(),
+        "p-value corrected": corrected.ravel(),
+        "Correction": correction,
+        })
+
+
+## Bootstrap confidence intervals of the means of every value of interest in every group.
+# Groups are the (x, hue) combinations, e.g. every cell line in every condition, separately for every setting in ``by``, that the dataframe has
+#   (e.g. the threshold modes and blur settings of a threshold sweep). Besides the mean of every group, the difference of the means of
+#   every pair of hue values within each x value (e.g. two conditions of a cell line) gets an interval.
+#   The estimate of a pair is the mean of the group minus the one of the group in "Compared to", which comes first in the dataframe.
+# Missing values (NaN) are left out before the resampling, so "n" is the number of values of every resample. The value columns of a group
+#   with the same missing rows (usually all of them) are resampled together: the drawn rows of all resamples are turned into how often every
+#   row is drawn (one ``np.bincount()``), the resampled means of all these columns are then a single matrix product of the counts with the values.
+# The intervals are the percentiles of the resampled means (percentile bootstrap), the differences use the resamples of both groups.
+# output: one row per value of interest and group or pair of groups ("Compared to" is empty for the mean of a single group)
+def bootstrap_summary(quantification_df, x="Cell line", hue="Condition", values=None, n_resamples=10000, confidence=0.95, seed=0, by=("Threshold type", "Gaussian filter")):
+    if values is None:
+        values = value_columns(quantification_df)
+    keys = [column for column in by if column in quantification_df.columns] + [x, hue]
+    # The groups in the order of the dataframe, so the first condition is the one the others are compared to
+    grouped = quantification_df.groupby(keys, sort=False)
+    groups = list(grouped.groups)
+    n_groups, n_values = len(groups), len(values)
+    table = quantification_df[list(values)].to_numpy(float)
+    group_index = grouped.ngroup().to_numpy()
+
+    rng = np.random.default_rng(seed)
+    means = np.full((n_groups, n_values), np.nan)
+    counts = np.zeros((n_groups, n_values), dtype=int)
+    resampled_means = np.full((n_groups, n_resamples, n_values), np.nan)
+    for g in range(n_groups):
+        group_table = table[group_index == g]
+        present = ~np.isnan(group_table)
+        counts[g] = present.sum(axis=0)
+        # Value columns with the same missing rows share their resamples
+        patterns, pattern_of_column = np.unique(present.T, axis=0, return_inverse=True)
+        for pattern, columns in zip(patterns, pattern_of_column.reshape(-1)[None, :] == np.arange(len(patterns))[:, None]):
+            n = int(pattern.sum())
+            if n == 0:
+                continue
+            pattern_values = group_table[pattern][:, columns]
+            means[g, columns] = pattern_values.mean(axis=0)
+            # How often every row is drawn in every resample
+            drawn_rows = rng.integers(0, n, (n_resamples, n)) + np.arange(n_resamples)[:, None] * n
+            draws = np.bincount(drawn_rows.ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+            resampled_means[g][:, columns] = (draws @ pattern_values) / n
+
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # Groups without any value of a value of interest have no interval
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, upper = np.nanquantile(resampled_means, [alpha, 1 - alpha], axis=1)
+
+        # Difference of the means of the later group minus the earlier one, e.g. "hypoxy" - "normal", with the same settings and x value
+        pairs = [(i, j) for i, j in combinations(range(n_groups), 2) if groups[i][:-1] == groups[j][:-1]]
+        first, second = np.array([i for i, _ in pairs], dtype=np.intp), np.array([j for _, j in pairs], dtype=np.intp)
+        differences = means[second] - means[first]
+        # A single condition has nothing to compare
+        difference_lower, difference_upper = np.nanquantile(resampled_means[second] - resampled_means[first], [alpha, 1 - alpha], axis=1) if pairs else (differences, differences)
+
+    group_rows = pd.DataFrame({"Value": np.tile(np.asarray(values, dtype=object), n_groups)})
+    pair_rows = pd.DataFrame({"Value": np.tile(np.asarray(values, dtype=object), len(pairs))})
+    for k, key in enumerate(keys):
+        group_rows[key] = np.repeat([group[k] for group in groups], n_values)
+        pair_rows[key] = np.repeat([groups[j][k] for j in second], n_values)
+    group_rows = group_rows.assign(**{
+        "Compared to": None,
+        "n": counts.ravel(),
+        "n compared": np.nan,
+        "Estimate": means.ravel(),
+        "CI lower": lower.ravel(),
+        "CI upper": upper.ravel(),
+        })
+    pair_rows = pair_rows.assign(**{
+        "Compared to": np.repeat([groups[i][-1] for i in first], n_values),
+        "n": counts[second].ravel(),
+        "n compared": counts[first].ravel(),
+        "Estimate": differences.ravel(),
+        "CI lower": difference_lower.ravel(),
+        "CI upper": difference_upper.ravel(),
+        })
+    summary_df = pd.concat([group_rows, pair_rows], ignore_index=True) if pairs else group_rows
+    summary_df["Confidence level"] = confidence
+    summary_df["Resamples"] = n_resamples
+    return summary_df
+
+
+## Save the bootstrap summary (see ``bootstrap_summary()``) of the quantification of all conditions as "summary_all.csv"
+def save_bootstrap_summary(complete_df, comparison_folder_path, n_resamples=10000, confidence=0.95, seed=0):
+    with instrumentation_jenna.stage("bootstrap summary"):
+        summary_df = bootstrap_summary(complete_df, n_resamples=n_resamples, confidence=confidence, seed=seed)
+    summary_df.to_csv(os.path.join(comparison_folder_path, "summary_all.csv"), index=False)
+    return summary_df
+
+
+## Save the quantification of all conditions as "quantification_all.csv" in "comparison_results/<threshold mode>" of the working directory,
+#   with ``save_summary`` its bootstrap summary "summary_all.csv" next to it.
+# The modes of a threshold sweep are saved in the folder of each mode ("Threshold type" column), ``threshold_mode`` is the one without it.
+# output: list of the folders
+def save_all_conditions(complete_df, threshold_mode):
+    mode_dfs = complete_df.groupby("Threshold type", sort=False) if "Threshold type" in complete_df.columns else [(threshold_mode, complete_df)]
+    comparison_folder_paths = []
+    for mode, mode_df in mode_dfs:
+        comparison_folder_path = os.path.join(wd, "comparison_results", mode)
+        os.makedirs(comparison_folder_path, exist_ok=True)
+        mode_df.to_csv(os.path.join(comparison_folder_path, "quantification_all.csv"), index=False)
+        if save_summary:
+            save_bootstrap_summary(mode_df, comparison_folder_path, bootstrap_resamples, bootstrap_confidence, bootstrap_seed)
+        comparison_folder_paths.append(comparison_folder_path)
+    return comparison_folder_paths
+
+
+## The settings of a threshold sweep (the columns of ``by`` with more than one value): every organoid is quantified with each of them,
+#   so they are plotted separately (and tested separately, see ``welch_tests()``).
+# output: list of (dict of column: setting, dataframe of the setting), a single ({}, ``quantification_df``) without a sweep
+def sweep_settings(quantification_df, by=("Threshold type", "Gaussian filter")):
+    keys = [column for column in by if column in quantification_df.columns and quantification_df[column].nunique() > 1]
+    if not keys:
+        return [({}, quantification_df)]
+    return [(dict(zip(keys, settings)), settings_df.reset_index(drop=True)) for settings, settings_df in quantification_df.groupby(keys, sort=False)]
+
+
+## Part of the file names of the plots of a sweep setting, e.g. "_otsu_gauss_filter_True"
+def settings_suffix(settings):
+    return "".join(f"_gauss_filter_{setting}" if key == "Gaussian filter" else f"_{setting}" for key, setting in settings.items())
+
+
+## The tests (see ``welch_tests()``) of a sweep setting
+def settings_statistics(statistics_df, settings):
+    for key, setting in settings.items():
+        statistics_df = statistics_df[statistics_df[key] == setting]
+    return statistics_df
+
+
+## Significance stars of a p-value: "****" <= 0.0001, "***" <= 0.001, "**" <= 0.01, "*" <= 0.05, "ns" otherwise
+def significance_stars(pvalue):
+    for threshold, stars in [(1e-4, "****"), (1e-3, "***"), (1e-2, "**"), (0.05, "*")]:
+        if pvalue <= threshold:
+            return stars
+    return "ns"
+
+
+## Order of the boxes of a column, like seaborn: numbers sorted, everything else in the order of the dataframe
+def category_order(column):
+    categories = list(pd.unique(column.dropna()))
+    return sorted(categories) if pd.api.types.is_numeric_dtype(column) else categories
+
+
+## Draw the significance stars of precomputed tests (see ``welch_tests()``) of one value of interest above the boxes of a plot.
+# Every pair of boxes gets a bracket with the stars of its corrected p-value, one pair above the other. Only matplotlib is needed.
+def add_precomputed_stat_annotation(ax, statistics_df, quantification_df, x, y, hue=None):
+    value_statistics = statistics_df[(statistics_df["Value"] == y) & statistics_df["p-value corrected"].notna()]
+    if value_statistics.empty:
+        return
+    x_order = category_order(quantification_df[x])
+    hue_order = category_order(quantification_df[hue]) if hue is not None else None
+
+    ## Position of the box of a group on the x axis, seaborn dodges the boxes of the hue values within a width of 0.8
+    def box_position(group):
+        if hue is None:
+            return x_order.index(group)
+        width = 0.8 / len(hue_order)
+        return x_order.index(group[0]) - 0.4 + width * (hue_order.index(group[1]) + 0.5)
+
+    y_min, y_max = quantification_df[y].min(), quantification_df[y].max()
+    step = 0.08 * ((y_max - y_min) or abs(y_max) or 1)
+    level = y_max + step / 2
+    for group_1, group_2, pvalue in zip(value_statistics["Group 1"], value_statistics["Group 2"], value_statistics["p-value corrected"]):
+        x1, x2 = box_position(group_1), box_position(group_2)
+        ax.plot([x1, x1, x2, x2], [level, level + step / 4, level + step / 4, level], color="black", linewidth=1)
+        ax.text((x1 + x2) / 2, level + step / 4, significance_stars(pvalue), ha="center", va="bottom")
+        level += step
+    bottom, top = ax.get_ylim()
+    ax.set_ylim(bottom, max(top, level + step / 2))
+    return
+
+
 ## Sort dataframe by cell line
 # currently not in use
 def sort_df_by_cell_line(quantification_df):
@@ -264,8 +1723,9 @@ def sort_df_by_cell_line(quantification_df):
 ## Plot the boxplots of all the values of interest as individual plots. 
 # for each value, the different cell lines, that are present in a folder of a treatment 
 #   are in seperate boxplots next to each other.   
-# TODO: update this to whatever cell line or condition you want to analyze in ``add_stat_annotation()``
-def box_plt_by_cell_line(quantification_df, value_to_plot, pic_folder_path, condition, threshold_mode, show="True"):
+def box_plt_by_cell_line(quantification_df, value_to_plot, pic_folder_path, condition, threshold_mode, show=True, statistics_df=None):
+    import seaborn as sns
+    import matplotlib.pyplot as plt
     plt.clf()
     sns.set(style="whitegrid")
     sns.set_context("talk")
@@ -288,17 +1748,38 @@ def box_plt_by_cell_line(quantification_df, value_to_plot, pic_folder_path, cond
                         alpha=0.5,
                         linewidth=0.5)
 
-    # Statistical test for significance of the boxplots
-    # Not used for now, 'cuase we don't have different cell lines
-    if 0: 
-        add_stat_annotation(ax, data=quantification_df, x="Cell line", y=value_to_plot, 
-                        box_pairs=[("Control", "Apoe")], 
-                        test="t-test_welch", comparisons_correction=None, text_format="star", loc="outside", verbose=2)
+    # Statistical test for significance of the boxplots, taken from the precomputed tests of all cell line pairs
+    if statistics_df is not None:
+        add_precomputed_stat_annotation(ax, statistics_df, quantification_df, "Cell line", value_to_plot)
 
     plt.savefig(pic_folder_path + "_thresholded_" +
                 threshold_mode + "/plot_" + value_to_plot + "_" + condition + ".png", bbox_inches='tight')
     if show:
         plt.show()
+    # ``catplot()`` opens a new figure every time
+    plt.close("all")
+    return
+
+
+## Use a non-interactive backend in the plotting processes, so nothing is shown on screen.
+def init_plot_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+## Plot the boxplots of all numeric values of interest of a condition.
+# With ``n_workers > 1`` the plots are rendered headless in a process pool, one plot per task.
+def box_plt_all_values(quantification_df, pic_folder_path, condition, threshold_mode, n_workers=1, show=False, statistics_df=None):
+    columns = value_columns(quantification_df)
+    with instrumentation_jenna.stage("plots"):
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=init_plot_worker) as executor:
+                futures = [executor.submit(box_plt_by_cell_line, quantification_df, column, pic_folder_path, condition, threshold_mode, False, statistics_df) for column in columns]
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Plotting"):
+                    future.result()
+        else:
+            for column in tqdm(columns, desc="Plotting"):
+                box_plt_by_cell_line(quantification_df, column, pic_folder_path, condition, threshold_mode, show=show, statistics_df=statistics_df)
     return
 
 
@@ -306,23 +1787,55 @@ def box_plt_by_cell_line(quantification_df, value_to_plot, pic_folder_path, cond
 # Create the boxplots for each treatment within its seperated folder
 def quantification(treatment_list, threshold_mode="triangle_on_dapi_intensity_greater_1_on_rest", gaussian_filter=False, save_mask=False, pic_folder_path=pic_folder_path):
     # Loop through the treatments
-    complete_df = pd.DataFrame()
+    quant_dfs = []
     for treatment in treatment_list:
         # Get the path of the folder containing the images
         pic_sub_folder_path = treatment
         pic_folder_path = os.path.join(wd, pic_sub_folder_path)
-        os.chdir(pic_folder_path)
         print(f"Calculating condition \"" + treatment + "\"")
+        if instrumentation_jenna.enabled:
+            instrumentation_jenna.reset()
 
-        current_quant_df = calculate_values_of_interest(pic_folder_path, treatment_var=treatment, gaussian_filter=gauss_blur_filter, threshold_mode=threshold_mode, save_mask=save_mask_as_files)
-        complete_df = complete_df.append(current_quant_df)
+        if threshold_sweep_modes:
+            current_quant_dfs = threshold_sweep(pic_folder_path, treatment_var=treatment, threshold_modes=threshold_sweep_modes, gaussian_filters=threshold_sweep_gaussian_filters, save_mask=save_mask_as_files)
+        elif histogram_only:
+            current_quant_dfs = {threshold_mode: calculate_values_from_histograms(pic_folder_path, treatment_var=treatment, gaussian_filter=gauss_blur_filter, threshold_mode=threshold_mode)}
+        elif tiled_processing:
+            current_quant_dfs = {threshold_mode: calculate_values_of_interest_tiled(pic_folder_path, treatment_var=treatment, gaussian_filter=gauss_blur_filter, threshold_mode=threshold_mode, save_mask=save_mask_as_files, save_thresholded=save_thresholded_images, memory_budget_mb=memory_budget_mb)}
+        elif fused_pipeline:
+            current_quant_dfs = {threshold_mode: calculate_values_of_interest_from_raw(pic_folder_path, treatment_var=treatment, gaussian_filter=gauss_blur_filter, threshold_mode=threshold_mode, save_mask=save_mask_as_files, save_thresholded=save_thresholded_images)}
+        else:
+            current_quant_dfs = {threshold_mode: calculate_values_of_interest(pic_folder_path, treatment_var=treatment, gaussian_filter=gauss_blur_filter, threshold_mode=threshold_mode, save_mask=save_mask_as_files)}
 
-        for column in complete_df.select_dtypes(include=[float, int]):
-            box_plt_by_cell_line(current_quant_df, column, pic_folder_path, treatment, threshold_mode, show="False")
+        # The test only depends on the raw images, it's done once and saved for every mode
+        if randomization_test:
+            modes = list(current_quant_dfs)
+            randomization_df = randomization_tests(pic_folder_path, treatment_var=treatment, threshold_mode=modes[0], gaussian_filter=gauss_blur_filter, n_permutations=randomization_permutations,
+                                                   block_size=randomization_block_size, seed=randomization_seed, n_workers=randomization_workers)
+            for mode in modes[1:]:
+                randomization_df.to_csv(pic_folder_path + "_thresholded_" + mode + "/randomization.csv", index=False)
+
+        for mode, current_quant_df in current_quant_dfs.items():
+            quant_dfs.append(current_quant_df)
+
+            # Test all cell lines of the condition against each other at once
+            with instrumentation_jenna.stage("statistics"):
+                statistics_df = welch_tests(current_quant_df, x="Cell line", correction=statistics_correction)
+                statistics_df.to_csv(pic_folder_path + "_thresholded_" + mode + "/statistics.csv", index=False)
+
+            if make_plots:
+                # The blur settings of a threshold sweep get plots of their own
+                for settings, settings_df in sweep_settings(current_quant_df):
+                    box_plt_all_values(settings_df, pic_folder_path, treatment + settings_suffix(settings), mode, n_workers=plot_workers, statistics_df=settings_statistics(statistics_df, settings))
+
+        # One run report for everything done for the condition, next to each of its "quantification.csv" files
+        if instrumentation_jenna.enabled:
+            for mode in current_quant_dfs:
+                instrumentation_jenna.write_report(pic_folder_path + "_thresholded_" + mode, condition=treatment, threshold_modes=list(current_quant_dfs),
+                                                   organoids=len(current_quant_dfs[mode]))
 
         print("########################################################################\n\n\n")
-    return complete_df
-complete_df = quantification(treatment_list, threshold_mode, gaussian_filter=False, save_mask=False)
+    return pd.concat(quant_dfs, ignore_index=True)
 
 
 
@@ -330,14 +1843,16 @@ complete_df = quantification(treatment_list, threshold_mode, gaussian_filter=Fal
 # TODO: change the conditions/cell lines to whatever you want to analyze
 # The Plots from above, but now with the different treatments/conditions as hues
 # - this way the treatments/conditions can be compared side by side.
-def box_plt_by_cell_line_comparison(quantification_df, x_value_to_plot, y_value_to_plot, threshold_mode, hue=None, pic_folder_path=pic_folder_path, show=True, save=True): 
+# With ``statistics_df`` (see ``welch_tests()``) the precomputed tests and their pairs are used instead of the ``box_pairs`` below.
+# The dataframe itself is saved as "quantification_all.csv" by ``save_all_conditions()``, ``plot_suffix`` is added to the name of the plot.
+def box_plt_by_cell_line_comparison(quantification_df, x_value_to_plot, y_value_to_plot, threshold_mode, hue=None, pic_folder_path=pic_folder_path, show=True, save=True, statistics_df=None, plot_suffix=""): 
     if not os.path.isdir(pic_folder_path + "/../comparison_results" ):
         os.mkdir(pic_folder_path + "/../comparison_results")
     if not os.path.isdir(pic_folder_path + "/../comparison_results/" + threshold_mode ):
         os.mkdir(pic_folder_path + "/../comparison_results/" + threshold_mode)
 
-    # Save the given dataframe as a csv file
-    complete_df.to_csv(pic_folder_path + "/../comparison_results/" + threshold_mode + "/quantification_all.csv", index=False)
+    import seaborn as sns
+    import matplotlib.pyplot as plt
 
     box_pairs=[]
     if x_value_to_plot == "Cell line":
@@ -381,32 +1896,69 @@ def box_plt_by_cell_line_comparison(quantification_df, x_value_to_plot, y_value_
                         linewidth=0.5,
                         alpha=0.5)
 
-    add_stat_annotation(plot, data=quantification_df, x=x_value_to_plot, y=y_value_to_plot,
-                        hue=hue,
-                        box_pairs=box_pairs,
-                        test="t-test_welch", comparisons_correction=None, text_format="star", loc="outside", verbose=2)
+    # Without precomputed tests: Welch's t-tests of the ``box_pairs`` above, uncorrected
+    if statistics_df is None:
+        statistics_df = welch_tests(quantification_df, x=x_value_to_plot, hue=hue, box_pairs=box_pairs, values=[y_value_to_plot], correction=None)
+    add_precomputed_stat_annotation(plot, statistics_df, quantification_df, x_value_to_plot, y_value_to_plot, hue=hue)
     handles, labels = plot.get_legend_handles_labels()
     if hue == "Condition":
         plt.legend(handles[len(treatment_list):], labels[len(treatment_list):], bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
     if hue == "Cell line":
         plt.legend(handles[4:], labels[4:], bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
     if save:
-        plt.savefig(pic_folder_path + "/../comparison_results/" + threshold_mode + "/plot_" + y_value_to_plot + "_all_cell_lines_and_conditions" + ".png", bbox_inches='tight')
+        plt.savefig(pic_folder_path + "/../comparison_results/" + threshold_mode + "/plot_" + y_value_to_plot + "_all_cell_lines_and_conditions" + plot_suffix + ".png", bbox_inches='tight')
     if show:
         plt.show()
+    plt.close("all")
     return
 
-# Set the value to plot
-x_value_to_plot = "Condition"
-if x_value_to_plot == "Condition":
-    ori_complete_df = complete_df
-    hue = None
-if x_value_to_plot == "Cell line":
-    hue = "Condition"
-
-# Alternative plots
-if 0: 
-    x_value_to_plot = "Cell line"
-    hue = "Condition"
-    for column in complete_df.select_dtypes(include=[float, int]):
-        box_plt_by_cell_line_comparison(complete_df, x_value_to_plot, column, threshold_mode, hue=hue, show=False, save=True)
+## Comparison plots of all values of interest of all conditions, with the tests of all of them computed at once.
+# The tests are saved as "statistics_all.csv" next to "quantification_all.csv" in the "comparison_results" folder.
+# The modes of a threshold sweep are plotted into the folder of each mode (like ``save_all_conditions()``), its blur settings separately.
+def box_plt_all_comparisons(complete_df, threshold_mode, x_value_to_plot="Cell line", hue="Condition", pic_folder_path=pic_folder_path, show=False):
+    statistics_df = welch_tests(complete_df, x=x_value_to_plot, hue=hue, correction=statistics_correction)
+    for settings, settings_df in sweep_settings(complete_df):
+        mode = settings.get("Threshold type", threshold_mode)
+        plot_suffix = settings_suffix({key: setting for key, setting in settings.items() if key != "Threshold type"})
+        for column in value_columns(settings_df):
+            box_plt_by_cell_line_comparison(settings_df, x_value_to_plot, column, mode, hue=hue, pic_folder_path=pic_folder_path, show=show, save=True,
+                                            statistics_df=settings_statistics(statistics_df, settings), plot_suffix=plot_suffix)
+    for settings, mode_df in sweep_settings(complete_df, by=("Threshold type",)):
+        mode = settings.get("Threshold type", threshold_mode)
+        settings_statistics(statistics_df, settings).to_csv(pic_folder_path + "/../comparison_results/" + mode + "/statistics_all.csv", index=False)
+    return statistics_df
+
+## Plot the conditions again from their saved results (see ``load_saved_quantifications()``), without quantifying them again.
+# output: dataframe of all conditions
+def plot_saved_quantifications(treatment_list, threshold_mode, n_workers=1, show=False):
+    quant_dfs = []
+    for treatment in treatment_list:
+        pic_folder_path = os.path.join(wd, treatment)
+        quantification_df = load_saved_quantifications([treatment], threshold_mode)
+        quant_dfs.append(quantification_df)
+
+        statistics_df = welch_tests(quantification_df, x="Cell line", correction=statistics_correction)
+        statistics_df.to_csv(pic_folder_path + "_thresholded_" + threshold_mode + "/statistics.csv", index=False)
+        for settings, settings_df in sweep_settings(quantification_df):
+            box_plt_all_values(settings_df, pic_folder_path, treatment + settings_suffix(settings), threshold_mode, n_workers=n_workers, show=show, statistics_df=settings_statistics(statistics_df, settings))
+    return pd.concat(quant_dfs, ignore_index=True)
+
+if __name__ == "__main__":
+    if instrumentation:
+        instrumentation_jenna.enable()
+    complete_df = quantification(treatment_list, threshold_mode, gaussian_filter=False, save_mask=False)
+    save_all_conditions(complete_df, threshold_mode)
+
+    # Set the value to plot
+    x_value_to_plot = "Condition"
+    if x_value_to_plot == "Condition":
+        ori_complete_df = complete_df
+        hue = None
+    if x_value_to_plot == "Cell line":
+        hue = "Condition"
+
+    # Alternative plots
+    if 0: 
+        x_value_to_plot = "Cell line"
+        hue = "Condition"
+        box_plt_all_comparisons(complete_df, threshold_mode, x_value_to_plot, hue=hue)
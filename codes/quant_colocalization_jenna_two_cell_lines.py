@@ -314,7 +314,7 @@ def quantification(treatment_list, threshold_mode="triangle_on_dapi_intensity_gr
         print(f"Calculating condition \"" + treatment + "\"")
 
         current_quant_df = calculate_values_of_interest(pic_folder_path, treatment_var=treatment, gaussian_filter=gauss_blur_filter, threshold_mode=threshold_mode, save_mask=save_mask_as_files)
-        complete_df = complete_df.append(current_quant_df)
+        complete_df = pd.concat([complete_df, current_quant_df])
 
         for column in complete_df.select_dtypes(include=[float, int]):
             box_plt_by_cell_line(current_quant_df, column, pic_folder_path, treatment, threshold_mode, show="False")
@@ -0,0 +1,108 @@
+"""
+Write synthetic organoid images, that look like the microscope's output: four greyscale ``.tif``-files per organoid
+("C1-<cell line>_<organoid number>.tif" ... "C4-<cell line>_<organoid number>.tif").
+Each organoid is an elliptic tissue area with nuclei in the DAPI channel (``ch3``) and spotty marker signal in the other
+channels, which partly overlaps, on top of dim background noise.
+They can be thresholded and quantified like the real images, e.g. for benchmarks or to try the scripts without the lab share.
+
+Copyright (c) 2022, Maximilian Otto, Berlin.
+"""
+# ----------------------------------------------------------------------------------------------- #
+# Folder, in which the condition folder with the synthetic images will be created
+wd = "S:/mdc_work/jenna"
+condition_folder_name = "synthetic"
+
+cell_lines = ["Control", "Apoe"]
+organoids_per_cell_line = 5
+
+## Image properties
+image_size = (1024, 1024)   # (height, width) in pixels
+bit_depth = 8               # 8 or 16
+sparsity = 0.1              # Fraction of the organoid's area covered by each marker
+colocalization = 0.5        # Fraction of a marker's spots, that are shared with the other markers
+seed = 0                    # Same seed, same images
+
+file_format = ".tif"
+
+## Names of the markers as in the file names.
+ch_prefix = "C"
+ch1_suffix = "1"
+ch2_suffix = "2"
+ch3_suffix = "3"
+ch4_suffix = "4"
+# ----------------------------------------------------------------------------------------------- #
+
+import os
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+## Elliptic tissue area of an organoid
+# output: boolean mask
+def organoid_area(rng, height, width):
+    area = np.zeros((height, width), dtype=np.uint8)
+    center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+    axes = (int(width * rng.uniform(0.25, 0.4)), int(height * rng.uniform(0.25, 0.4)))
+    cv2.ellipse(area, center, axes, rng.uniform(0, 180), 0, 360, 1, -1)
+    return area > 0
+
+## Round spots at random positions within the area, until about ``coverage`` of it is covered
+# output: boolean mask
+def random_spots(rng, area, coverage, radius):
+    spots = np.zeros(area.shape, dtype=np.uint8)
+    ys, xs = np.nonzero(area)
+    if len(ys) == 0 or coverage <= 0:
+        return spots > 0
+    n_spots = max(1, int(coverage * len(ys) / (np.pi * radius ** 2)))
+    for i in rng.choice(len(ys), size=n_spots):
+        cv2.circle(spots, (int(xs[i]), int(ys[i])), int(rng.integers(max(1, radius // 2), radius + 1)), 1, -1)
+    return (spots > 0) & area
+
+## Intensities of a channel: bright signal with some texture, dim noise everywhere else
+def channel_intensities(rng, signal, bit_depth):
+    max_value = 2 ** bit_depth - 1
+    img = rng.normal(0.02, 0.01, signal.shape)
+    img[signal] = rng.normal(0.5, 0.15, np.count_nonzero(signal))
+    img = cv2.GaussianBlur(img, (3, 3), 0)
+    img = np.clip(img * max_value, 0, max_value)
+    return img.astype(np.uint8 if bit_depth == 8 else np.uint16)
+
+## The four channels of one organoid
+# output: ch1, ch2, ch3 (DAPI), ch4
+def synthetic_organoid(rng, image_size=(1024, 1024), bit_depth=8, sparsity=0.1, colocalization=0.5):
+    height, width = image_size
+    area = organoid_area(rng, height, width)
+    radius = max(2, min(height, width) // 150)
+
+    # Nuclei cover most of the tissue
+    dapi = random_spots(rng, area, 0.6, radius * 2)
+    # Spots, that all markers have in common, and the ones of each marker alone
+    shared = random_spots(rng, area, sparsity * colocalization, radius)
+    markers = [shared | random_spots(rng, area, sparsity * (1 - colocalization), radius) for _ in range(3)]
+
+    ch1, ch2, ch4 = [channel_intensities(rng, marker, bit_depth) for marker in markers]
+    ch3 = channel_intensities(rng, dapi, bit_depth)
+    return ch1, ch2, ch3, ch4
+
+## Write a whole condition folder of synthetic organoids
+# output: list of the "C1"-file names
+def write_synthetic_condition(pic_folder_path, cell_lines=("Control", "Apoe"), organoids_per_cell_line=5, image_size=(1024, 1024), bit_depth=8, sparsity=0.1, colocalization=0.5, seed=0):
+    if bit_depth not in (8, 16):
+        raise ValueError(f"Only 8 and 16 bit images are supported, not {bit_depth}")
+    if not os.path.isdir(pic_folder_path):
+        os.makedirs(pic_folder_path)
+
+    # Independent random streams per organoid, so the images don't depend on how many are written
+    names = [f"{cell_line}_{organoid}" for cell_line in cell_lines for organoid in range(1, organoids_per_cell_line + 1)]
+    streams = np.random.SeedSequence(seed).spawn(len(names))
+
+    files = []
+    for name, stream in tqdm(zip(names, streams), total=len(names), desc="Writing synthetic organoids"):
+        channels = synthetic_organoid(np.random.default_rng(stream), image_size, bit_depth, sparsity, colocalization)
+        for suffix, ch in zip([ch1_suffix, ch2_suffix, ch3_suffix, ch4_suffix], channels):
+            cv2.imwrite(os.path.join(pic_folder_path, f"{ch_prefix}{suffix}-{name}{file_format}"), ch)
+        files.append(os.path.join(pic_folder_path, f"{ch_prefix}{ch1_suffix}-{name}{file_format}"))
+    return files
+
+if __name__ == "__main__":
+    write_synthetic_condition(os.path.join(wd, condition_folder_name), cell_lines, organoids_per_cell_line, image_size, bit_depth, sparsity, colocalization, seed)
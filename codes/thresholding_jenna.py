@@ -15,10 +15,35 @@ threshold_mode = "otsu"
 #  - "otsu",
 #  - "triangle",
 #  - "adaptive"
+#  - "costes" (Costes' automatic thresholds of the marker pairs, Otsu on DAPI)
+
+## Z-stacks (multi-page TIFF files, one page per plane) are thresholded plane by plane, only one plane of every channel is in memory.
+# The thresholded stacks are saved as multi-page TIFF files again. Needs the ``tifffile`` package.
+#  - "volume": every channel gets one threshold for the whole stack, from the histogram of all its planes
+#              ("adaptive" is a local threshold anyway, "costes" isn't available)
+#  - "planes": every plane is thresholded on its own, like a single image
+z_stack_mode = "volume"
 
 # Want to apply a gaussian blur filter too?
 gauss_blur_filter = False
 
+# Number of organoids, that are thresholded in parallel (one worker process per organoid).
+# 1 processes the organoids one after another.
+n_workers = 1
+
+# Only threshold new or changed organoids. A manifest in the output folder keeps track of the processed ones.
+# Set to True to compare the raw images by their content (sha256) instead of file size and modification time.
+manifest_hash_inputs = False
+
+# Number of organoids, that are read ahead in background threads, while the current one is thresholded.
+# The reads from the (network) drive overlap with the computation then. 0 reads every organoid when it's needed.
+prefetch_organoids = 2
+# Number of organoids, whose thresholded images wait to be written by a background thread. 0 writes them right away.
+queued_writes = 4
+
+# Record the time, bytes read/written and peak memory of every stage per organoid, saved as "thresholding_run_report.json" in the output folder.
+instrumentation = False
+
 file_format = ".tif"
 
 ## Names of the markers as in the file names.
@@ -31,12 +56,14 @@ ch4_suffix = "4"
 
 # ----------------------------------------------------------------------------------------------- #
 
-import os, glob
+import os, glob, json, hashlib, threading
+from itertools import islice
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import cv2
+import numpy as np
 from tqdm import tqdm
-
-pic_folder_path = os.path.join(wd, folders_list[0])
-os.chdir(pic_folder_path)
+import instrumentation_jenna
 
 ## Read a file
 # input: "file name" string
@@ -45,125 +72,833 @@ def read_image(file):
     img = cv2.imread(file, -1)
     return img
 
+## File names of the 4 color channels of an organoid, given the one of its first channel (``C1``).
+# Only the file name is changed, not the folders. ``prefix`` and ``suffixes`` are the ones of the configuration, if they aren't given
+#   (e.g. by the engine, see "engine_jenna.py").
+def channel_file_names(file_name, prefix = None, suffixes = None):
+    prefix = ch_prefix if prefix is None else prefix
+    suffixes = (ch1_suffix, ch2_suffix, ch3_suffix, ch4_suffix) if suffixes is None else suffixes
+    folder, name = os.path.split(file_name)
+    return [os.path.join(folder, name.replace(prefix + suffixes[0], prefix + suffix)) for suffix in suffixes]
+
 ## Read 4 corresponding greyscale images
-def read_4_color_channels(file_name):
-    base_channel = ch_prefix + ch1_suffix
-    ch1 = cv2.imread(file_name, -1)
-    ch2 = cv2.imread(file_name.replace(base_channel, ch_prefix + ch2_suffix), -1)
-    ch3 = cv2.imread(file_name.replace(base_channel, ch_prefix + ch3_suffix), -1)
-    ch4 = cv2.imread(file_name.replace(base_channel, ch_prefix + ch4_suffix), -1)
+def read_4_color_channels(file_name, prefix = None, suffixes = None):
+    file_names = channel_file_names(file_name, prefix, suffixes)
+    with instrumentation_jenna.stage("read raw images"):
+        ch1 = cv2.imread(file_names[0], -1)
+        ch2 = cv2.imread(file_names[1], -1)
+        ch3 = cv2.imread(file_names[2], -1)
+        ch4 = cv2.imread(file_names[3], -1)
+        instrumentation_jenna.file_read(*file_names)
+    for name, ch in zip(file_names, (ch1, ch2, ch3, ch4)):
+        if ch is None:
+            raise FileNotFoundError(f"Could not read {name}")
+    return ch1, ch2, ch3, ch4
+
+## Apply a Gaussian blur filter to every color channel of the image.
+def gaussian_blur_channels(ch1, ch2, ch3, ch4):
+    with instrumentation_jenna.stage("gaussian blur"):
+        ch1 = cv2.GaussianBlur(ch1, (5, 5), 0)
+        ch2 = cv2.GaussianBlur(ch2, (5, 5), 0)
+        ch3 = cv2.GaussianBlur(ch3, (5, 5), 0)
+        ch4 = cv2.GaussianBlur(ch4, (5, 5), 0)
     return ch1, ch2, ch3, ch4
 
+## Threshold a channel with Otsu's or the triangle method, every intensity <= threshold is set to 0.
+# 8-bit images are thresholded by OpenCV. ``cv2.THRESH_TRIANGLE`` rejects 16-bit images, so they get the threshold of
+#   their full histogram (65536 bins, see ``otsu_threshold_from_histogram()``) instead, at their native bit depth.
+def automatic_threshold(ch, method = "otsu"):
+    if ch.dtype == np.uint8:
+        _, th = cv2.threshold(ch, 0, 255, cv2.THRESH_TOZERO + (cv2.THRESH_OTSU if method == "otsu" else cv2.THRESH_TRIANGLE))
+        return th
+    hist = channel_histogram(ch)
+    threshold = otsu_threshold_from_histogram(hist) if method == "otsu" else triangle_threshold_from_histogram(hist)
+    _, th = cv2.threshold(ch, threshold, 0, cv2.THRESH_TOZERO)
+    return th
+
+## Adaptive threshold: a pixel is set to the maximum intensity, if it is brighter than the mean of its ``block_size`` x ``block_size`` neighbourhood, to 0 otherwise.
+# ``cv2.adaptiveThreshold()`` only takes 8-bit images, the 16-bit ones are compared to the mean of a box filter the same way
+#   (same rounding and border handling), so the result is the same as for an 8-bit image with the same intensities.
+def adaptive_threshold(ch, block_size = 21):
+    if ch.dtype == np.uint8:
+        return cv2.adaptiveThreshold(ch, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, block_size, 0)
+    mean = cv2.boxFilter(ch, -1, (block_size, block_size), borderType=cv2.BORDER_REPLICATE | cv2.BORDER_ISOLATED)
+    th = np.zeros_like(ch)
+    th[ch > mean] = np.iinfo(ch.dtype).max
+    return th
+
+## Costes' automatic thresholds of a pair of channels (Costes et al. 2004).
+# The intensities of b are fitted to the ones of a by an orthogonal regression. Starting at the brightest intensities, the threshold
+#   of a (and the one of b on the regression line) is lowered, until Pearson's r of the pixels below both thresholds drops to <= 0.
+# Every pixel is counted once into a joint histogram of ``n_bins`` x ``n_bins`` bins (16-bit intensities are binned), the sums for r
+#   below every pair of thresholds are read from its cumulative sums, so all thresholds are tried at once instead of one pass each.
+# output: thresholds of a and b, every intensity <= threshold is set to 0 (like ``cv2.THRESH_TOZERO``).
+#   ``None``, if the channels aren't positively correlated (no regression line with a positive slope).
+def costes_thresholds(ch_a, ch_b, n_bins = 256):
+    levels = np.iinfo(ch_a.dtype).max + 1
+    shift = max(0, (levels - 1).bit_length() - (n_bins - 1).bit_length())
+    n_bins = levels >> shift
+    a, b = ch_a.ravel(), ch_b.ravel()
+    joint_bins = (a >> shift).astype(np.intp) * n_bins + (b >> shift)
+    counts = np.bincount(joint_bins, minlength=n_bins * n_bins).astype(np.float64)
+    # Sums per bin: number of pixels, a, b, a², b², a * b
+    if shift == 0:
+        bin_a = np.arange(n_bins, dtype=np.float64)[:, None]
+        bin_b = np.arange(n_bins, dtype=np.float64)[None, :]
+        counts = counts.reshape(n_bins, n_bins)
+        sums = np.stack([counts, counts * bin_a, counts * bin_b, counts * bin_a ** 2, counts * bin_b ** 2, counts * bin_a * bin_b])
+    else:
+        a, b = a.astype(np.float64), b.astype(np.float64)
+        sums = np.stack([counts] + [np.bincount(joint_bins, weights, minlength=n_bins * n_bins) for weights in (a, b, a * a, b * b, a * b)])
+        sums = sums.reshape(6, n_bins, n_bins)
+
+    n, sum_a, sum_b, sum_aa, sum_bb, sum_ab = sums.sum(axis=(1, 2))
+    variance_a = sum_aa / n - (sum_a / n) ** 2
+    variance_b = sum_bb / n - (sum_b / n) ** 2
+    covariance = sum_ab / n - sum_a * sum_b / n ** 2
+    if not covariance > 0:
+        return None
+    slope = (variance_b - variance_a + np.sqrt((variance_b - variance_a) ** 2 + 4 * covariance ** 2)) / (2 * covariance)
+    intercept = sum_b / n - slope * sum_a / n
+
+    # below[:, k, m]: sums of the pixels in the bins of a < k and of b < m
+    below = np.zeros((6, n_bins + 1, n_bins + 1))
+    below[:, 1:, 1:] = sums.cumsum(axis=1).cumsum(axis=2)
+    bin_a_thresholds = np.arange(1, n_bins + 1)
+    bin_b_thresholds = np.clip(np.ceil((slope * (bin_a_thresholds << shift) + intercept) / (1 << shift)), 0, n_bins).astype(np.intp)
+    n, sum_a, sum_b, sum_aa, sum_bb, sum_ab = below[:, bin_a_thresholds, bin_b_thresholds]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (sum_ab - sum_a * sum_b / n) / np.sqrt((sum_aa - sum_a ** 2 / n) * (sum_bb - sum_b ** 2 / n))
+    # The highest thresholds with r <= 0, the lowest ones if r never drops to 0
+    candidates = np.flatnonzero(r <= 0)
+    k = candidates[-1] if len(candidates) else 0
+    return max(int(bin_a_thresholds[k] << shift) - 1, 0), max(int(bin_b_thresholds[k] << shift) - 1, 0)
+
+## Costes' thresholds of the markers ch1, ch2 and ch4: every marker gets the mean of its thresholds of the pairs with the other two.
+# A pair, that isn't positively correlated, has no Costes' thresholds, Otsu's thresholds of both channels are used for it instead.
+# output: thresholds of ch1, ch2 and ch4
+def costes_marker_thresholds(ch1, ch2, ch4):
+    markers = [ch1, ch2, ch4]
+    pair_thresholds = [[], [], []]
+    for i, j in [(0, 1), (0, 2), (1, 2)]:
+        thresholds = costes_thresholds(markers[i], markers[j])
+        if thresholds is None:
+            thresholds = otsu_threshold_from_histogram(channel_histogram(markers[i])), otsu_threshold_from_histogram(channel_histogram(markers[j]))
+        pair_thresholds[i].append(thresholds[0])
+        pair_thresholds[j].append(thresholds[1])
+    return [int(round(np.mean(thresholds))) for thresholds in pair_thresholds]
+
+## Threshold the 4 color channels of an organoid in memory.
+# input: 4 greyscale images (8 or 16-bit) and the threshold mode
+# The input images are never changed, so they can be thresholded with several modes one after another.
+# The thresholded images keep the bit depth of the input images, intensities are never scaled or converted.
+def apply_threshold(ch1, ch2, ch3, ch4, mode = "low_intensities_filtered"):
+    if mode == "triangle":
+        # Apply triangle thresholding to every channel
+        th1 = automatic_threshold(ch1, "triangle")
+        th2 = automatic_threshold(ch2, "triangle")
+        th3 = automatic_threshold(ch3, "triangle")
+        th4 = automatic_threshold(ch4, "triangle")
+
+    if mode == "adaptive":
+        # Apply adaptive thresholding to every channel
+        th1 = adaptive_threshold(ch1)
+        th2 = adaptive_threshold(ch2)
+        th3 = adaptive_threshold(ch3)
+        th4 = adaptive_threshold(ch4)
+
+    if mode == "otsu":
+        # Apply Otsu's thresholding to every channel
+        th1 = automatic_threshold(ch1, "otsu")
+        th2 = automatic_threshold(ch2, "otsu")
+        th3 = automatic_threshold(ch3, "otsu")
+        th4 = automatic_threshold(ch4, "otsu")
+
+    if mode == "costes":
+        # Apply Costes' thresholds to the markers, they depend on each other pair by pair
+        # Apply Otsu's thresholding to the DAPI channel, it isn't part of the colocalization
+        threshold1, threshold2, threshold4 = costes_marker_thresholds(ch1, ch2, ch4)
+        _, th1 = cv2.threshold(ch1, threshold1, 0, cv2.THRESH_TOZERO)
+        _, th2 = cv2.threshold(ch2, threshold2, 0, cv2.THRESH_TOZERO)
+        th3 = automatic_threshold(ch3, "otsu")
+        _, th4 = cv2.threshold(ch4, threshold4, 0, cv2.THRESH_TOZERO)
+
+    if mode == "otsu_on_dapi_only":
+        # Apply Otsu's thresholding to only the DAPI channel, the other channels are passed on as they are (no copies)
+        th1 = ch1
+        th2 = ch2
+        th3 = automatic_threshold(ch3, "otsu")
+        th4 = ch4
+
+    if mode == "otsu_on_dapi_intensity_greater_1_on_rest":
+        # Apply Otsu's thresholding to only the DAPI channel
+        # Every value >1 remains the same, every value <=1 is set to 0
+        _, th1 = cv2.threshold(ch1, 1, 255, cv2.THRESH_TOZERO)
+        _, th2 = cv2.threshold(ch2, 1, 255, cv2.THRESH_TOZERO)
+        th3 = automatic_threshold(ch3, "otsu")
+        _, th4 = cv2.threshold(ch4, 1, 255, cv2.THRESH_TOZERO)
+
+    if mode == "triangle_on_dapi_intensity_greater_1_on_rest":
+        # Apply triangle thresholding to only the first channel
+        th1 = automatic_threshold(ch1, "triangle")
+        # Every value >1 remains the same, every value <=1 is set to 0
+        _, th2 = cv2.threshold(ch2, 1, 255, cv2.THRESH_TOZERO)
+        _, th3 = cv2.threshold(ch3, 1, 255, cv2.THRESH_TOZERO)
+        _, th4 = cv2.threshold(ch4, 1, 255, cv2.THRESH_TOZERO)
+
+    if mode == "super_low_intensities_filtered":
+        # Every value >1 remains the same, every value <=1 is set to 0
+        _, th1 = cv2.threshold(ch1, 1, 255, cv2.THRESH_TOZERO)
+        _, th2 = cv2.threshold(ch2, 1, 255, cv2.THRESH_TOZERO)
+        _, th3 = cv2.threshold(ch3, 1, 255, cv2.THRESH_TOZERO)
+        _, th4 = cv2.threshold(ch4, 1, 255, cv2.THRESH_TOZERO)
+
+    if mode == "low_intensities_filtered":
+        # Every value >4 remains the same, every value <=4 is set to 0
+        _, th1 = cv2.threshold(ch1, 4, 255, cv2.THRESH_TOZERO)
+        _, th2 = cv2.threshold(ch2, 4, 255, cv2.THRESH_TOZERO)
+        _, th3 = cv2.threshold(ch3, 4, 255, cv2.THRESH_TOZERO)
+        _, th4 = cv2.threshold(ch4, 4, 255, cv2.THRESH_TOZERO)
+
+    return th1, th2, th3, th4
+
+## Name of a thresholded image, as it is saved in the "<folder>_thresholded_<mode>" folder.
+# ``image_format`` is the file format of the raw images, ``file_format`` of the configuration if not given
+def thresholded_file_name(file, mode, gaussian_blur, image_format=None):
+    image_format = image_format or file_format
+    return os.path.basename(file.replace(image_format, f"_gauss_filter_{gaussian_blur}_{mode}_thresholded{image_format}"))
+
+## Save the 4 thresholded color channels of an organoid.
+# input: "file name" string of the organoid's first channel (``C1``)
+# ``prefix``, ``suffixes`` (see ``channel_file_names()``) and ``image_format`` (see ``thresholded_file_name()``) are the ones of the configuration, if they aren't given.
+def save_thresholded_channels(file, th1, th2, th3, th4, output_folder_path, mode, gaussian_blur, prefix = None, suffixes = None, image_format = None):
+    output_names = [thresholded_file_name(name, mode, gaussian_blur, image_format) for name in channel_file_names(file, prefix, suffixes)]
+    with instrumentation_jenna.stage("write thresholded images"):
+        for name, th in zip(output_names, (th1, th2, th3, th4)):
+            cv2.imwrite(os.path.join(output_folder_path, name), th)
+        instrumentation_jenna.file_written(*[os.path.join(output_folder_path, name) for name in output_names])
+    return output_names
+
+## Blur (if requested) and threshold the 4 color channels of an organoid in memory.
+def blur_and_threshold(ch1, ch2, ch3, ch4, mode = "low_intensities_filtered", gaussian_blur = True):
+    if gaussian_blur:
+        ch1, ch2, ch3, ch4 = gaussian_blur_channels(ch1, ch2, ch3, ch4)
+
+    with instrumentation_jenna.stage("threshold " + mode):
+        return apply_threshold(ch1, ch2, ch3, ch4, mode)
+
+## Threshold the 4 color channels of a single organoid and save them in the output folder.
+# input: "file name" string of the organoid's first channel (``C1``)
+# Z-stacks are thresholded plane by plane, see ``threshold_stack()``.
+# The settings, that aren't given, are the ones of the configuration (see ``save_thresholded_channels()``).
+# output: names of the 4 saved images
+def threshold_organoid(file, output_folder_path, mode = "low_intensities_filtered", gaussian_blur = True, z_mode = None, prefix = None, suffixes = None, image_format = None):
+    if is_z_stack(file):
+        return threshold_stack(file, output_folder_path, mode, gaussian_blur, z_mode, prefix, suffixes, image_format)
+    return threshold_single_image(file, output_folder_path, mode, gaussian_blur, prefix, suffixes, image_format)
+
+## ``threshold_organoid()`` of an organoid, that is known to be a single image
+def threshold_single_image(file, output_folder_path, mode = "low_intensities_filtered", gaussian_blur = True, prefix = None, suffixes = None, image_format = None):
+    th1, th2, th3, th4 = blur_and_threshold(*read_4_color_channels(file, prefix, suffixes), mode, gaussian_blur)
+    return save_thresholded_channels(file, th1, th2, th3, th4, output_folder_path, mode, gaussian_blur, prefix, suffixes, image_format)
+
+## Future of a function, that was already run in the current thread
+def completed_future(function, *args):
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+## Read organoids ahead on a bounded thread pool, while the current one is processed.
+# ``read(file)`` of the next ``n_ahead`` files runs in the background, cv2 releases the GIL while reading and decoding,
+#   so the reads (e.g. from the network drive) overlap with the computation. At most ``n_ahead + 1`` organoids are in memory.
+# input: list of "file name" strings and the function reading one of them, e.g. ``read_4_color_channels()``
+# output: (file, future) in the order of ``files``. ``future.result()`` returns the read organoid or raises the error of the read.
+def prefetched(files, read = read_4_color_channels, n_ahead = 2):
+    ## Read within the organoid's instrumentation
+    def read_organoid(file):
+        with instrumentation_jenna.organoid(os.path.basename(file)):
+            return read(file)
+
+    if n_ahead < 1:
+        for file in files:
+            yield file, completed_future(read_organoid, file)
+        return
+
+    files = iter(files)
+    with ThreadPoolExecutor(max_workers=n_ahead) as executor:
+        pending = deque((file, executor.submit(read_organoid, file)) for file in islice(files, n_ahead))
+        try:
+            while pending:
+                file, future = pending.popleft()
+                # Keep ``n_ahead`` reads in flight
+                pending.extend((next_file, executor.submit(read_organoid, next_file)) for next_file in islice(files, 1))
+                yield file, future
+        finally:
+            # Stopped early, e.g. by an error of the processing
+            for _, future in pending:
+                future.cancel()
+
+## Write files in a background thread, so the processing doesn't wait for the (network) drive.
+# Writes run one after another, in the order they were submitted. At most ``max_pending`` writes wait in the queue,
+#   further ones block until there's room again, so the memory of the queued images stays bounded.
+# With ``max_pending = 0`` everything is written right away in the calling thread.
+class QueuedWriter:
+    def __init__(self, max_pending = 4):
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=1) if max_pending > 0 else None
+        self.free_slots = threading.Semaphore(max_pending)
+
+    ## Queue ``write(*args)``
+    # output: future of the write, its ``result()`` is the return value of ``write`` or raises its error
+    def submit(self, write, *args):
+        organoid = instrumentation_jenna.current_organoid()
+        ## Write within the organoid's instrumentation
+        def write_organoid():
+            with instrumentation_jenna.organoid(organoid):
+                return write(*args)
+
+        if self.executor is None:
+            return completed_future(write_organoid)
+        self.free_slots.acquire()
+        future = self.executor.submit(write_organoid)
+        future.add_done_callback(lambda _: self.free_slots.release())
+        return future
+
+    ## Wait for all queued writes
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+## Intensity histogram of a greyscale image with one bin per intensity value (256 for 8-bit, 65536 for 16-bit images).
+def channel_histogram(ch):
+    return np.bincount(ch.ravel(), minlength=np.iinfo(ch.dtype).max + 1)
+
+## Folder of the histogram cache, next to the folder of the raw images: "<folder>_histograms"
+def histogram_cache_folder(pic_folder_path):
+    return os.path.abspath(pic_folder_path) + "_histograms"
+
+## Histograms of the 4 raw color channels of an organoid, from the sidecar cache.
+# They are only calculated (and saved) if they aren't in the cache yet, or if any of the 4 raw files changed since then
+#   (size and modification time, see ``input_fingerprint()``).
+# With ``gaussian_blur`` the histograms of the blurred channels are cached seperately. The histograms of a z-stack are the ones of all its planes.
+# input: "file name" string of the organoid's first channel (``C1``)
+def cached_channel_histograms(file, gaussian_blur = False):
+    cache_folder_path = histogram_cache_folder(os.path.dirname(file))
+    if not os.path.isdir(cache_folder_path):
+        os.makedirs(cache_folder_path, exist_ok=True)
+    cache_file = os.path.join(cache_folder_path, os.path.basename(file).replace(file_format, f"_gauss_filter_{gaussian_blur}_histograms.npz"))
+    fingerprint = json.dumps(input_fingerprint(file), sort_keys=True)
+    if os.path.isfile(cache_file):
+        with np.load(cache_file) as cached:
+            if "fingerprint" in cached and str(cached["fingerprint"]) == fingerprint:
+                return cached["ch1"], cached["ch2"], cached["ch3"], cached["ch4"]
+
+    if is_z_stack(file):
+        readers = open_4_color_stacks(file)
+        try:
+            histograms = tuple(accumulate_plane_histograms(readers, gaussian_blur))
+        finally:
+            for reader in readers:
+                reader.close()
+    else:
+        ch1, ch2, ch3, ch4 = read_4_color_channels(file)
+        if gaussian_blur:
+            ch1, ch2, ch3, ch4 = gaussian_blur_channels(ch1, ch2, ch3, ch4)
+        histograms = channel_histogram(ch1), channel_histogram(ch2), channel_histogram(ch3), channel_histogram(ch4)
+    np.savez(cache_file, ch1=histograms[0], ch2=histograms[1], ch3=histograms[2], ch4=histograms[3],
+             fingerprint=fingerprint)
+    return histograms
+
+## Otsu's threshold from a histogram, same as ``cv2.THRESH_OTSU``.
+# Maximizes the between-class variance, class 1 are the intensities <= threshold.
+def otsu_threshold_from_histogram(hist):
+    p = hist / hist.sum()
+    intensities = np.arange(len(hist))
+    q1 = np.cumsum(p)
+    q2 = 1 - q1
+    mu1_cumulative = np.cumsum(intensities * p)
+    mu = mu1_cumulative[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu1 = mu1_cumulative / q1
+        mu2 = (mu - mu1_cumulative) / q2
+        sigma = q1 * q2 * (mu1 - mu2) ** 2
+    eps = np.finfo(np.float32).eps
+    valid = (np.minimum(q1, q2) >= eps) & (np.maximum(q1, q2) <= 1 - eps)
+    sigma = np.where(valid, sigma, 0)
+    if not (sigma > 0).any():
+        return 0
+    return int(np.argmax(sigma))
+
+## Triangle threshold from a histogram, same as ``cv2.THRESH_TRIANGLE``.
+# The line from the histogram's peak to the far end of the histogram is drawn, the threshold is the bin with the largest distance to it.
+def triangle_threshold_from_histogram(hist):
+    n_bins = len(hist)
+    occupied = np.flatnonzero(hist)
+    if len(occupied) == 0:
+        return 0
+    left_bound = max(occupied[0] - 1, 0)
+    right_bound = min(occupied[-1] + 1, n_bins - 1) if occupied[-1] > 0 else 1
+    max_ind = int(np.argmax(hist))
+    is_flipped = max_ind - left_bound < right_bound - max_ind
+    if is_flipped:
+        hist = hist[::-1]
+        left_bound = n_bins - 1 - right_bound
+        max_ind = n_bins - 1 - max_ind
+
+    # Distance (up to a constant factor) of every bin between the bound and the peak to the line
+    a = int(hist[max_ind])
+    b = left_bound - max_ind
+    candidates = np.arange(left_bound + 1, max_ind + 1)
+    distances = a * candidates + b * hist[left_bound + 1:max_ind + 1].astype(np.int64)
+    thresh = left_bound
+    if len(distances) and distances.max() > 0:
+        thresh = int(candidates[np.argmax(distances)])
+    thresh -= 1
+    if is_flipped:
+        thresh = n_bins - 1 - thresh
+    return thresh
+
+## Thresholds of the 4 color channels for a threshold mode, only based on the channels' histograms.
+# Every intensity > threshold remains the same, every intensity <= threshold is set to 0 (like ``cv2.THRESH_TOZERO``).
+# The "adaptive" mode uses local thresholds and the "costes" mode the joint intensities of two channels, they can't be derived from a histogram.
+def histogram_thresholds(hist1, hist2, hist3, hist4, mode = "low_intensities_filtered"):
+    if mode == "triangle":
+        return [triangle_threshold_from_histogram(h) for h in (hist1, hist2, hist3, hist4)]
+    if mode == "otsu":
+        return [otsu_threshold_from_histogram(h) for h in (hist1, hist2, hist3, hist4)]
+    if mode == "otsu_on_dapi_only":
+        return [0, 0, otsu_threshold_from_histogram(hist3), 0]
+    if mode == "otsu_on_dapi_intensity_greater_1_on_rest":
+        return [1, 1, otsu_threshold_from_histogram(hist3), 1]
+    if mode == "triangle_on_dapi_intensity_greater_1_on_rest":
+        return [triangle_threshold_from_histogram(hist1), 1, 1, 1]
+    if mode == "super_low_intensities_filtered":
+        return [1, 1, 1, 1]
+    if mode == "low_intensities_filtered":
+        return [4, 4, 4, 4]
+    raise ValueError(f"Threshold mode \"{mode}\" can't be derived from histograms")
+
+## Number of pixels and sum of their intensities, that remain after thresholding (intensity > threshold)
+def thresholded_count_and_sum(hist, threshold):
+    remaining = hist[threshold + 1:]
+    return int(remaining.sum()), int(np.dot(np.arange(threshold + 1, len(hist), dtype=np.int64), remaining))
+
+## Lazy, row-wise access to a (large) greyscale TIFF image, the whole image is never loaded at once.
+# Uncompressed, contiguous images are memory-mapped. Otherwise only the strips or tiles of the requested rows are decoded.
+# Needs the ``tifffile`` package.
+class TiffRows:
+    def __init__(self, file):
+        import tifffile
+        self.file = file
+        self.tif = tifffile.TiffFile(file)
+        self.page = self.tif.pages.first
+        if self.page.samplesperpixel != 1 or self.page.ndim != 2:
+            self.tif.close()
+            raise ValueError(f"{file} is not a single-plane greyscale image")
+        self.shape = self.page.shape
+        self.dtype = self.page.dtype
+        self.memmap = tifffile.memmap(file, page=0, mode="r") if self.page.is_memmappable else None
+
+    ## Rows ``y0`` to ``y1`` (exclusive) of the image
+    def rows(self, y0, y1):
+        if self.memmap is not None:
+            return self.memmap[y0:y1]
+        height, width = self.shape
+        if self.page.is_tiled:
+            segment_length = self.page.tilelength
+            segments_per_row = -(-width // self.page.tilewidth)
+        else:
+            segment_length = min(self.page.rowsperstrip, height)
+            segments_per_row = 1
+        indices = list(range(y0 // segment_length * segments_per_row, ((y1 - 1) // segment_length + 1) * segments_per_row))
+        band = np.zeros((y1 - y0, width), dtype=self.dtype)
+        decode = self.page.decode
+        offsets = [self.page.dataoffsets[i] for i in indices]
+        bytecounts = [self.page.databytecounts[i] for i in indices]
+        for data, index in self.tif.filehandle.read_segments(offsets, bytecounts, indices):
+            segment, (_, _, y, x, _), segment_shape = decode(data, index)
+            if segment is None:
+                continue
+            segment = segment.reshape(segment_shape[1], segment_shape[2])
+            # Crop the segment to the requested rows and the image width (tiles are padded)
+            top, bottom = max(y, y0), min(y + segment_shape[1], y1)
+            right = min(x + segment_shape[2], width)
+            band[top - y0:bottom - y0, x:right] = segment[top - y:bottom - y, :right - x]
+        return band
+
+    def close(self):
+        self.memmap = None
+        self.tif.close()
+
+## Open the 4 color channels of an organoid for tiled processing.
+# input: "file name" string of the organoid's first channel (``C1``)
+def open_4_color_channels_lazy(file_name):
+    base_channel = ch_prefix + ch1_suffix
+    readers = [TiffRows(file_name)]
+    try:
+        for suffix in (ch2_suffix, ch3_suffix, ch4_suffix):
+            readers.append(TiffRows(file_name.replace(base_channel, ch_prefix + suffix)))
+    except Exception:
+        for reader in readers:
+            reader.close()
+        raise
+    if any(reader.shape != readers[0].shape for reader in readers):
+        for reader in readers:
+            reader.close()
+        raise ValueError(f"The color channels of {os.path.basename(file_name)} have different sizes")
+    return readers
+
+## Number of rows per band, so that the processing of a band stays within the memory budget.
+# Per pixel of a band there are the 4 channels as read, blurred and thresholded, plus a few boolean masks and buffers.
+def band_rows_for_budget(width, dtype, memory_budget_mb):
+    bytes_per_pixel = 4 * 3 * np.dtype(dtype).itemsize + 8
+    return max(1, int(memory_budget_mb * 2**20) // (width * bytes_per_pixel))
+
+## Extra rows above and below a band, that the filters need to give the same result as on the whole image.
+# The 5x5 Gaussian kernel needs 2 rows, the 21x21 neighbourhood of the adaptive threshold 10 rows.
+def band_halo(mode, gaussian_blur):
+    return (2 if gaussian_blur else 0) + (10 if mode == "adaptive" else 0)
+
+## Iterate over horizontal bands of the color channels.
+# Each band is read with ``halo`` extra rows above and below (where the image has them).
+# yields: first and last row (exclusive) of the band, the band of every channel, the number of halo rows above the band
+def iterate_channel_bands(readers, band_rows, halo = 0):
+    height = readers[0].shape[0]
+    for y0 in range(0, height, band_rows):
+        y1 = min(y0 + band_rows, height)
+        read_y0, read_y1 = max(y0 - halo, 0), min(y1 + halo, height)
+        yield y0, y1, [reader.rows(read_y0, read_y1) for reader in readers], y0 - read_y0
+
+## Histograms of the (blurred) color channels of an organoid, accumulated band by band.
+def accumulate_band_histograms(readers, band_rows, gaussian_blur = False):
+    histograms = [np.zeros(np.iinfo(reader.dtype).max + 1, dtype=np.int64) for reader in readers]
+    for y0, y1, bands, top in iterate_channel_bands(readers, band_rows, band_halo(None, gaussian_blur)):
+        if gaussian_blur:
+            bands = gaussian_blur_channels(*bands)
+        for hist, band in zip(histograms, bands):
+            hist += channel_histogram(band[top:top + y1 - y0])
+    return histograms
+
+## Threshold a band of the 4 color channels (with halo rows) and crop the halo afterwards.
+# Apart from "adaptive", the thresholds are global ones (see ``histogram_thresholds()``), every intensity <= threshold is set to 0.
+def threshold_band(bands, mode, thresholds, gaussian_blur, top, n_rows):
+    if gaussian_blur:
+        bands = gaussian_blur_channels(*bands)
+    if mode == "adaptive":
+        thresholded = apply_threshold(*bands, mode)
+    else:
+        thresholded = [cv2.threshold(band, threshold, 255, cv2.THRESH_TOZERO)[1] for band, threshold in zip(bands, thresholds)]
+    return [th[top:top + n_rows] for th in thresholded]
+
+## Number of planes (pages) of an image file, 1 for a single image
+def count_planes(file):
+    return cv2.imcount(file, cv2.IMREAD_UNCHANGED)
+
+## Is the organoid a z-stack (its "C1"-image has more than one page)?
+def is_z_stack(file):
+    return count_planes(file) > 1
+
+## Split the organoids into single images and z-stacks, every file is opened only once to count its planes
+# output: list of the single images, list of the z-stacks (both in the order of ``files``)
+def split_z_stacks(files):
+    is_stack = [is_z_stack(file) for file in files]
+    return [file for file, stack in zip(files, is_stack) if not stack], [file for file, stack in zip(files, is_stack) if stack]
+
+## Lazy, plane-wise access to a z-stack, only the requested plane is decoded.
+# Needs the ``tifffile`` package.
+class TiffPlanes:
+    def __init__(self, file):
+        import tifffile
+        self.file = file
+        self.tif = tifffile.TiffFile(file)
+        self.pages = self.tif.pages
+        first = self.pages.first
+        if first.samplesperpixel != 1 or first.ndim != 2:
+            self.tif.close()
+            raise ValueError(f"{file} is not a greyscale z-stack")
+        self.n_planes = len(self.pages)
+        self.shape = first.shape
+        self.dtype = first.dtype
+
+    def plane(self, z):
+        return self.pages[z].asarray()
+
+    def close(self):
+        self.tif.close()
+
+## Open the 4 color channels of a z-stack organoid.
+# input: "file name" string of the organoid's first channel (``C1``), see ``channel_file_names()``
+def open_4_color_stacks(file_name, prefix = None, suffixes = None):
+    return open_stacks(channel_file_names(file_name, prefix, suffixes))
+
+## Open the color channels of a z-stack organoid, given the file names of all of its channels
+def open_stacks(file_names):
+    readers = []
+    try:
+        for file_name in file_names:
+            readers.append(TiffPlanes(file_name))
+    except Exception:
+        for reader in readers:
+            reader.close()
+        raise
+    if any(reader.shape != readers[0].shape or reader.n_planes != readers[0].n_planes for reader in readers):
+        for reader in readers:
+            reader.close()
+        raise ValueError(f"The color channels of {os.path.basename(file_names[0])} have different sizes or numbers of planes")
+    return readers
+
+## Iterate over the planes of the color channels of a z-stack
+# yields: index of the plane and the plane of every channel
+def iterate_stack_planes(readers):
+    for z in range(readers[0].n_planes):
+        with instrumentation_jenna.stage("read planes"):
+            planes = [reader.plane(z) for reader in readers]
+        yield z, planes
+
+## Histograms of the (blurred) color channels of a whole z-stack, accumulated plane by plane.
+def accumulate_plane_histograms(readers, gaussian_blur = False):
+    histograms = [np.zeros(np.iinfo(reader.dtype).max + 1, dtype=np.int64) for reader in readers]
+    for _, planes in iterate_stack_planes(readers):
+        if gaussian_blur:
+            planes = gaussian_blur_channels(*planes)
+        for hist, plane in zip(histograms, planes):
+            hist += channel_histogram(plane)
+    return histograms
+
+## Threshold the planes of a z-stack one after another.
+# With ``z_mode = "volume"`` the thresholds of the whole stack come from the histograms of a first pass over all planes
+#   ("adaptive" is a local threshold and doesn't need them), with "planes" every plane is thresholded on its own.
+# yields: index of the plane and the 4 thresholded planes
+def threshold_stack_planes(readers, mode = "low_intensities_filtered", gaussian_blur = True, z_mode = "volume"):
+    if z_mode not in ("volume", "planes"):
+        raise ValueError(f"Unknown z-stack mode \"{z_mode}\", use \"volume\" or \"planes\"")
+    thresholds = None
+    if z_mode == "volume" and mode != "adaptive":
+        with instrumentation_jenna.stage("histograms of the planes"):
+            thresholds = histogram_thresholds(*accumulate_plane_histograms(readers, gaussian_blur), mode=mode)
+    for z, planes in iterate_stack_planes(readers):
+        with instrumentation_jenna.stage("threshold " + mode):
+            if thresholds is None:
+                thresholded = blur_and_threshold(*planes, mode, gaussian_blur)
+            else:
+                thresholded = threshold_band(planes, mode, thresholds, gaussian_blur, 0, readers[0].shape[0])
+        yield z, thresholded
+
+## Multi-page TIFF files, that are written plane by plane
+# Needs the ``tifffile`` package.
+class StackWriters:
+    def __init__(self, paths):
+        import tifffile
+        self.paths = paths
+        self.writers = [tifffile.TiffWriter(path) for path in paths]
+
+    ## Append a plane to every file
+    def write(self, planes):
+        for writer, plane in zip(self.writers, planes):
+            writer.write(plane, contiguous=True)
+
+    ## Write the planes of an iterable of (number, planes) on their way, e.g. to the quantification
+    def write_through(self, planes):
+        for z, plane in planes:
+            with instrumentation_jenna.stage("write thresholded planes"):
+                self.write(plane)
+            yield z, plane
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+## Threshold a z-stack plane by plane and save the thresholded stacks in the output folder.
+# input: "file name" string of the organoid's first channel (``C1``)
+# The settings, that aren't given, are the ones of the configuration (see ``save_thresholded_channels()``).
+# output: names of the 4 saved stacks
+def threshold_stack(file, output_folder_path, mode = "low_intensities_filtered", gaussian_blur = True, z_mode = None, prefix = None, suffixes = None, image_format = None):
+    output_names = [thresholded_file_name(name, mode, gaussian_blur, image_format) for name in channel_file_names(file, prefix, suffixes)]
+    readers = open_4_color_stacks(file, prefix, suffixes)
+    writers = None
+    try:
+        writers = StackWriters([os.path.join(output_folder_path, name) for name in output_names])
+        instrumentation_jenna.file_read(*[reader.file for reader in readers])
+        for _ in writers.write_through(threshold_stack_planes(readers, mode, gaussian_blur, z_mode or z_stack_mode)):
+            pass
+    finally:
+        if writers is not None:
+            writers.close()
+        for reader in readers:
+            reader.close()
+    instrumentation_jenna.file_written(*writers.paths)
+    return output_names
+
+## Fingerprint of the 4 raw color channels of an organoid, to notice changed images.
+# Either file size and modification time, or the sha256 hash of the file content.
+def input_fingerprint(file, hash_inputs = False):
+    base_channel = ch_prefix + ch1_suffix
+    fingerprint = {}
+    for suffix in (ch1_suffix, ch2_suffix, ch3_suffix, ch4_suffix):
+        channel_file = file.replace(base_channel, ch_prefix + suffix)
+        if hash_inputs:
+            sha256 = hashlib.sha256()
+            with open(channel_file, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha256.update(block)
+            fingerprint[os.path.basename(channel_file)] = sha256.hexdigest()
+        else:
+            file_stat = os.stat(channel_file)
+            fingerprint[os.path.basename(channel_file)] = [file_stat.st_size, file_stat.st_mtime]
+    return fingerprint
+
+## The manifest of an output folder: which organoids have been thresholded from which input, with which settings.
+# Entries are keyed by the name of the thresholded "C1"-image, which contains mode and blur setting.
+def load_manifest(output_folder_path):
+    manifest_file = os.path.join(output_folder_path, "thresholding_manifest.json")
+    if not os.path.isfile(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+## Save the manifest. It is written to a temporary file first and then replaced,
+# so an interrupted run never leaves a broken manifest behind.
+def save_manifest(manifest, output_folder_path):
+    manifest_file = os.path.join(output_folder_path, "thresholding_manifest.json")
+    with open(manifest_file + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+## Is the organoid already thresholded with the same input, mode, blur setting and z-stack mode, and are all its images still there?
+# Entries of older manifests without a z-stack mode are thresholded again.
+def is_up_to_date(manifest_entry, fingerprint, output_folder_path, mode, gaussian_blur, z_mode):
+    if manifest_entry is None:
+        return False
+    if manifest_entry["inputs"] != fingerprint or manifest_entry["mode"] != mode or manifest_entry["gaussian_blur"] != gaussian_blur:
+        return False
+    if manifest_entry.get("z_stack_mode") != z_mode:
+        return False
+    return all(os.path.isfile(os.path.join(output_folder_path, name)) for name in manifest_entry["outputs"])
+
+## Settings of the configuration, that the functions running in worker processes read (names of the channel files).
+# Worker processes, that are spawned (the default on Windows and macOS), import the script again and would only know its defaults,
+#   not the settings of the caller (e.g. of the config file in "cli_jenna.py"), so they are handed to every worker (see ``init_worker()``).
+def worker_settings():
+    return {name: globals()[name] for name in ("file_format", "ch_prefix", "ch1_suffix", "ch2_suffix", "ch3_suffix", "ch4_suffix", "z_stack_mode")}
+
+## Limit OpenCV to one thread per worker process, the parallelism comes from the organoids.
+# The ``settings`` of the calling process (see ``worker_settings()``) are applied to the worker's copy of the script.
+def init_worker(settings = None):
+    cv2.setNumThreads(1)
+    if settings:
+        globals().update(settings)
+
 ## Apply thresholding to every color channel of the image.
 # input: "folder name" string
-def thresholding(pic_folder_path, pic_sub_folder_name, mode = "low_intensities_filtered", gaussian_blur = True):
+# Every organoid (group of 4 channels) is one task. With ``n_workers > 1`` the tasks run in a process pool.
+# Errors of single organoids are collected and reported at the end instead of aborting the whole folder.
+# Organoids, that are in the output folder's manifest with unchanged input and settings, are skipped.
+# The manifest is updated after every organoid, so an interrupted run resumes where it stopped.
+# With the instrumentation enabled, the run report is saved as "thresholding_run_report.json" in the output folder.
+# Without worker processes, ``n_prefetch`` organoids are read ahead and up to ``n_queued_writes`` organoids are written in the background.
+# Z-stacks are thresholded like ``z_mode`` (``z_stack_mode`` if not given).
+def thresholding(pic_folder_path, pic_sub_folder_name, mode = "low_intensities_filtered", gaussian_blur = True, n_workers = 1, hash_inputs = False, n_prefetch = 0, n_queued_writes = 0, z_mode = None):
+    z_mode = z_stack_mode if z_mode is None else z_mode
     # Set the folder up, in which the thresholded images will be saved:
-    if not os.path.isdir(pic_folder_path + f"/../{pic_sub_folder_name}_thresholded_{mode}"):
-        os.makedirs(pic_folder_path + f"/../{pic_sub_folder_name}_thresholded_{mode}")
-    # We're gonna save the images here:
-    os.chdir(pic_folder_path + f"/../{pic_sub_folder_name}_thresholded_{mode}")
+    output_folder_path = os.path.abspath(pic_folder_path + f"/../{pic_sub_folder_name}_thresholded_{mode}")
+    if not os.path.isdir(output_folder_path):
+        os.makedirs(output_folder_path)
+    if instrumentation_jenna.enabled:
+        instrumentation_jenna.reset()
 
-    for file in tqdm(glob.glob(pic_folder_path+"/C1*"), desc=f"Applying {mode} thresholding"):
+    # Only process new or changed organoids
+    manifest = load_manifest(output_folder_path)
+    files = []
+    fingerprints = {}
+    for file in glob.glob(pic_folder_path+"/C1*"):
+        try:
+            fingerprints[file] = input_fingerprint(file, hash_inputs)
+        except OSError:
+            # A missing channel will be reported as an error of this organoid
+            fingerprints[file] = None
+        if not is_up_to_date(manifest.get(thresholded_file_name(file, mode, gaussian_blur)), fingerprints[file], output_folder_path, mode, gaussian_blur, z_mode):
+            files.append(file)
+    n_skipped = len(fingerprints) - len(files)
+    if n_skipped:
+        print(f"Skipping {n_skipped} organoids, that are already thresholded.")
 
-        if os.path.isfile(file.replace(file_format, f"gauss_filter_{gaussian_blur}_{mode}_thresholded{file_format}")):
-            continue
+    ## Save the organoid in the manifest, as soon as it is done
+    def add_to_manifest(file, output_names):
+        manifest[thresholded_file_name(file, mode, gaussian_blur)] = {
+            "inputs": fingerprints[file],
+            "mode": mode,
+            "gaussian_blur": gaussian_blur,
+            "z_stack_mode": z_mode,
+            "outputs": output_names,
+            }
+        save_manifest(manifest, output_folder_path)
 
-        ch1, ch2, ch3, ch4 = read_4_color_channels(file)
+    # Z-stacks are streamed plane by plane instead of being read as a whole
+    single_files, stack_files = split_z_stacks(files)
+    failed_files = []
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(worker_settings(),)) as executor:
+            futures = {executor.submit(threshold_stack, file, output_folder_path, mode, gaussian_blur, z_mode): file for file in stack_files}
+            futures.update({executor.submit(threshold_single_image, file, output_folder_path, mode, gaussian_blur): file for file in single_files})
+            with instrumentation_jenna.stage(f"threshold organoids in {n_workers} worker processes"):
+                for future in tqdm(as_completed(futures), total=len(futures), desc=f"Applying {mode} thresholding"):
+                    try:
+                        add_to_manifest(futures[future], future.result())
+                    except Exception as e:
+                        failed_files.append((futures[future], e))
+    else:
+        ## Save the organoids, whose images are written, in the manifest (in order)
+        def finish_writes(pending_writes, wait = False):
+            while pending_writes and (wait or pending_writes[0][1].done()):
+                file, future = pending_writes.popleft()
+                try:
+                    add_to_manifest(file, future.result())
+                except Exception as e:
+                    failed_files.append((file, e))
 
-        if gaussian_blur:
-            # Apply a Gaussian blur filter to the image
-            ch1 = cv2.GaussianBlur(ch1, (5, 5), 0)
-            ch2 = cv2.GaussianBlur(ch2, (5, 5), 0)
-            ch3 = cv2.GaussianBlur(ch3, (5, 5), 0)
-            ch4 = cv2.GaussianBlur(ch4, (5, 5), 0)
-
-        if mode == "triangle":
-            # Apply triangle thresholding to every channel
-            _, th1 = cv2.threshold(ch1, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_TRIANGLE)
-            _, th2 = cv2.threshold(ch2, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_TRIANGLE)
-            _, th3 = cv2.threshold(ch3, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_TRIANGLE)
-            _, th4 = cv2.threshold(ch4, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_TRIANGLE)
-
-        if mode == "adaptive":
-            # Apply cv adaptive thresholding to every channel
-            th1 = cv2.adaptiveThreshold(ch1, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 21, 0)
-            th2 = cv2.adaptiveThreshold(ch2, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 21, 0)
-            th3 = cv2.adaptiveThreshold(ch3, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 21, 0)
-            th4 = cv2.adaptiveThreshold(ch4, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 21, 0)
-
-        if mode == "otsu":
-            # Apply Otsu's thresholding to every channel
-            _, th1 = cv2.threshold(ch1, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_OTSU)
-            _, th2 = cv2.threshold(ch2, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_OTSU)
-            _, th3 = cv2.threshold(ch3, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_OTSU)
-            _, th4 = cv2.threshold(ch4, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_OTSU)
-
-        if mode == "otsu_on_dapi_only":
-            # Apply Otsu's thresholding to only the DAPI channel
-            th1 = ch1
-            th2 = ch2
-            _, th3 = cv2.threshold(ch3, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_OTSU)
-            th4 = ch4
-
-        if mode == "otsu_on_dapi_intensity_greater_1_on_rest":
-            # Apply Otsu's thresholding to only the DAPI channel
-            # Every value >1 remains the same, every value <=1 is set to 0
-            th1 = ch1
-            th2 = ch2
-            _, th3 = cv2.threshold(ch3, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_OTSU)
-            th4 = ch4
-            th1[th1 < 2] = 0 
-            th2[th2 < 2] = 0
-            th4[th4 < 2] = 0
-
-        if mode == "triangle_on_dapi_intensity_greater_1_on_rest":
-            # Apply Otsu's thresholding to only the DAPI channel
-            _, th1 = cv2.threshold(ch1, 0, 255, cv2.THRESH_TOZERO + cv2.THRESH_TRIANGLE)
-            # Every value >1 remains the same, every value <=1 is set to 0
-            th2 = ch2
-            th3 = ch3
-            th4 = ch4
-            th2[th2 < 2] = 0
-            th3[th3 < 2] = 0
-            th4[th4 < 2] = 0
-
-        if mode == "super_low_intensities_filtered":
-            th1 = ch1
-            th2 = ch2
-            th3 = ch3
-            th4 = ch4
-            # Every value >1 remains the same, every value <=1 is set to 0
-            th1[th1 < 2] = 0
-            th2[th2 < 2] = 0
-            th3[th3 < 2] = 0
-            th4[th4 < 2] = 0
-
-        if mode == "low_intensities_filtered":
-            th1 = ch1
-            th2 = ch2
-            th3 = ch3
-            th4 = ch4
-            # Every value >1 remains the same, every value <=1 is set to 0
-            th1[th1 < 5] = 0
-            th2[th2 < 5] = 0
-            th3[th3 < 5] = 0
-            th4[th4 < 5] = 0
-
-        ## Save images
-        #for file, img in zip([file.replace(file_format, f"gauss_filter_{gaussian_blur}_{mode}_thresholded{file_format}")], [th1, th2, th3, th4]):
-        #    cv2.imwrite(file, img)
-        base_channel = ch_prefix + ch1_suffix
-        cv2.imwrite(os.path.basename(file.replace(file_format, f"_gauss_filter_{gaussian_blur}_{mode}_thresholded{file_format}")), th1)
-        file2_replaced_name = file.replace(base_channel, ch_prefix + ch2_suffix)
-        cv2.imwrite(os.path.basename(file2_replaced_name.replace(file_format, f"_gauss_filter_{gaussian_blur}_{mode}_thresholded{file_format}")), th2)
-        file3_replaced_name = file.replace(base_channel, ch_prefix + ch3_suffix)
-        cv2.imwrite(os.path.basename(file3_replaced_name.replace(file_format, f"_gauss_filter_{gaussian_blur}_{mode}_thresholded{file_format}")), th3)
-        file4_replaced_name = file.replace(base_channel, ch_prefix + ch4_suffix)
-        cv2.imwrite(os.path.basename(file4_replaced_name.replace(file_format, f"_gauss_filter_{gaussian_blur}_{mode}_thresholded{file_format}")), th4)
-    return
-
-if 1:
+        for file in tqdm(stack_files, desc=f"Applying {mode} thresholding to z-stacks"):
+            try:
+                with instrumentation_jenna.organoid(os.path.basename(file)):
+                    add_to_manifest(file, threshold_stack(file, output_folder_path, mode, gaussian_blur, z_mode))
+            except Exception as e:
+                failed_files.append((file, e))
+
+        # The next organoids are read and the previous ones written in the background, while the current one is thresholded
+        pending_writes = deque()
+        with QueuedWriter(n_queued_writes) as writer:
+            for file, channels in tqdm(prefetched(single_files, read_4_color_channels, n_prefetch), total=len(single_files), desc=f"Applying {mode} thresholding"):
+                try:
+                    with instrumentation_jenna.organoid(os.path.basename(file)):
+                        th1, th2, th3, th4 = blur_and_threshold(*channels.result(), mode, gaussian_blur)
+                        pending_writes.append((file, writer.submit(save_thresholded_channels, file, th1, th2, th3, th4, output_folder_path, mode, gaussian_blur)))
+                except Exception as e:
+                    failed_files.append((file, e))
+                finish_writes(pending_writes)
+        finish_writes(pending_writes, wait = True)
+
+    # Report the organoids that could not be thresholded
+    if failed_files:
+        print(f"{len(failed_files)} of {len(files)} organoids could not be thresholded:")
+        for file, e in failed_files:
+            print(f"  {os.path.basename(file)}: {e!r}")
+    if instrumentation_jenna.enabled:
+        instrumentation_jenna.write_report(output_folder_path, "thresholding_run_report.json", mode=mode, gaussian_blur=gaussian_blur, z_stack_mode=z_mode,
+                                           organoids=len(files), skipped=n_skipped, failed=len(failed_files), n_workers=n_workers)
+    return failed_files
+
+if __name__ == "__main__":
+    if instrumentation:
+        instrumentation_jenna.enable()
     for sub_folder_name in folders_list:
         pic_folder_path = os.path.join(wd, sub_folder_name)
-        os.chdir(pic_folder_path)
-        thresholding(pic_folder_path, sub_folder_name, mode = threshold_mode, gaussian_blur = gauss_blur_filter)
+        thresholding(pic_folder_path, sub_folder_name, mode = threshold_mode, gaussian_blur = gauss_blur_filter, n_workers = n_workers, hash_inputs = manifest_hash_inputs,
+                     n_prefetch = prefetch_organoids, n_queued_writes = queued_writes, z_mode = z_stack_mode)
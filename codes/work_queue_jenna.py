@@ -0,0 +1,287 @@
+"""
+Sharded quantification of a whole study on any number of worker processes or cluster nodes, coordinated by a work queue
+    in a folder on the shared file system (no server needed).
+The organoids of all conditions are split into small work units. Every worker claims one unit after another by renaming
+    its file (atomic on the same file system, so only one worker gets it), quantifies its organoids with the engine
+    (see "engine_jenna.py") and saves the unit's results. A claimed unit is leased: the worker renews the lease before
+    every organoid and from a background thread while it's working (a third of the lease timeout apart), so even a
+    single organoid, that takes longer than the timeout, keeps it. A unit whose lease expired (e.g. the node died) is
+    claimed again by another worker.
+Organoids, that raise an error, are left out and noted with their traceback in "failed/<unit>.json", a unit, whose results
+    can't be saved, is moved there as a whole. Either way the worker goes on with the next unit instead of crashing on it again and again.
+When all units are done, the results are merged into the "quantification.csv" of every condition and into
+    "comparison_results/<mode>/quantification_all.csv" (and its bootstrap summary "summary_all.csv", if the engine's ``save_summary``).
+
+Queue folder "<wd>/work_queue_<mode>":
+    todo/<unit>.json                  units, that no worker has claimed yet
+    claimed/<unit>.<worker>.json      units in progress, the modification time is the start of the lease
+    done/<unit>.json                  finished units
+    failed/<unit>.json                the errors of the unit's organoids (or of the whole unit, then it's not in "done")
+    results/<unit>.csv                values of interest of the unit's organoids (and "<unit>_overlap.csv")
+
+Usage, e.g. on the cluster:
+    python work_queue_jenna.py create     # once, split the study into units
+    python work_queue_jenna.py work       # on every node, as many as you like
+    python work_queue_jenna.py merge      # once, after all units are done
+    python work_queue_jenna.py local      # all of it on this machine with ``n_local_workers`` processes
+
+Copyright (c) 2022, Maximilian Otto, Berlin.
+"""
+# ----------------------------------------------------------------------------------------------- #
+# Path of the folder containing all the folders of the conditions
+wd = "S:/mdc_work/jenna"
+
+## The quantification will be applied to the following folders/conditions:
+treatment_list = ["normal", "Antimycin A", "EDHB", "hypoxy"]
+
+threshold_mode = "triangle"
+gauss_blur_filter = False
+from_raw = True               # Threshold the raw images in memory. False quantifies the images of "thresholding_jenna.py".
+
+organoids_per_unit = 4        # Organoids of one work unit
+lease_timeout_s = 30 * 60     # A unit, whose worker didn't renew its lease for this long, is given to another worker
+n_local_workers = 4           # Worker processes of a local run
+# ----------------------------------------------------------------------------------------------- #
+
+import os
+import sys
+import glob
+import json
+import time
+import socket
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import quant_colocalization_jenna
+from engine_jenna import ColocalizationEngine
+
+## Folder of the work queue of an engine's threshold mode
+def queue_folder_path(engine):
+    return os.path.join(engine.wd, f"work_queue_{engine.threshold_mode}")
+
+## Unique name of this worker process, without dots (they separate the unit and the worker in the file names)
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}".replace(".", "-")
+
+## Write a file under a temporary name and rename it, so nobody ever sees a half-written file
+def write_json_atomically(content, path):
+    with open(path + ".tmp", "w") as f:
+        json.dump(content, f)
+    os.replace(path + ".tmp", path)
+
+## Split the organoids of all conditions into work units.
+# A queue, that already has units, is left as it is, so calling it twice doesn't duplicate the work.
+# output: number of units in the queue
+def create_work_units(engine, conditions, queue_folder, organoids_per_unit=4, from_raw=True):
+    for sub_folder in ["todo", "claimed", "done", "failed", "results"]:
+        os.makedirs(os.path.join(queue_folder, sub_folder), exist_ok=True)
+    existing_units = count_units(queue_folder)
+    if sum(existing_units.values()):
+        print(f"The work queue {queue_folder} already has {sum(existing_units.values())} units.")
+        return sum(existing_units.values())
+
+    n_units = 0
+    for condition in conditions:
+        files = engine.raw_files(condition) if from_raw else engine.thresholded_files(condition)
+        for start in range(0, len(files), organoids_per_unit):
+            unit = {"condition": condition, "files": files[start:start + organoids_per_unit], "from_raw": from_raw}
+            write_json_atomically(unit, os.path.join(queue_folder, "todo", f"{n_units:06d}.json"))
+            n_units += 1
+    return n_units
+
+## Number of units per state ("todo", "claimed", "done")
+def count_units(queue_folder):
+    return {state: len(glob.glob(os.path.join(queue_folder, state, "*.json"))) for state in ["todo", "claimed", "done"]}
+
+## Note the errors of a unit in "failed/<unit>.json"
+# input: the unit and a list of (file, exception), the file is ``None`` for an error of the whole unit
+def write_failures(queue_folder, name, unit, failed_files):
+    errors = [{"file": file, "error": "".join(traceback.format_exception(e))} for file, e in failed_files]
+    write_json_atomically(dict(unit, errors=errors), os.path.join(queue_folder, "failed", name + ".json"))
+    for file, e in failed_files:
+        print(f"Unit {name}: {os.path.basename(file) if file else 'the whole unit'} failed: {e}")
+
+## Name of a unit from the name of its file in any state
+def unit_name(unit_file):
+    return os.path.basename(unit_file).split(".")[0]
+
+## Claim the next unit: first the unclaimed ones, then the ones with an expired lease.
+# The rename is the claim, if another worker was faster, the rename fails and the next unit is tried.
+# output: path of the claimed unit file, ``None`` if there is nothing left to claim
+def claim_unit(queue_folder, worker_id, lease_timeout_s=1800):
+    for unit_file in sorted(glob.glob(os.path.join(queue_folder, "todo", "*.json"))):
+        claimed_file = os.path.join(queue_folder, "claimed", f"{unit_name(unit_file)}.{worker_id}.json")
+        try:
+            os.rename(unit_file, claimed_file)
+        except FileNotFoundError:
+            continue
+        # The rename keeps the modification time, the lease starts now
+        os.utime(claimed_file)
+        return claimed_file
+
+    now = time.time()
+    for unit_file in sorted(glob.glob(os.path.join(queue_folder, "claimed", "*.json"))):
+        try:
+            if now - os.path.getmtime(unit_file) < lease_timeout_s:
+                continue
+            claimed_file = os.path.join(queue_folder, "claimed", f"{unit_name(unit_file)}.{worker_id}.json")
+            os.rename(unit_file, claimed_file)
+        except FileNotFoundError:
+            continue
+        print(f"Taking over unit {unit_name(unit_file)}, its lease expired.")
+        os.utime(claimed_file)
+        return claimed_file
+    return None
+
+## Renew the lease of a claimed unit. Raises ``FileNotFoundError``, if the unit was taken over by another worker.
+def renew_lease(claimed_file):
+    os.utime(claimed_file)
+
+## Renew the lease of a claimed unit every ``interval_s`` seconds in a background thread, while the unit is processed (context manager).
+# ``lost`` is set, once the unit was taken over by another worker, the thread stops renewing then.
+class LeaseRenewal:
+    def __init__(self, claimed_file, interval_s):
+        self.claimed_file = claimed_file
+        self.interval_s = interval_s
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval_s):
+            try:
+                renew_lease(self.claimed_file)
+            except FileNotFoundError:
+                self.lost = True
+                return
+
+    ## Renew the lease right away, e.g. before every organoid. Raises ``FileNotFoundError``, if it was lost.
+    def renew(self):
+        if self.lost:
+            raise FileNotFoundError(f"Lost the lease of {self.claimed_file}")
+        renew_lease(self.claimed_file)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+## Write a csv file of a unit's results under a temporary name of this claim and rename it, so workers never write the same file at the same time
+def write_csv_atomically(df, path, claimed_file):
+    temporary_path = f"{path}.{os.path.basename(claimed_file)}.tmp"
+    df.to_csv(temporary_path, index=False)
+    os.replace(temporary_path, path)
+
+## Quantify the organoids of a claimed unit and save its results, then mark it as done.
+# Failed organoids are left out of the results and noted in "failed/<unit>.json" (see ``write_failures()``),
+#   a unit, that fails as a whole (e.g. its results can't be written), is only noted there and taken out of the queue.
+# The lease is renewed in the background (see ``LeaseRenewal``) until the results are saved.
+# output: ``True``, if the unit was finished, ``False``, if its lease was lost or it failed
+def process_unit(engine, queue_folder, claimed_file, lease_timeout_s=1800):
+    with open(claimed_file) as f:
+        unit = json.load(f)
+    name = unit_name(claimed_file)
+    failed_files = []
+    try:
+        with LeaseRenewal(claimed_file, lease_timeout_s / 3) as lease:
+            rows, overlap_tables = engine.quantify_files(unit["condition"], unit["files"], unit["from_raw"], before_organoid=lambda file: lease.renew(),
+                                                         failed_files=failed_files)
+
+            # Results first, then done: a unit in "done" always has its results (none, if all its organoids failed)
+            results_path = os.path.join(queue_folder, "results", name + ".csv")
+            if rows:
+                write_csv_atomically(pd.DataFrame(rows), results_path, claimed_file)
+            if overlap_tables:
+                overlap_df = pd.concat(overlap_tables, names=["File name", None]).reset_index(level=0).reset_index(drop=True)
+                overlap_df["Condition"] = unit["condition"]
+                write_csv_atomically(overlap_df, results_path.replace(".csv", "_overlap.csv"), claimed_file)
+    except Exception as e:
+        if isinstance(e, FileNotFoundError) and not os.path.isfile(claimed_file):
+            print(f"Lost the lease of unit {name}, another worker took it over.")
+            return False
+        write_failures(queue_folder, name, unit, failed_files + [(None, e)])
+        try:
+            os.remove(claimed_file)
+        except FileNotFoundError:
+            pass
+        return False
+
+    if failed_files:
+        write_failures(queue_folder, name, unit, failed_files)
+    try:
+        os.rename(claimed_file, os.path.join(queue_folder, "done", name + ".json"))
+    except FileNotFoundError:
+        # Taken over at the very end, the other worker saves the same results again
+        return False
+    return True
+
+## Work on the queue, until there is no unit left to claim
+# output: number of units this worker finished
+def work(engine, queue_folder, worker_id=None, lease_timeout_s=1800):
+    worker_id = worker_id or default_worker_id()
+    n_finished = 0
+    while True:
+        claimed_file = claim_unit(queue_folder, worker_id, lease_timeout_s)
+        if claimed_file is None:
+            return n_finished
+        n_finished += process_unit(engine, queue_folder, claimed_file, lease_timeout_s)
+
+## Merge the results of all units into the "quantification.csv" of every condition and
+#   "comparison_results/<mode>/quantification_all.csv" (and its bootstrap summary "summary_all.csv", if the engine's ``save_summary``).
+# The failed organoids and units are listed, but don't stop the merge of the others.
+# output: quantification dataframe of all conditions
+def merge_results(engine, queue_folder):
+    units = count_units(queue_folder)
+    if units["todo"] or units["claimed"]:
+        raise RuntimeError(f"The work queue isn't finished yet: {units['todo']} units to do, {units['claimed']} in progress")
+    for failure_file in sorted(glob.glob(os.path.join(queue_folder, "failed", "*.json"))):
+        with open(failure_file) as f:
+            failure = json.load(f)
+        print(f"Unit {unit_name(failure_file)} ({failure['condition']}) has {len(failure['errors'])} errors, see {failure_file}")
+
+    result_files = sorted(file for file in glob.glob(os.path.join(queue_folder, "results", "*.csv")) if not file.endswith("_overlap.csv"))
+    if not result_files:
+        raise RuntimeError(f"The work queue {queue_folder} has no results to merge")
+    complete_df = pd.concat([pd.read_csv(file) for file in result_files], ignore_index=True)
+    overlap_files = sorted(glob.glob(os.path.join(queue_folder, "results", "*_overlap.csv")))
+    overlap_df = pd.concat([pd.read_csv(file) for file in overlap_files], ignore_index=True) if overlap_files else None
+
+    for condition, quantification_df in complete_df.groupby("Condition", sort=False):
+        engine.save_condition_results(condition, quantification_df.reset_index(drop=True))
+        if overlap_df is not None:
+            overlap_df[overlap_df["Condition"] == condition].to_csv(os.path.join(engine.output_folder(condition), "overlap.csv"), index=False)
+
+    comparison_folder_path = os.path.join(engine.wd, "comparison_results", engine.threshold_mode)
+    os.makedirs(comparison_folder_path, exist_ok=True)
+    complete_df.to_csv(os.path.join(comparison_folder_path, "quantification_all.csv"), index=False)
+    if engine.save_summary:
+        quant_colocalization_jenna.save_bootstrap_summary(complete_df, comparison_folder_path, engine.bootstrap_resamples, engine.bootstrap_confidence, engine.bootstrap_seed)
+    return complete_df
+
+## Everything on this machine: create the units, work on them with ``n_workers`` processes and merge the results
+def run_local(engine, conditions, n_workers=4, organoids_per_unit=4, from_raw=True, lease_timeout_s=1800):
+    queue_folder = queue_folder_path(engine)
+    create_work_units(engine, conditions, queue_folder, organoids_per_unit, from_raw)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(work, engine, queue_folder, None, lease_timeout_s) for _ in range(n_workers)]
+        n_finished = [future.result() for future in futures]
+    print(f"Units finished per worker: {n_finished}")
+    return merge_results(engine, queue_folder)
+
+if __name__ == "__main__":
+    engine = ColocalizationEngine.from_scripts(wd=wd, threshold_mode=threshold_mode, gaussian_filter=gauss_blur_filter)
+    action = sys.argv[1] if len(sys.argv) > 1 else "local"
+    if action == "create":
+        print(f"{create_work_units(engine, treatment_list, queue_folder_path(engine), organoids_per_unit, from_raw)} work units")
+    elif action == "work":
+        print(f"Finished {work(engine, queue_folder_path(engine), lease_timeout_s=lease_timeout_s)} work units")
+    elif action == "merge":
+        merge_results(engine, queue_folder_path(engine))
+    elif action == "local":
+        run_local(engine, treatment_list, n_local_workers, organoids_per_unit, from_raw, lease_timeout_s)
+    else:
+        sys.exit(f"Unknown action \"{action}\", use create, work, merge or local")
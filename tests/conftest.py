@@ -0,0 +1,14 @@
+# The scripts in "codes" import each other by their module names, like when they are run from there
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "codes"))
+
+import synthetic_organoids_jenna
+
+## Working directory with a condition folder "normal" of small synthetic organoids (2 cell lines with 3 organoids each)
+@pytest.fixture
+def synthetic_wd(tmp_path):
+    synthetic_organoids_jenna.write_synthetic_condition(str(tmp_path / "normal"), organoids_per_cell_line=3, image_size=(96, 80), sparsity=0.3)
+    return str(tmp_path)
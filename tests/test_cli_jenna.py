@@ -0,0 +1,33 @@
+"""
+Tests of the command line entry points on small synthetic organoids (see "synthetic_organoids_jenna.py").
+"""
+import os
+import json
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import cli_jenna
+import thresholding_jenna
+
+## The commands configure the scripts' module globals, they are restored after every test
+@pytest.fixture(autouse=True)
+def restore_settings():
+    saved = dict(vars(thresholding_jenna))
+    yield
+    vars(thresholding_jenna).update(saved)
+
+## Settings of the config file and of the command line reach worker processes, that are spawned and import the script again
+def test_threshold_workers_get_the_configured_settings(synthetic_wd, tmp_path, monkeypatch):
+    folder = os.path.join(synthetic_wd, "normal")
+    for file in os.listdir(folder):
+        if file.startswith("C2-"):
+            os.rename(os.path.join(folder, file), os.path.join(folder, "C5-" + file[3:]))
+    config_file = str(tmp_path / "settings.json")
+    with open(config_file, "w") as f:
+        json.dump({"ch2_suffix": "5", "threshold_mode": "triangle"}, f)
+    monkeypatch.setattr(thresholding_jenna, "ProcessPoolExecutor", functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")))
+    assert cli_jenna.main(["--config", config_file, "threshold", "--wd", synthetic_wd, "--folders", "normal", "--workers", "2"]) == 0
+    output_files = os.listdir(os.path.join(synthetic_wd, "normal_thresholded_triangle"))
+    assert "C5-Apoe_3_gauss_filter_False_triangle_thresholded.tif" in output_files
+    assert len([file for file in output_files if file.endswith(".tif")]) == 6 * 4
@@ -0,0 +1,57 @@
+"""
+Tests of the engine against the scripts: same thresholded images and values of interest with the engine's own settings.
+"""
+import os
+import shutil
+import pandas as pd
+import pytest
+import thresholding_jenna
+import quant_colocalization_jenna
+from engine_jenna import ColocalizationEngine
+
+## Quantification dataframe in the order of the file names
+def by_file_name(quantification_df):
+    return quantification_df.sort_values("File name").reset_index(drop=True)
+
+@pytest.fixture
+def script_settings(monkeypatch):
+    monkeypatch.setattr(quant_colocalization_jenna, "save_mask_as_files", False)
+    monkeypatch.setattr(quant_colocalization_jenna, "save_results_store", False)
+
+
+## The engine quantifies raw and thresholded organoids like the two-step way of the scripts
+@pytest.mark.parametrize("mode", ["otsu", "triangle"])
+def test_engine_matches_scripts(synthetic_wd, tmp_path, script_settings, mode):
+    pic_folder_path = os.path.join(synthetic_wd, "normal")
+    thresholding_jenna.thresholding(pic_folder_path, "normal", mode, gaussian_blur = False)
+    script_df = by_file_name(quant_colocalization_jenna.calculate_values_of_interest(pic_folder_path, "normal", mode, False))
+    script_images = {name: open(os.path.join(synthetic_wd, f"normal_thresholded_{mode}", name), "rb").read()
+                     for name in os.listdir(os.path.join(synthetic_wd, f"normal_thresholded_{mode}")) if name.endswith("_thresholded.tif")}
+
+    engine_wd = str(tmp_path / "engine")
+    shutil.copytree(pic_folder_path, os.path.join(engine_wd, "normal"))
+    engine = ColocalizationEngine(engine_wd, threshold_mode=mode, save_results_store=False)
+    raw_df = by_file_name(engine.quantify_condition("normal", from_raw=True))
+    pd.testing.assert_frame_equal(raw_df, script_df, check_like=True)
+    for name, content in script_images.items():
+        assert open(os.path.join(engine.output_folder("normal"), name), "rb").read() == content
+    pd.testing.assert_frame_equal(by_file_name(engine.quantify_condition("normal")), script_df, check_like=True)
+
+## The engine's channel names are used for the files, not the configuration of the scripts
+def test_engine_channel_suffixes(synthetic_wd, tmp_path, script_settings):
+    engine_wd = str(tmp_path / "engine")
+    shutil.copytree(os.path.join(synthetic_wd, "normal"), os.path.join(engine_wd, "normal"))
+    for name in os.listdir(os.path.join(engine_wd, "normal")):
+        if name.startswith("C2"):
+            os.rename(os.path.join(engine_wd, "normal", name), os.path.join(engine_wd, "normal", "C5" + name[2:]))
+    expected_df = by_file_name(ColocalizationEngine(synthetic_wd, save_results_store=False).quantify_condition("normal", from_raw=True))
+    engine = ColocalizationEngine(engine_wd, ch_suffixes=("1", "5", "3", "4"), save_results_store=False)
+    assert len(engine.threshold_condition("normal")) == 6 * 4
+    assert any(name.startswith("C5") for name in os.listdir(engine.output_folder("normal")))
+    pd.testing.assert_frame_equal(by_file_name(engine.quantify_condition("normal")), expected_df, check_like=True)
+
+## Looking up the thresholded files doesn't create the output folder
+def test_engine_lookups_dont_create_folders(synthetic_wd):
+    engine = ColocalizationEngine(synthetic_wd)
+    assert engine.thresholded_files("normal") == []
+    assert not os.path.exists(engine.output_folder("normal"))
@@ -0,0 +1,48 @@
+"""
+Tests of the instrumentation: peak memory of stages in several threads.
+"""
+import threading
+import numpy as np
+import pytest
+import instrumentation_jenna
+
+@pytest.fixture
+def instrumentation():
+    instrumentation_jenna.enable()
+    yield instrumentation_jenna
+    instrumentation_jenna.disable()
+
+## A stage of another thread resets the peak of ``tracemalloc``, the peak of an open stage is kept anyway
+def test_stage_peak_survives_stages_of_other_threads(instrumentation):
+    allocated, done = threading.Event(), threading.Event()
+
+    def worker():
+        with instrumentation.stage("worker"):
+            data = np.ones(8 << 20, dtype=np.uint8)
+            del data
+            allocated.set()
+            done.wait(10)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    allocated.wait(10)
+    with instrumentation.stage("main"):
+        pass
+    done.set()
+    thread.join()
+    peaks = {entry["Stage"]: entry["Peak memory (bytes)"] for entry in instrumentation.records}
+    assert peaks["worker"] >= 8 << 20
+    assert peaks["main"] < 8 << 20
+
+## Nested stages: the outer stage's peak includes the inner one's
+def test_nested_stage_peaks(instrumentation):
+    with instrumentation.stage("outer"):
+        with instrumentation.stage("inner"):
+            data = np.ones(4 << 20, dtype=np.uint8)
+            del data
+        with instrumentation.stage("second inner"):
+            pass
+    peaks = {entry["Stage"]: entry["Peak memory (bytes)"] for entry in instrumentation.records}
+    assert peaks["inner"] >= 4 << 20
+    assert peaks["outer"] >= peaks["inner"]
+    assert peaks["second inner"] < 4 << 20
@@ -0,0 +1,463 @@
+"""
+Tests of the quantification and its statistics against scipy, numpy and straightforward reference implementations,
+    on small synthetic organoids (see "synthetic_organoids_jenna.py").
+"""
+import os
+import shutil
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import ndimage, stats
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import thresholding_jenna
+import quant_colocalization_jenna
+import synthetic_organoids_jenna
+
+## Quantification dataframe of 3 cell lines in 2 conditions with random values of interest
+def random_quantification(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for cell_line in ["A", "B", "C"]:
+        for condition in ["normal", "hypoxy"]:
+            for i in range(rng.integers(4, 9)):
+                rows.append({"File name": f"{cell_line}_{i}.tif", "Cell line": cell_line, "Condition": condition, "Organoid number": i,
+                             "v1": rng.normal(10 if condition == "normal" else 12, 2), "v2": rng.gamma(2, 3) if i != 1 else np.nan})
+    return pd.DataFrame(rows)
+
+
+## The blur settings of a threshold sweep are tested separately, their organoids aren't pooled
+def test_welch_tests_by_blur_setting():
+    quantification_df = random_quantification(8)
+    sweep_df = pd.concat([quantification_df.assign(**{"Gaussian filter": blur, "v1": quantification_df["v1"] + blur}) for blur in [False, True]], ignore_index=True)
+    statistics_df = quant_colocalization_jenna.welch_tests(sweep_df, x="Cell line", values=["v1", "v2"])
+    single_df = quant_colocalization_jenna.welch_tests(quantification_df, x="Cell line", values=["v1", "v2"])
+    assert set(statistics_df["Gaussian filter"]) == {False, True}
+    for blur in [False, True]:
+        blur_df = statistics_df[statistics_df["Gaussian filter"] == blur].reset_index(drop=True)
+        np.testing.assert_array_equal(blur_df["n 1"], single_df["n 1"])
+        np.testing.assert_allclose(blur_df["p-value corrected"], single_df["p-value corrected"])
+
+## A threshold sweep with two blur settings: tests and plots per blur setting, in the folder of every mode
+def test_quantification_sweep_splits_blur_settings(synthetic_wd, monkeypatch):
+    q = quant_colocalization_jenna
+    for name, value in {"wd": synthetic_wd, "threshold_sweep_modes": ["otsu", "triangle"], "threshold_sweep_gaussian_filters": [False, True],
+                        "save_mask_as_files": False, "save_results_store": False, "make_plots": True}.items():
+        monkeypatch.setattr(q, name, value)
+    plots = []
+    monkeypatch.setattr(q, "box_plt_all_values", lambda quantification_df, pic_folder_path, condition, threshold_mode, n_workers=1, show=False, statistics_df=None:
+                        plots.append((condition, threshold_mode, len(quantification_df), set(statistics_df["Gaussian filter"]))))
+    complete_df = q.quantification(["normal"], "otsu")
+    assert len(complete_df) == 6 * 2 * 2
+    assert sorted(plots) == [("normal_gauss_filter_False", "otsu", 6, {False}), ("normal_gauss_filter_False", "triangle", 6, {False}),
+                             ("normal_gauss_filter_True", "otsu", 6, {True}), ("normal_gauss_filter_True", "triangle", 6, {True})]
+    statistics_df = pd.read_csv(os.path.join(synthetic_wd, "normal_thresholded_otsu", "statistics.csv"))
+    assert set(statistics_df["Gaussian filter"]) == {False, True}
+    # 3 organoids per cell line and blur setting
+    assert (statistics_df["n 1"] == 3).all() and (statistics_df["n 2"] == 3).all()
+
+
+@pytest.mark.parametrize("correction", [None, "bonferroni", "holm", "fdr_bh"])
+def test_welch_tests_match_scipy(correction):
+    quantification_df = random_quantification(3)
+    statistics_df = quant_colocalization_jenna.welch_tests(quantification_df, x="Cell line", hue="Condition", values=["v1", "v2"], correction=correction)
+    for _, row in statistics_df.iterrows():
+        group_1 = quantification_df[(quantification_df["Cell line"] == row["Group 1"][0]) & (quantification_df["Condition"] == row["Group 1"][1])][row["Value"]].dropna()
+        group_2 = quantification_df[(quantification_df["Cell line"] == row["Group 2"][0]) & (quantification_df["Condition"] == row["Group 2"][1])][row["Value"]].dropna()
+        expected = stats.ttest_ind(group_1, group_2, equal_var=False)
+        assert row["t"] == pytest.approx(expected.statistic)
+        assert row["p-value"] == pytest.approx(expected.pvalue)
+
+## Corrections of one family of p-values, one test after another
+def reference_correction(pvalues, method):
+    valid = ~np.isnan(pvalues)
+    p = pvalues[valid]
+    n = len(p)
+    order = np.argsort(p)
+    corrected = np.empty(n)
+    if method == "bonferroni":
+        corrected = p * n
+    elif method == "holm":
+        running_max = 0
+        for rank, i in enumerate(order):
+            running_max = max(running_max, p[i] * (n - rank))
+            corrected[i] = running_max
+    elif method == "fdr_bh":
+        corrected = stats.false_discovery_control(p, method="bh")
+    result = np.full(len(pvalues), np.nan)
+    result[valid] = np.minimum(corrected, 1)
+    return result
+
+@pytest.mark.parametrize("method", ["bonferroni", "holm", "fdr_bh"])
+def test_correct_pvalues_match_reference(method):
+    rng = np.random.default_rng(4)
+    pvalues = rng.random((12, 3)) ** 3
+    pvalues[[2, 7], 1] = np.nan
+    corrected = quant_colocalization_jenna.correct_pvalues(pvalues, method)
+    for column in range(pvalues.shape[1]):
+        np.testing.assert_allclose(corrected[:, column], reference_correction(pvalues[:, column], method))
+
+
+def test_significance_stars():
+    assert [quant_colocalization_jenna.significance_stars(p) for p in [1e-5, 1e-4, 5e-4, 0.005, 0.05, 0.051, 1]] == ["****", "****", "***", "**", "*", "ns", "ns"]
+
+## The stars of the tests are drawn above the boxes of their pairs, with seaborn's dodging of the hue values
+def test_precomputed_stat_annotation_positions():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    quantification_df = random_quantification(6)
+    statistics_df = quant_colocalization_jenna.welch_tests(quantification_df, x="Cell line", hue="Condition", values=["v1"])
+    _, ax = plt.subplots()
+    quant_colocalization_jenna.add_precomputed_stat_annotation(ax, statistics_df, quantification_df, "Cell line", "v1", hue="Condition")
+    assert [text.get_text() for text in ax.texts] == [quant_colocalization_jenna.significance_stars(p) for p in statistics_df["p-value corrected"]]
+    # Cell line "A" is the first box, "normal" the first of its 2 hue values (order of the dataframe), "hypoxy" the second
+    assert [text.get_position()[0] for text in ax.texts] == pytest.approx([0, 1, 2])
+    assert list(statistics_df["Group 1"][:1]) == [("A", "hypoxy")]
+    assert ax.lines[0].get_xdata() == pytest.approx([0.2, 0.2, -0.2, -0.2])
+    assert ax.get_ylim()[1] > quantification_df["v1"].max()
+    plt.close("all")
+
+## Without precomputed tests the plot gets the uncorrected Welch's t-tests of its own box pairs, drawn without statannot
+def test_box_plot_comparison_without_precomputed_tests(tmp_path, monkeypatch):
+    import matplotlib
+    matplotlib.use("Agg")
+    quantification_df = random_quantification(7)
+    quantification_df["Cell line"] = quantification_df["Cell line"].map({"A": "305", "B": "306", "C": "JG"})
+    quantification_df["Condition"] = quantification_df["Condition"].map({"normal": "normal", "hypoxy": "Antimycin A"})
+    monkeypatch.setattr(quant_colocalization_jenna, "treatment_list", ["normal", "Antimycin A"])
+    pic_folder_path = str(tmp_path / "normal")
+    os.makedirs(pic_folder_path)
+    quant_colocalization_jenna.box_plt_by_cell_line_comparison(quantification_df, "Cell line", "v1", "otsu", hue="Condition", pic_folder_path=pic_folder_path, show=False)
+    assert os.path.isfile(os.path.join(str(tmp_path), "comparison_results", "otsu", "plot_v1_all_cell_lines_and_conditions.png"))
+
+
+## Organoids recorded to the results store of two conditions, and their "quantification.csv" files
+def record_conditions(wd, save_store):
+    for treatment in ["normal", "hypoxy"]:
+        output_folder_path = os.path.join(wd, treatment + "_thresholded_otsu")
+        os.makedirs(output_folder_path)
+        rows = []
+        for i in [2, 1, 3]:
+            quant_colocalization_jenna.record_organoid(rows, {"File name": f"A_{i}_C1.tif", "v1": float(i)}, output_folder_path, treatment, save_store=save_store)
+        quant_colocalization_jenna.quantification_dataframe(rows, output_folder_path)
+
+def test_results_store_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(quant_colocalization_jenna, "wd", str(tmp_path))
+    record_conditions(str(tmp_path), save_store=True)
+    assert sorted(os.listdir(tmp_path / "normal_thresholded_otsu" / "quantification.parquet")) == ["A_1_C1.parquet", "A_2_C1.parquet", "A_3_C1.parquet"]
+    quantification_df = quant_colocalization_jenna.load_saved_quantifications(["normal", "hypoxy"], "otsu", columns=["File name", "Condition", "v1"])
+    assert list(quantification_df["Condition"]) == ["normal"] * 3 + ["hypoxy"] * 3
+    assert list(quantification_df["v1"]) == [1.0, 2.0, 3.0] * 2
+
+## Without pyarrow there's one warning and the "quantification.csv" files are saved and read instead
+def test_results_store_without_pyarrow(tmp_path, monkeypatch):
+    import importlib.util
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name, *args: None if name == "pyarrow" else find_spec(name, *args))
+    monkeypatch.setattr(quant_colocalization_jenna, "has_pyarrow", None)
+    monkeypatch.setattr(quant_colocalization_jenna, "wd", str(tmp_path))
+    with pytest.warns(UserWarning, match="pyarrow") as record:
+        record_conditions(str(tmp_path), save_store=True)
+    assert len(record) == 1
+    assert not os.path.exists(tmp_path / "normal_thresholded_otsu" / "quantification.parquet")
+    quantification_df = quant_colocalization_jenna.load_saved_quantifications(["normal", "hypoxy"], "otsu", columns=["File name", "Condition", "v1"])
+    assert list(quantification_df["v1"]) == [2.0, 1.0, 3.0] * 2
+
+
+## Values of interest of the two-step way: thresholded images saved by "thresholding_jenna.py", then quantified
+def two_step_quantification(wd, mode="otsu", gaussian_filter=False):
+    pic_folder_path = os.path.join(wd, "normal")
+    thresholding_jenna.thresholding(pic_folder_path, "normal", mode, gaussian_filter)
+    return by_file_name(quant_colocalization_jenna.calculate_values_of_interest(pic_folder_path, "normal", mode, gaussian_filter))
+
+## Quantification dataframe in the order of the file names
+def by_file_name(quantification_df):
+    return quantification_df.sort_values("File name").reset_index(drop=True)
+
+@pytest.fixture
+def quantification_settings(monkeypatch):
+    monkeypatch.setattr(quant_colocalization_jenna, "save_mask_as_files", False)
+    monkeypatch.setattr(quant_colocalization_jenna, "save_results_store", False)
+
+## Thresholding in memory gives the values of interest and the thresholded images of the two-step way
+@pytest.mark.parametrize("mode, gaussian_filter", [("otsu", False), ("triangle", True)])
+def test_fused_quantification_matches_two_step(synthetic_wd, quantification_settings, mode, gaussian_filter):
+    expected_df = two_step_quantification(synthetic_wd, mode, gaussian_filter)
+    output_folder_path = os.path.join(synthetic_wd, f"normal_thresholded_{mode}")
+    thresholded_images = {name: open(os.path.join(output_folder_path, name), "rb").read() for name in os.listdir(output_folder_path) if name.endswith("_thresholded.tif")}
+    for name in thresholded_images:
+        os.remove(os.path.join(output_folder_path, name))
+    fused_df = quant_colocalization_jenna.calculate_values_of_interest_from_raw(os.path.join(synthetic_wd, "normal"), "normal", mode, gaussian_filter, save_thresholded=True)
+    pd.testing.assert_frame_equal(by_file_name(fused_df), expected_df)
+    for name, content in thresholded_images.items():
+        assert open(os.path.join(output_folder_path, name), "rb").read() == content
+
+
+## Every row of the overlap table of 5 channels, counted with the masks of the channels one combination after another
+def test_overlap_table_matches_masks():
+    rng = np.random.default_rng(9)
+    channels = [(rng.random((40, 30)) < density) * rng.integers(1, 256, (40, 30)) for density in [0.2, 0.5, 0.7, 0.4, 0.9]]
+    channels = [ch.astype(np.uint8) for ch in channels]
+    names = ["a", "b", "c", "d", "e"]
+    table = quant_colocalization_jenna.overlap_table(channels, names)
+    masks = [ch > 0 for ch in channels]
+    assert len(table) == sum(bin(code).count("1") for code in range(1, 32))
+    for _, row in table.iterrows():
+        members = [names.index(name) for name in row["Combination"].split(" & ")]
+        intersection = np.logical_and.reduce([masks[i] for i in members])
+        exclusive = intersection & ~np.logical_or.reduce([masks[i] for i in range(5) if i not in members] or [np.zeros_like(intersection)])
+        assert row["Number of channels"] == len(members)
+        assert row["Intersection (pixels)"] == np.count_nonzero(intersection)
+        assert row["Exclusive (pixels)"] == np.count_nonzero(exclusive)
+        assert row["Coverage in %"] == pytest.approx(np.count_nonzero(intersection) / np.count_nonzero(masks[names.index(row["Channel"])]) * 100)
+
+
+## The histogram-only mode gives the counts and mean intensities of the two-step way
+@pytest.mark.parametrize("mode", ["otsu", "triangle"])
+def test_histogram_quantification_matches_two_step(synthetic_wd, quantification_settings, mode):
+    expected_df = two_step_quantification(synthetic_wd, mode)
+    histogram_df = by_file_name(quant_colocalization_jenna.calculate_values_from_histograms(os.path.join(synthetic_wd, "normal"), "normal", mode))
+    columns = [column for column in histogram_df.columns if column in expected_df.columns]
+    assert any("amount normalized by" in column for column in columns) and any("mean intensity" in column for column in columns)
+    pd.testing.assert_frame_equal(histogram_df[columns], expected_df[columns])
+
+
+## Every threshold mode and blur setting of a sweep gets the values of interest of its own two-step run
+def test_threshold_sweep_matches_two_step(synthetic_wd, tmp_path, quantification_settings):
+    sweep_dfs = quant_colocalization_jenna.threshold_sweep(os.path.join(synthetic_wd, "normal"), "normal", ["otsu", "triangle"], [False, True], save_thresholded=False)
+    assert sorted(sweep_dfs) == ["otsu", "triangle"]
+    for mode, sweep_df in sweep_dfs.items():
+        for gaussian_filter in [False, True]:
+            # Each two-step run in a folder of its own, its quantification reads every thresholded image of the folder
+            wd = str(tmp_path / f"{mode}_{gaussian_filter}")
+            shutil.copytree(os.path.join(synthetic_wd, "normal"), os.path.join(wd, "normal"))
+            expected_df = two_step_quantification(wd, mode, gaussian_filter)
+            pd.testing.assert_frame_equal(by_file_name(sweep_df[sweep_df["Gaussian filter"] == gaussian_filter]), expected_df)
+
+
+## Tiled processing with bands of a few rows gives the values of interest, thresholded images and masks of the two-step way,
+#   also with the halo of the blur and the local "adaptive" threshold
+@pytest.mark.parametrize("mode, gaussian_filter", [("otsu", False), ("triangle", True), ("adaptive", True)])
+def test_tiled_quantification_matches_two_step(synthetic_wd, tmp_path, quantification_settings, mode, gaussian_filter):
+    expected_df = two_step_quantification(synthetic_wd, mode, gaussian_filter)
+    expected_folder = os.path.join(synthetic_wd, f"normal_thresholded_{mode}")
+    wd = str(tmp_path / "tiled")
+    shutil.copytree(os.path.join(synthetic_wd, "normal"), os.path.join(wd, "normal"))
+    # Bands of 6 rows of the 80 pixels wide images
+    tiled_df = quant_colocalization_jenna.calculate_values_of_interest_tiled(os.path.join(wd, "normal"), "normal", mode, gaussian_filter, save_mask=True, save_thresholded=True,
+                                                                             memory_budget_mb=80 * 10 * 12 / 2 ** 20)
+    pd.testing.assert_frame_equal(by_file_name(tiled_df), expected_df)
+    tiled_folder = os.path.join(wd, f"normal_thresholded_{mode}")
+    for name in os.listdir(expected_folder):
+        if name.endswith("_thresholded.tif"):
+            np.testing.assert_array_equal(cv2.imread(os.path.join(tiled_folder, name), -1), cv2.imread(os.path.join(expected_folder, name), -1))
+    for name in expected_df["File name"]:
+        channels = [cv2.imread(os.path.join(expected_folder, name.replace("C1", f"C{c}", 1)), -1) for c in range(1, 5)]
+        mask = quant_colocalization_jenna.load_mask(os.path.join(tiled_folder, quant_colocalization_jenna.mask_file_name(name)))
+        np.testing.assert_array_equal(mask, quant_colocalization_jenna.triple_colocalization_mask(channels[0], channels[1], channels[3]) > 0)
+
+
+## A bit-packed mask is loaded as the binary mask it was saved from, also for widths, that aren't a multiple of 8,
+#   and z-stacks (packed plane by plane), and is exported as standard TIFF image
+@pytest.mark.parametrize("shape", [(37, 45), (40, 64), (3, 21, 13)])
+def test_packed_mask_round_trip(tmp_path, shape):
+    rng = np.random.default_rng(len(shape))
+    mask = (rng.random(shape) < 0.3).astype(np.uint8) * 255
+    mask_file = quant_colocalization_jenna.mask_file_name(str(tmp_path / "C1-Control_1_otsu_thresholded.tif"), "packed")
+    assert mask_file.endswith("C1-Control_1_otsu_mask_ch1_ch2_ch4.npz")
+    if mask.ndim == 2:
+        quant_colocalization_jenna.save_mask_image(mask_file, mask)
+    else:
+        quant_colocalization_jenna.save_packed_mask(mask_file, np.stack([quant_colocalization_jenna.pack_mask(plane) for plane in mask]), shape)
+    loaded = quant_colocalization_jenna.load_mask(mask_file)
+    assert loaded.dtype == bool
+    np.testing.assert_array_equal(loaded, mask > 0)
+    # 1 bit per pixel
+    assert os.path.getsize(mask_file) < mask.size // 8 + 1000
+
+    tiff_file = quant_colocalization_jenna.export_mask_tiff(mask_file)
+    if mask.ndim == 2:
+        exported = cv2.imread(tiff_file, -1)
+    else:
+        exported = np.stack(cv2.imreadmulti(tiff_file, flags=cv2.IMREAD_UNCHANGED)[1])
+    np.testing.assert_array_equal(exported, mask)
+
+
+## The statistics of every region are the ones of the channels masked to the region
+def test_region_statistics_match_masked_channels():
+    rng = np.random.default_rng(11)
+    channels = [(rng.random((50, 40)) < 0.5) * rng.integers(1, 256, (50, 40)) for _ in range(4)]
+    ch1, ch2, ch3, ch4 = [ch.astype(np.uint8) for ch in channels]
+    mask = quant_colocalization_jenna.triple_colocalization_mask(ch1, ch2, ch4) > 0
+    # Region 3 is left out, it has no pixels
+    labels = rng.choice([0, 1, 2, 4], (50, 40)).astype(np.int32)
+    statistics = quant_colocalization_jenna.region_statistics(ch1, ch2, ch3, ch4, mask, labels)
+    assert len(statistics) == 4 and statistics[2]["region_pixels"] == 0
+    for region, stats in enumerate(statistics, start=1):
+        inside = labels == region
+        expected = quant_colocalization_jenna.channel_statistics(*[ch * inside for ch in (ch1, ch2, ch3, ch4)], mask & inside, coefficients=False)
+        for key, value in expected.items():
+            assert stats[key] == value, (region, key)
+        assert stats["region_pixels"] == np.count_nonzero(inside)
+
+## The shells cover the whole organoid, from the outermost (1) to the innermost one
+def test_shell_labels_of_a_disk():
+    mask = np.zeros((61, 61), dtype=np.uint8)
+    cv2.circle(mask, (30, 30), 25, 1, thickness=-1)
+    labels = quant_colocalization_jenna.shell_labels(mask, 4)
+    np.testing.assert_array_equal(labels > 0, mask > 0)
+    assert set(np.unique(labels)) == {0, 1, 2, 3, 4}
+    assert labels[30, 5] == 1 and labels[30, 30] == 4
+    # The deeper the shell, the smaller its ring
+    sizes = [np.count_nonzero(labels == shell) for shell in range(1, 5)]
+    assert sizes == sorted(sizes, reverse=True)
+
+## A ROI of the whole image gives the values of interest of the whole organoid in "regions.csv"
+def test_roi_of_the_whole_image(synthetic_wd, quantification_settings, monkeypatch):
+    monkeypatch.setattr(quant_colocalization_jenna, "region_mode", "roi")
+    folder = os.path.join(synthetic_wd, "normal")
+    for name in os.listdir(folder):
+        if name.startswith("C1-"):
+            cv2.imwrite(os.path.join(folder, "ROI-" + name[3:]), np.ones(cv2.imread(os.path.join(folder, name), -1).shape, dtype=np.uint8))
+    expected_df = two_step_quantification(synthetic_wd)
+    region_df = by_file_name(pd.read_csv(os.path.join(synthetic_wd, "normal_thresholded_otsu", "regions.csv")))
+    assert (region_df["Region"] == 1).all() and (region_df["Region (pixels)"] == 96 * 80).all()
+    columns = [column for column in quant_colocalization_jenna.value_columns(expected_df) if column in region_df.columns]
+    assert len(columns) > 10
+    np.testing.assert_allclose(region_df[columns].to_numpy(float), expected_df[columns].to_numpy(float))
+
+
+## The 4 channels of a small synthetic organoid
+def synthetic_channels(seed, bit_depth=8):
+    rng = np.random.default_rng(seed)
+    return synthetic_organoids_jenna.synthetic_organoid(rng, image_size=(96, 80), bit_depth=bit_depth, sparsity=0.3)
+
+
+@pytest.mark.parametrize("bit_depth", [8, 16])
+def test_intensity_sums_match_numpy(bit_depth):
+    channels = synthetic_channels(1, bit_depth)
+    sums = quant_colocalization_jenna.IntensitySums.from_channels(channels)
+    intensities = np.array([ch.ravel() for ch in channels], dtype=np.float64)
+    np.testing.assert_allclose(sums.pearson(), np.corrcoef(intensities), atol=1e-6)
+    present = intensities > 0
+    manders = np.array([[intensities[a][present[b]].sum() / intensities[a].sum() for b in range(4)] for a in range(4)])
+    np.testing.assert_allclose(sums.manders(), manders, rtol=1e-6)
+
+## The sums of two parts of an image (e.g. bands of tiled processing) merged with ``+`` are the ones of the whole image
+#   (up to the float32 sums of the bands)
+def test_intensity_sums_merge():
+    channels = synthetic_channels(2)
+    whole = quant_colocalization_jenna.IntensitySums.from_channels(channels)
+    merged = quant_colocalization_jenna.IntensitySums.from_channels([ch[:37] for ch in channels]) + quant_colocalization_jenna.IntensitySums.from_channels([ch[37:] for ch in channels])
+    assert merged.n == whole.n
+    np.testing.assert_allclose(merged.sum, whole.sum)
+    np.testing.assert_allclose(merged.pearson(), np.corrcoef(np.array([ch.ravel() for ch in channels], dtype=np.float64)), atol=1e-6)
+    np.testing.assert_allclose(merged.manders(), whole.manders(), rtol=1e-6)
+
+
+## The randomization test: Pearson's r of the raw channels, no shuffled image is as correlated as two strongly correlated channels,
+#   and the chunks of the batched permutations don't change the result
+def test_costes_randomization_test():
+    rng = np.random.default_rng(12)
+    base = cv2.GaussianBlur(rng.random((64, 48)), (9, 9), 0)
+    channels = [(base * 255).astype(np.uint8), (base * 200 + rng.random(base.shape) * 20).astype(np.uint8), (rng.random(base.shape) * 255).astype(np.uint8)]
+    names = ["a", "b", "c"]
+    values = quant_colocalization_jenna.costes_randomization_test(channels, names, np.random.default_rng(0), n_permutations=50)
+    for i, j in [(0, 1), (0, 2), (1, 2)]:
+        expected = np.corrcoef(channels[i].ravel().astype(float), channels[j].ravel().astype(float))[0, 1]
+        assert values[f"{names[i]} and {names[j]} Pearson's r (raw)"] == pytest.approx(expected, abs=1e-5)
+    assert values["a and b Costes' p-value"] == pytest.approx(1 / 51)
+    chunked = quant_colocalization_jenna.costes_randomization_test(channels, names, np.random.default_rng(0), n_permutations=50, chunk_pixels=64 * 3)
+    assert chunked == pytest.approx(values)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_union_find_roots_match_connected_components(seed):
+    rng = np.random.default_rng(seed)
+    n = 200
+    links_a, links_b = rng.integers(0, n, 150), rng.integers(0, n, 150)
+    roots = quant_colocalization_jenna.union_find_roots(n, links_a, links_b)
+    _, components = connected_components(coo_matrix((np.ones(len(links_a)), (links_a, links_b)), shape=(n, n)), directed=False)
+    # Same sets, every root is the smallest element of its set
+    assert len(np.unique(roots)) == len(np.unique(components))
+    for component in np.unique(components):
+        members = np.flatnonzero(components == component)
+        assert (roots[members] == members.min()).all()
+
+@pytest.mark.parametrize("connectivity", [6, 18, 26])
+def test_stack_objects_match_scipy_label(connectivity):
+    rng = np.random.default_rng(connectivity)
+    volumes = [(ndimage.uniform_filter(rng.random((6, 40, 36)), 3) > 0.55).astype(np.uint8) * 200 for _ in range(4)]
+    stack_objects = quant_colocalization_jenna.StackObjects(connectivity)
+    for z in range(volumes[0].shape[0]):
+        stack_objects.add_plane([volume[z] for volume in volumes])
+    names = ["a", "b", "c", "d"]
+    values = stack_objects.values(names, 0.0)
+    structure = ndimage.generate_binary_structure(3, {6: 1, 18: 2, 26: 3}[connectivity])
+    labels = [ndimage.label(volume > 0, structure=structure) for volume in volumes]
+    for name, (_, n_objects) in zip(names, labels):
+        assert values[name + " objects"] == n_objects
+    # Objects of a, that overlap objects of d, the same way in 3D
+    label_a, n_a = labels[0]
+    colocalized = np.unique(label_a[(label_a > 0) & (volumes[3] > 0)])
+    assert values["a objects colocalized with d (in %)"] == pytest.approx(len(colocalized) / n_a * 100)
+
+
+## Every plane of a z-stack quantified with ``z_mode = "planes"`` gets the values of interest of a single image
+def test_raw_stack_planes_match_single_images(tmp_path, quantification_settings):
+    planes = [synthetic_channels(20 + z) for z in range(3)]
+    for c in range(4):
+        cv2.imwritemulti(str(tmp_path / f"C{c + 1}-Control_1.tif"), [plane[c] for plane in planes])
+    rows, _ = quant_colocalization_jenna.quantify_raw_stack(str(tmp_path / "C1-Control_1.tif"), str(tmp_path), "otsu", False, z_mode="planes")
+    assert [row["Plane"] for row in rows] == [0, 1, 2]
+    for row, plane in zip(rows, planes):
+        expected, _ = quant_colocalization_jenna.quantify_thresholded_organoid(str(tmp_path / "C1-Control_1.tif"), *thresholding_jenna.apply_threshold(*plane, "otsu"),
+                                                                              str(tmp_path), "otsu", False)
+        del row["Plane"]
+        assert row == pytest.approx(expected, nan_ok=True)
+
+
+def test_bootstrap_summary_estimates():
+    quantification_df = random_quantification(5)
+    summary_df = quant_colocalization_jenna.bootstrap_summary(quantification_df, values=["v1", "v2"], n_resamples=2000, seed=1)
+    means = quantification_df.groupby(["Cell line", "Condition"])[["v1", "v2"]].mean()
+    counts = quantification_df.groupby(["Cell line", "Condition"])[["v1", "v2"]].count()
+    groups = summary_df[summary_df["Compared to"].isna()]
+    for _, row in groups.iterrows():
+        # Missing values are left out before the resampling
+        assert row["n"] == counts.loc[(row["Cell line"], row["Condition"]), row["Value"]]
+        assert row["Estimate"] == pytest.approx(means.loc[(row["Cell line"], row["Condition"]), row["Value"]])
+        assert row["CI lower"] <= row["Estimate"] <= row["CI upper"]
+    pairs = summary_df[summary_df["Compared to"].notna()]
+    assert len(pairs) == 3 * 2
+    for _, row in pairs.iterrows():
+        assert (row["Condition"], row["Compared to"]) == ("hypoxy", "normal")
+        expected = means.loc[(row["Cell line"], "hypoxy"), row["Value"]] - means.loc[(row["Cell line"], "normal"), row["Value"]]
+        assert row["Estimate"] == pytest.approx(expected)
+
+## The intervals of a group are the ones of a bootstrap resampling one mean after another, within the Monte Carlo error
+def test_bootstrap_summary_matches_naive_bootstrap():
+    quantification_df = random_quantification(6)
+    summary_df = quant_colocalization_jenna.bootstrap_summary(quantification_df, values=["v1"], n_resamples=20000, seed=2)
+    row = summary_df[(summary_df["Cell line"] == "B") & (summary_df["Condition"] == "normal") & summary_df["Compared to"].isna()].iloc[0]
+    values = quantification_df[(quantification_df["Cell line"] == "B") & (quantification_df["Condition"] == "normal")]["v1"].to_numpy()
+    rng = np.random.default_rng(3)
+    resampled_means = [rng.choice(values, len(values)).mean() for _ in range(20000)]
+    lower, upper = np.quantile(resampled_means, [0.025, 0.975])
+    tolerance = 0.05 * values.std()
+    assert row["CI lower"] == pytest.approx(lower, abs=tolerance)
+    assert row["CI upper"] == pytest.approx(upper, abs=tolerance)
+
+## The modes of a threshold sweep are separate groups
+def test_bootstrap_summary_by_threshold_mode():
+    quantification_df = random_quantification(7)
+    sweep_df = pd.concat([quantification_df.assign(**{"Threshold type": mode}) for mode in ["otsu", "triangle"]], ignore_index=True)
+    summary_df = quant_colocalization_jenna.bootstrap_summary(sweep_df, values=["v1"], n_resamples=500)
+    single_df = quant_colocalization_jenna.bootstrap_summary(quantification_df, values=["v1"], n_resamples=500)
+    assert set(summary_df["Threshold type"]) == {"otsu", "triangle"}
+    for mode in ["otsu", "triangle"]:
+        mode_df = summary_df[summary_df["Threshold type"] == mode].reset_index(drop=True)
+        np.testing.assert_array_equal(mode_df["n"], single_df["n"])
+        np.testing.assert_allclose(mode_df["Estimate"], single_df["Estimate"])
@@ -0,0 +1,30 @@
+"""
+Tests of the synthetic organoids, that the other tests and the benchmark are run on.
+"""
+import os
+import cv2
+import numpy as np
+import pytest
+import synthetic_organoids_jenna
+
+@pytest.mark.parametrize("bit_depth", [8, 16])
+def test_write_synthetic_condition(tmp_path, bit_depth):
+    files = synthetic_organoids_jenna.write_synthetic_condition(str(tmp_path), ["Control", "Apoe"], 2, image_size=(64, 48), bit_depth=bit_depth)
+    assert [os.path.basename(file) for file in files] == ["C1-Control_1.tif", "C1-Control_2.tif", "C1-Apoe_1.tif", "C1-Apoe_2.tif"]
+    for file in files:
+        for suffix in "1234":
+            ch = cv2.imread(file.replace("C1-", f"C{suffix}-"), -1)
+            assert ch.shape == (64, 48)
+            assert ch.dtype == (np.uint8 if bit_depth == 8 else np.uint16)
+            # Signal and background
+            assert ch.max() > 2 ** bit_depth // 4 > np.median(ch)
+
+## Same seed, same images, no matter how many organoids are written
+def test_synthetic_condition_is_reproducible(tmp_path):
+    synthetic_organoids_jenna.write_synthetic_condition(str(tmp_path / "a"), ["Control"], 3, image_size=(64, 48), seed=5)
+    synthetic_organoids_jenna.write_synthetic_condition(str(tmp_path / "b"), ["Control"], 1, image_size=(64, 48), seed=5)
+    np.testing.assert_array_equal(cv2.imread(str(tmp_path / "a" / "C2-Control_1.tif"), -1), cv2.imread(str(tmp_path / "b" / "C2-Control_1.tif"), -1))
+
+def test_synthetic_condition_rejects_other_bit_depths(tmp_path):
+    with pytest.raises(ValueError):
+        synthetic_organoids_jenna.write_synthetic_condition(str(tmp_path), bit_depth=12)
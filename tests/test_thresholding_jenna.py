@@ -0,0 +1,181 @@
+"""
+Tests of the thresholding: resumable runs, z-stacks and the thresholds computed from histograms,
+    on small synthetic organoids (see "synthetic_organoids_jenna.py").
+"""
+import os
+import cv2
+import numpy as np
+import pytest
+import thresholding_jenna
+import synthetic_organoids_jenna
+
+## The 4 channels of small synthetic organoids
+def synthetic_channels(seed, bit_depth=8):
+    rng = np.random.default_rng(seed)
+    return synthetic_organoids_jenna.synthetic_organoid(rng, image_size=(96, 80), bit_depth=bit_depth, sparsity=0.3)
+
+## Write a z-stack organoid (4 multi-page TIFF files), every plane a synthetic organoid of its own, the deeper planes darker
+# output: "file name" string of its "C1"-stack
+def write_stack_organoid(folder, name="Control_1", n_planes=3, seed=0):
+    os.makedirs(folder, exist_ok=True)
+    planes = [synthetic_channels(seed + z) for z in range(n_planes)]
+    for c in range(4):
+        cv2.imwritemulti(os.path.join(folder, f"C{c + 1}-{name}.tif"), [(plane[c] * (1 - 0.3 * z)).astype(np.uint8) for z, plane in enumerate(planes)])
+    return os.path.join(folder, f"C1-{name}.tif")
+
+def read_stack(file):
+    _, planes = cv2.imreadmulti(file, flags=cv2.IMREAD_UNCHANGED)
+    return np.stack(planes)
+
+## A changed ``z_stack_mode`` thresholds the stacks again, the unchanged one skips them
+def test_thresholding_resumes_by_z_stack_mode(tmp_path, capsys):
+    folder = str(tmp_path / "normal")
+    file = write_stack_organoid(folder)
+    output_folder = str(tmp_path / "normal_thresholded_otsu")
+    output_file = os.path.join(output_folder, thresholding_jenna.thresholded_file_name(file, "otsu", False))
+
+    assert thresholding_jenna.thresholding(folder, "normal", "otsu", False, z_mode="volume") == []
+    assert thresholding_jenna.load_manifest(output_folder)[os.path.basename(output_file)]["z_stack_mode"] == "volume"
+    volume = read_stack(output_file)
+    capsys.readouterr()
+    thresholding_jenna.thresholding(folder, "normal", "otsu", False, z_mode="volume")
+    assert "Skipping 1 organoids" in capsys.readouterr().out
+
+    thresholding_jenna.thresholding(folder, "normal", "otsu", False, z_mode="planes")
+    assert "Skipping" not in capsys.readouterr().out
+    assert thresholding_jenna.load_manifest(output_folder)[os.path.basename(output_file)]["z_stack_mode"] == "planes"
+    planes = read_stack(output_file)
+    assert not np.array_equal(planes, volume)
+    # Every plane is thresholded like a single image
+    expected = [thresholding_jenna.apply_threshold(*[cv2.imreadmulti(file.replace("C1-", f"C{c}-"), flags=cv2.IMREAD_UNCHANGED)[1][z] for c in range(1, 5)], "otsu")[0]
+                for z in range(3)]
+    np.testing.assert_array_equal(planes, np.stack(expected))
+
+## The settings of the caller reach worker processes, that are spawned and import the script again (the default on Windows and macOS)
+def test_thresholding_workers_get_the_settings(synthetic_wd, monkeypatch):
+    import functools
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    folder = os.path.join(synthetic_wd, "normal")
+    for file in os.listdir(folder):
+        if file.startswith("C2-"):
+            os.rename(os.path.join(folder, file), os.path.join(folder, "C5-" + file[3:]))
+    monkeypatch.setattr(thresholding_jenna, "ch2_suffix", "5")
+    monkeypatch.setattr(thresholding_jenna, "ProcessPoolExecutor", functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")))
+    assert thresholding_jenna.thresholding(folder, "normal", "otsu", False, n_workers=2) == []
+    assert os.path.isfile(os.path.join(synthetic_wd, "normal_thresholded_otsu", "C5-Control_1_gauss_filter_False_otsu_thresholded.tif"))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_otsu_threshold_from_histogram_matches_opencv(seed):
+    for ch in synthetic_channels(seed):
+        expected, _ = cv2.threshold(ch, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        assert thresholding_jenna.otsu_threshold_from_histogram(thresholding_jenna.channel_histogram(ch)) == expected
+
+@pytest.mark.parametrize("seed", range(5))
+def test_triangle_threshold_from_histogram_matches_opencv(seed):
+    for ch in synthetic_channels(seed):
+        expected, _ = cv2.threshold(ch, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_TRIANGLE)
+        assert thresholding_jenna.triangle_threshold_from_histogram(thresholding_jenna.channel_histogram(ch)) == expected
+
+## The histograms are read from the cache, until a raw image changes
+def test_cached_channel_histograms(synthetic_wd, monkeypatch):
+    file = os.path.join(synthetic_wd, "normal", "C1-Control_1.tif")
+    channels = thresholding_jenna.read_4_color_channels(file)
+    for hist, ch in zip(thresholding_jenna.cached_channel_histograms(file), channels):
+        np.testing.assert_array_equal(hist, thresholding_jenna.channel_histogram(ch))
+    blurred = thresholding_jenna.cached_channel_histograms(file, gaussian_blur = True)
+    np.testing.assert_array_equal(blurred[0], thresholding_jenna.channel_histogram(thresholding_jenna.gaussian_blur_channels(*channels)[0]))
+
+    read_4_color_channels = thresholding_jenna.read_4_color_channels
+    reads = []
+    monkeypatch.setattr(thresholding_jenna, "read_4_color_channels", lambda file: reads.append(file) or read_4_color_channels(file))
+    thresholding_jenna.cached_channel_histograms(file)
+    assert reads == []
+
+    changed = np.zeros_like(channels[1])
+    cv2.imwrite(file.replace("C1-", "C2-"), changed)
+    os.utime(file.replace("C1-", "C2-"), (1, 1))
+    histograms = thresholding_jenna.cached_channel_histograms(file)
+    assert reads == [file]
+    assert histograms[1][0] == changed.size
+
+## Only new or changed organoids are thresholded again, and the ones whose images are missing or that failed.
+@pytest.mark.parametrize("hash_inputs", [False, True])
+def test_thresholding_resumes_by_manifest(synthetic_wd, capsys, hash_inputs):
+    folder = os.path.join(synthetic_wd, "normal")
+    output_folder = os.path.join(synthetic_wd, "normal_thresholded_otsu")
+    assert thresholding_jenna.thresholding(folder, "normal", "otsu", False, hash_inputs = hash_inputs) == []
+    manifest = thresholding_jenna.load_manifest(output_folder)
+    assert len(manifest) == 6
+    entry = manifest["C1-Control_1_gauss_filter_False_otsu_thresholded.tif"]
+    assert entry["mode"] == "otsu" and entry["gaussian_blur"] is False and len(entry["outputs"]) == 4
+    capsys.readouterr()
+
+    thresholding_jenna.thresholding(folder, "normal", "otsu", False, hash_inputs = hash_inputs)
+    assert "Skipping 6 organoids" in capsys.readouterr().out
+
+    # A changed raw image and a deleted thresholded image
+    cv2.imwrite(os.path.join(folder, "C4-Control_1.tif"), 255 - cv2.imread(os.path.join(folder, "C4-Control_1.tif"), -1))
+    os.remove(os.path.join(output_folder, manifest["C1-Control_2_gauss_filter_False_otsu_thresholded.tif"]["outputs"][2]))
+    # A missing channel fails
+    os.remove(os.path.join(folder, "C3-Control_3.tif"))
+    failed_files = thresholding_jenna.thresholding(folder, "normal", "otsu", False, hash_inputs = hash_inputs)
+    assert [os.path.basename(file) for file, _ in failed_files] == ["C1-Control_3.tif"]
+    assert "Skipping 3 organoids" in capsys.readouterr().out
+    manifest = thresholding_jenna.load_manifest(output_folder)
+    assert all(os.path.isfile(os.path.join(output_folder, name)) for name in manifest["C1-Control_2_gauss_filter_False_otsu_thresholded.tif"]["outputs"])
+
+    # The failed organoid is tried again
+    failed_files = thresholding_jenna.thresholding(folder, "normal", "otsu", False, hash_inputs = hash_inputs)
+    assert [os.path.basename(file) for file, _ in failed_files] == ["C1-Control_3.tif"]
+    assert "Skipping 5 organoids" in capsys.readouterr().out
+
+    # Another blur setting is another organoid of the manifest
+    thresholding_jenna.thresholding(folder, "normal", "otsu", True, hash_inputs = hash_inputs)
+    assert "Skipping" not in capsys.readouterr().out
+
+## The 16-bit path of ``automatic_threshold()`` gives the same image as OpenCV on the same intensities in 8 bit
+@pytest.mark.parametrize("method", ["otsu", "triangle"])
+def test_automatic_threshold_16_bit_matches_8_bit(method):
+    for ch in synthetic_channels(7):
+        expected = thresholding_jenna.automatic_threshold(ch, method)
+        np.testing.assert_array_equal(thresholding_jenna.automatic_threshold(ch.astype(np.uint16), method), expected)
+
+## The adaptive threshold of 16-bit images keeps the same pixels as OpenCV's on the same intensities in 8 bit
+def test_adaptive_threshold_16_bit_matches_8_bit():
+    for ch in synthetic_channels(8):
+        th = thresholding_jenna.adaptive_threshold(ch.astype(np.uint16))
+        assert th.dtype == np.uint16
+        np.testing.assert_array_equal(th > 0, thresholding_jenna.adaptive_threshold(ch) > 0)
+
+## Costes' thresholds by trying every threshold of a one after another, computing r of the pixels below both thresholds each time
+def brute_force_costes_thresholds(ch_a, ch_b):
+    a, b = ch_a.ravel().astype(float), ch_b.ravel().astype(float)
+    variance_a, variance_b = a.var(), b.var()
+    covariance = np.mean((a - a.mean()) * (b - b.mean()))
+    slope = (variance_b - variance_a + np.sqrt((variance_b - variance_a) ** 2 + 4 * covariance ** 2)) / (2 * covariance)
+    intercept = b.mean() - slope * a.mean()
+    levels = np.iinfo(ch_a.dtype).max + 1
+    for threshold_a in range(levels, 0, -1):
+        threshold_b = np.ceil(slope * threshold_a + intercept)
+        below = (a < threshold_a) & (b < threshold_b)
+        if below.sum() < 2:
+            continue
+        with np.errstate(all="ignore"):
+            r = np.corrcoef(a[below], b[below])[0, 1]
+        if r <= 0:
+            return max(threshold_a - 1, 0), max(int(min(max(threshold_b, 0), levels)) - 1, 0)
+    return 0, max(int(np.clip(np.ceil(slope + intercept), 0, levels)) - 1, 0)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_costes_thresholds_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    base = rng.gamma(1.5, 20, (120, 100))
+    ch_a = np.clip(base + rng.normal(0, 15, base.shape), 0, 255).astype(np.uint8)
+    ch_b = np.clip(0.8 * base + rng.normal(0, 25, base.shape) + 10, 0, 255).astype(np.uint8)
+    assert thresholding_jenna.costes_thresholds(ch_a, ch_b) == brute_force_costes_thresholds(ch_a, ch_b)
+
+def test_costes_thresholds_of_uncorrelated_channels():
+    ch = synthetic_channels(3)[0]
+    assert thresholding_jenna.costes_thresholds(ch, 255 - ch) is None
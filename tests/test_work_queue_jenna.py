@@ -0,0 +1,80 @@
+"""
+Tests of the work queue: claiming units, taking over expired leases and renewing them while a unit is processed.
+"""
+import os
+import time
+import numpy as np
+import pytest
+import quant_colocalization_jenna
+import work_queue_jenna
+from engine_jenna import ColocalizationEngine
+
+@pytest.fixture
+def engine(synthetic_wd):
+    return ColocalizationEngine(synthetic_wd, threshold_mode="otsu", save_results_store=False, save_summary=False)
+
+@pytest.fixture
+def queue_folder(engine):
+    queue_folder = work_queue_jenna.queue_folder_path(engine)
+    # 3 units of 2 organoids
+    assert work_queue_jenna.create_work_units(engine, ["normal"], queue_folder, organoids_per_unit=2) == 3
+    return queue_folder
+
+## Set the start of a lease back by ``seconds``
+def age_lease(claimed_file, seconds):
+    start = time.time() - seconds
+    os.utime(claimed_file, (start, start))
+
+
+## Every unit is claimed by one worker only, a running lease isn't taken over, an expired one is
+def test_claim_unit_and_take_over_expired_lease(queue_folder):
+    claims = [work_queue_jenna.claim_unit(queue_folder, worker_id) for worker_id in ["a", "b", "a"]]
+    assert [os.path.basename(claimed_file) for claimed_file in claims] == ["000000.a.json", "000001.b.json", "000002.a.json"]
+    assert work_queue_jenna.claim_unit(queue_folder, "c", lease_timeout_s=60) is None
+
+    age_lease(claims[1], 120)
+    claimed_file = work_queue_jenna.claim_unit(queue_folder, "c", lease_timeout_s=60)
+    assert os.path.basename(claimed_file) == "000001.c.json"
+    assert time.time() - os.path.getmtime(claimed_file) < 60
+    # The previous worker notices, that it lost the lease
+    with pytest.raises(FileNotFoundError):
+        work_queue_jenna.renew_lease(claims[1])
+
+## The lease is renewed in the background, while a single organoid takes longer than the lease timeout
+def test_lease_renewed_during_long_organoid(engine, queue_folder, monkeypatch):
+    quantify_files = engine.quantify_files
+    takeovers = []
+
+    def slow_quantify_files(condition, files, *args, **kwargs):
+        time.sleep(1.0)
+        takeovers.append(work_queue_jenna.claim_unit(queue_folder, "other", lease_timeout_s=0.5))
+        return quantify_files(condition, files, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "quantify_files", slow_quantify_files)
+    claimed_file = work_queue_jenna.claim_unit(queue_folder, "a")
+    # Only the claimed unit can be taken over
+    for _ in range(2):
+        os.rename(work_queue_jenna.claim_unit(queue_folder, "b"), os.path.join(queue_folder, "done", "unused.json"))
+    assert work_queue_jenna.process_unit(engine, queue_folder, claimed_file, lease_timeout_s=0.5)
+    assert takeovers == [None]
+    assert os.path.isfile(os.path.join(queue_folder, "done", "000000.json"))
+
+## A lost lease stops the renewal, the next organoid raises
+def test_lost_lease(queue_folder):
+    claimed_file = work_queue_jenna.claim_unit(queue_folder, "a")
+    with work_queue_jenna.LeaseRenewal(claimed_file, 0.05) as lease:
+        os.remove(claimed_file)
+        time.sleep(0.2)
+        assert lease.lost
+        with pytest.raises(FileNotFoundError):
+            lease.renew()
+
+## Working on the whole queue and merging gives the quantification of the engine
+def test_work_and_merge(engine, queue_folder):
+    assert work_queue_jenna.work(engine, queue_folder, "a") == 3
+    complete_df = work_queue_jenna.merge_results(engine, queue_folder).sort_values("File name").reset_index(drop=True)
+    expected_df = ColocalizationEngine(engine.wd, threshold_mode="otsu", save_results_store=False).quantify_condition("normal", from_raw=True)
+    expected_df = expected_df.sort_values("File name").reset_index(drop=True)
+    assert list(complete_df["File name"]) == list(expected_df["File name"])
+    values = quant_colocalization_jenna.value_columns(expected_df)
+    np.testing.assert_allclose(complete_df[values].to_numpy(float), expected_df[values].to_numpy(float))